@@ -5,8 +5,13 @@ import os
 import requests
 from dotenv import load_dotenv
 import tempfile
+import io
+import shutil
 import subprocess
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from pathlib import Path
 from werkzeug.utils import secure_filename
 
@@ -16,9 +21,18 @@ from werkzeug.utils import secure_filename
 
 # Add the parent directory to the path so we can import superagent_test
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# and pdf/ for the merge step, which runs in-process
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pdf'))
 
+import tracing
+import fetchdb
 from superagent_test import router_agent, analyze_medicine_image
+from pdf_jobs import jobs as pdf_jobs
+from tracking_agent.todoist_client import get_todoist_client, TASK_FIELDS, SYNC_BATCH_SIZE
 from google_calendar_service import GoogleCalendarService
+from pdf_result_cache import PdfResultCache
+from rate_limiter import rate_limited, get_rate_limiter
+import metrics
 from ultravox_integration import register_ultravox_routes
 
 
@@ -26,23 +40,58 @@ load_dotenv()  # Load environment variables from .env if present
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+tracing.instrument_flask(app)  # Root span per request when TRACE_EXPORT is set
+metrics.init_app(app)  # Prometheus metrics at /metrics
 
 # Initialize Google Calendar service
 gcal_service = GoogleCalendarService()
 
 # PDF processing configuration
-UPLOAD_FOLDER = 'pdf_uploads'
-PROCESSED_FOLDER = 'pdf_processed'
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_FOLDER = os.getenv('PDF_UPLOAD_FOLDER', os.path.join(BACKEND_DIR, 'pdf_uploads'))
+PROCESSED_FOLDER = os.getenv('PDF_PROCESSED_FOLDER', os.path.join(BACKEND_DIR, 'pdf_processed'))
 ALLOWED_EXTENSIONS = {'pdf'}
 
 # Medicine images configuration
-MED_IMAGES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'med_images_test')
+MED_IMAGES_FOLDER = os.getenv('MED_IMAGES_FOLDER', os.path.join(BACKEND_DIR, '..', 'med_images_test'))
 os.makedirs(MED_IMAGES_FOLDER, exist_ok=True)
 
 # Create upload directories if they don't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(PROCESSED_FOLDER, exist_ok=True)
 
+# Dashboard aggregation: upstream fetches run concurrently with per-source timeouts (seconds)
+dashboard_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='dashboard')
+DASHBOARD_TIMEOUTS = {
+    'calendar': float(os.getenv('DASHBOARD_CALENDAR_TIMEOUT', 4)),
+    'tasks': float(os.getenv('DASHBOARD_TASKS_TIMEOUT', 4)),
+    'pdfs': float(os.getenv('DASHBOARD_PDFS_TIMEOUT', 2)),
+    'medicine_uploads': float(os.getenv('DASHBOARD_MEDICINE_TIMEOUT', 2)),
+}
+
+# Size optimization of filled PDFs (pdf/pdf_optimizer.py); requests override with "optimize"
+PDF_OPTIMIZE_DEFAULT = os.getenv('PDF_OPTIMIZE_OUTPUT', '1').lower() not in ('0', 'false', 'no', 'off')
+PDF_OPTIMIZE_FLAGS = {
+    'dedupe': '--no-dedupe',
+    'object_streams': '--no-object-streams',
+    'recompress': '--no-recompress',
+    'strip_orphans': '--keep-orphans',
+}
+
+# Filled-PDF cache keyed by (input PDF hash, data file hash, pipeline version,
+# mapping store generation, output options)
+pdf_cache = PdfResultCache(
+    os.path.join(PROCESSED_FOLDER, '.cache'),
+    max_bytes=int(os.getenv('PDF_CACHE_MAX_MB', 200)) * 1024 * 1024,
+    mapping_store_dir=os.getenv('PDF_MAPPING_STORE', os.path.join(BACKEND_DIR, '..', 'pdf', 'mappings')),
+)
+
+def replace_file(src, dest):
+    """Copy src over dest atomically: readers of dest see the old or the new file, never a partial one."""
+    tmp_path = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dest)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -50,6 +99,20 @@ def allowed_file(filename):
 # Helpers
 # -----------------------------------------------------------------------------
 
+def optimize_options(value):
+    """
+    Optimizer options from a request's "optimize": true/false, or an object
+    turning single steps off ({"object_streams": false}). None means skip.
+    """
+    if value is None:
+        value = PDF_OPTIMIZE_DEFAULT
+    if isinstance(value, dict):
+        unknown = set(value) - set(PDF_OPTIMIZE_FLAGS)
+        if unknown:
+            raise ValueError(f"Unknown optimize options: {', '.join(sorted(unknown))}")
+        return {step: bool(value.get(step, True)) for step in PDF_OPTIMIZE_FLAGS}
+    return {step: True for step in PDF_OPTIMIZE_FLAGS} if value else None
+
 def _stringify_list(lst):
     try:
         return " ".join(str(x) for x in lst)
@@ -152,28 +215,137 @@ def extract_text(result):
 # Todoist Integration (Real API)
 # -----------------------------------------------------------------------------
 
-TODOIST_API_TOKEN = os.getenv("TODOIST_API_TOKEN")
-TODOIST_BASE_URL = "https://api.todoist.com/rest/v2"
-
-def todoist_headers():
-    return {
-        "Authorization": f"Bearer {TODOIST_API_TOKEN}",
-        "Content-Type": "application/json",
-    }
+# Shared pooled session (keep-alive + retry/backoff), also used by the agents' tools
+todoist = get_todoist_client()
 
 def require_todoist_token():
-    if not TODOIST_API_TOKEN:
+    if not todoist.configured:
         return jsonify({
             "success": False,
             "error": "Todoist not configured. Set TODOIST_API_TOKEN in your environment or .env."
         }), 501
     return None
 
+# -----------------------------------------------------------------------------
+# Data sources (shared by the individual routes and /api/dashboard)
+# -----------------------------------------------------------------------------
+
+MOCK_CALENDAR_EVENTS = [
+    {
+        'id': 'mock_1',
+        'summary': 'Doctor Appointment',
+        'start': '2024-01-15T10:00:00Z',
+        'end': '2024-01-15T11:00:00Z',
+        'location': 'Changi General Hospital',
+        'description': 'Regular checkup'
+    },
+    {
+        'id': 'mock_2',
+        'summary': 'Medicine Pickup',
+        'start': '2024-01-16T14:00:00Z',
+        'end': '2024-01-16T14:30:00Z',
+        'location': 'Guardian Pharmacy',
+        'description': 'Prescription refill'
+    }
+]
+
+# The Google API client (httplib2) is not thread-safe; serialize calendar calls.
+# Waiting callers give up after GCAL_LOCK_TIMEOUT instead of queueing behind a hung call.
+gcal_lock = threading.Lock()
+GCAL_LOCK_TIMEOUT = float(os.getenv('GCAL_LOCK_TIMEOUT', 10))
+
+def fetch_calendar_events(max_results):
+    """Return (events, source), falling back to mock data if Google Calendar is unavailable."""
+    with tracing.span("gcal.get_upcoming_events", max_results=max_results), \
+            metrics.time_upstream('google_calendar'):
+        if not gcal_lock.acquire(timeout=GCAL_LOCK_TIMEOUT):
+            raise TimeoutError('A previous Google Calendar call is still running')
+        try:
+            events = gcal_service.get_upcoming_events(max_results)
+        finally:
+            gcal_lock.release()
+    if events:
+        return events, 'google_calendar'
+    print("⚠️ Google Calendar not available, using mock data")
+    return MOCK_CALENDAR_EVENTS[:max_results], 'mock_data'
+
+# Dashboard fetches from slow upstreams (Google Calendar, Todoist) still running from an
+# earlier request, by source. They are reused instead of resubmitted, so a slow upstream
+# holds at most one executor thread and can't starve the other dashboard sources.
+_dashboard_in_flight = {}   # source -> (future, size requested)
+_dashboard_in_flight_lock = threading.Lock()
+
+def submit_dashboard_shared(source, fn, size=0):
+    """Future of fn() for the dashboard, shared with a fetch of source already in flight
+    unless that one is done or was asked for fewer than size items."""
+    with _dashboard_in_flight_lock:
+        future, in_flight_size = _dashboard_in_flight.get(source, (None, 0))
+        if future is None or future.done() or in_flight_size < size:
+            future = dashboard_executor.submit(fn)
+            _dashboard_in_flight[source] = (future, size)
+        return future
+
+def fetch_todoist_tasks():
+    """Open Todoist tasks, or an empty list when Todoist is not configured."""
+    if not todoist.configured:
+        return {'tasks': [], 'source': 'not_configured'}
+    return {'tasks': todoist.get_tasks(), 'source': 'todoist'}
+
+def build_pdf_manifest():
+    """List uploaded and processed PDFs with size and modification time."""
+    uploaded_files = []
+    processed_files = []
+
+    # List uploaded files
+    if os.path.exists(UPLOAD_FOLDER):
+        for filename in os.listdir(UPLOAD_FOLDER):
+            if filename.lower().endswith('.pdf'):
+                filepath = os.path.join(UPLOAD_FOLDER, filename)
+                stat = os.stat(filepath)
+                uploaded_files.append({
+                    'filename': filename,
+                    'size': stat.st_size,
+                    'uploaded_at': stat.st_mtime,
+                    'type': 'uploaded'
+                })
+
+    # List processed files
+    if os.path.exists(PROCESSED_FOLDER):
+        for filename in os.listdir(PROCESSED_FOLDER):
+            if filename.lower().endswith('.pdf'):
+                filepath = os.path.join(PROCESSED_FOLDER, filename)
+                stat = os.stat(filepath)
+                processed_files.append({
+                    'filename': filename,
+                    'size': stat.st_size,
+                    'processed_at': stat.st_mtime,
+                    'type': 'processed'
+                })
+
+    return {'uploaded_files': uploaded_files, 'processed_files': processed_files}
+
+def recent_medicine_uploads(limit):
+    """Most recently uploaded medicine images, newest first."""
+    uploads = []
+    for filename in os.listdir(MED_IMAGES_FOLDER):
+        if filename == 'index.json' or filename.startswith('.'):
+            continue
+        filepath = os.path.join(MED_IMAGES_FOLDER, filename)
+        if os.path.isfile(filepath):
+            uploads.append({
+                'filename': filename,
+                'uploaded_at': os.path.getmtime(filepath),
+                'preview_url': f"/api/medicine/image/{filename}"
+            })
+    uploads.sort(key=lambda u: u['uploaded_at'], reverse=True)
+    return uploads[:limit]
+
 # -----------------------------------------------------------------------------
 # Routes
 # -----------------------------------------------------------------------------
 
 @app.route('/api/ahma/chat', methods=['POST'])
+@rate_limited('chat')
 def chat():
     """
     Main chat endpoint that processes user messages through the superagent.
@@ -186,7 +358,8 @@ def chat():
         if not message:
             return jsonify({'error': 'No message provided', 'success': False}), 400
 
-        result = router_agent(message)
+        with tracing.span("router_agent"):
+            result = router_agent(message)
 
         # Debug (optional): uncomment if you want server logs
         # print(f"🔍 Raw superagent result: {repr(result)}")
@@ -202,6 +375,7 @@ def chat():
 
 
 @app.route('/api/medicine/upload-image', methods=['POST'])
+@rate_limited('medicine_image')
 def upload_medicine_image():
     """
     Upload a medicine-related image to med_images_test/ with duplicate detection.
@@ -220,6 +394,7 @@ def upload_medicine_image():
         import io
         file_bytes = file.read()
         file_hash = hashlib.sha256(file_bytes).hexdigest()
+        metrics.upload_size.observe(len(file_bytes), kind='medicine_image')
 
         # Load or create index.json for duplicate tracking
         index_path = os.path.join(MED_IMAGES_FOLDER, 'index.json')
@@ -245,6 +420,8 @@ def upload_medicine_image():
                 # All referenced files no longer exist; treat as new upload and reset list
                 index[file_hash]['filenames'] = []
 
+        metrics.dedupe.inc(kind='medicine_image', result='hit' if is_duplicate else 'miss')
+
         # Use secure filename and ensure unique name
         original_name = secure_filename(file.filename)
         name_no_ext, ext = os.path.splitext(original_name)
@@ -276,7 +453,8 @@ def upload_medicine_image():
             try:
                 abs_path_for_agent = os.path.abspath(save_path)
                 # Directly invoke the analysis tool to avoid routing/text parsing issues
-                agent_response = extract_text(analyze_medicine_image(abs_path_for_agent))
+                with tracing.span("analyze_medicine_image"):
+                    agent_response = extract_text(analyze_medicine_image(abs_path_for_agent))
             except Exception as e:
                 print(f"Error triggering MedicineAgent: {e}")
 
@@ -309,6 +487,66 @@ def get_medicine_image(filename):
         return jsonify({'success': False, 'error': 'Failed to fetch image'}), 500
 
 
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    """
+    Everything the dashboard needs on load, in one request.
+    Calendar, Todoist, PDF manifest and recent medicine uploads are fetched concurrently;
+    a source that fails or exceeds its timeout is reported in 'sources' and left empty,
+    so the response time is bounded by the slowest source (or its timeout).
+    """
+    max_results = int(request.args.get('max_results', 5))
+    limit = int(request.args.get('limit', 10))
+
+    fetchers = {
+        'pdfs': build_pdf_manifest,
+        'medicine_uploads': lambda: {'uploads': recent_medicine_uploads(limit)},
+    }
+    empty = {
+        'calendar': {'events': []},
+        'tasks': {'tasks': []},
+        'pdfs': {'uploaded_files': [], 'processed_files': []},
+        'medicine_uploads': {'uploads': []},
+    }
+
+    started = time.monotonic()
+    futures = {
+        'calendar': submit_dashboard_shared('calendar', lambda: fetch_calendar_events(max_results), max_results),
+        'tasks': submit_dashboard_shared('tasks', fetch_todoist_tasks),
+    }
+    futures.update({name: dashboard_executor.submit(fn) for name, fn in fetchers.items()})
+
+    payload = {}
+    sources = {}
+    for name, future in futures.items():
+        remaining = started + DASHBOARD_TIMEOUTS[name] - time.monotonic()
+        try:
+            result = future.result(timeout=max(0.0, remaining))
+            # Shared fetches may have been started by a request with other limits
+            if name == 'calendar':
+                events, source = result
+                result = {'events': events[:max_results], 'source': source}
+            elif name == 'tasks':
+                result = {**result, 'tasks': result['tasks'][:limit]}
+            payload[name] = result
+            sources[name] = {'status': 'ok'}
+        except FutureTimeoutError:
+            payload[name] = empty[name]
+            sources[name] = {'status': 'timeout', 'timeout': DASHBOARD_TIMEOUTS[name]}
+        except Exception as e:
+            print(f"Dashboard source '{name}' failed: {e}")
+            payload[name] = empty[name]
+            sources[name] = {'status': 'error', 'error': str(e)}
+
+    return jsonify({
+        'success': True,
+        'partial': any(src['status'] != 'ok' for src in sources.values()),
+        'sources': sources,
+        'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+        **payload
+    })
+
+
 @app.route('/api/google-calendar/events', methods=['GET'])
 def get_calendar_events():
     """
@@ -317,40 +555,12 @@ def get_calendar_events():
     """
     try:
         max_results = int(request.args.get('max_results', 5))
-
-        events = gcal_service.get_upcoming_events(max_results)
-
-        if events:
-            return jsonify({
-                'events': events,
-                'success': True,
-                'source': 'google_calendar'
-            })
-        else:
-            print("⚠️ Google Calendar not available, using mock data")
-            mock_events = [
-                {
-                    'id': 'mock_1',
-                    'summary': 'Doctor Appointment',
-                    'start': '2024-01-15T10:00:00Z',
-                    'end': '2024-01-15T11:00:00Z',
-                    'location': 'Changi General Hospital',
-                    'description': 'Regular checkup'
-                },
-                {
-                    'id': 'mock_2',
-                    'summary': 'Medicine Pickup',
-                    'start': '2024-01-16T14:00:00Z',
-                    'end': '2024-01-16T14:30:00Z',
-                    'location': 'Guardian Pharmacy',
-                    'description': 'Prescription refill'
-                }
-            ]
-            return jsonify({
-                'events': mock_events[:max_results],
-                'success': True,
-                'source': 'mock_data'
-            })
+        events, source = fetch_calendar_events(max_results)
+        return jsonify({
+            'events': events,
+            'success': True,
+            'source': source
+        })
 
     except Exception as e:
         print(f"Error fetching calendar events: {str(e)}")
@@ -369,9 +579,7 @@ def get_todoist_tasks():
     try:
         limit = int(request.args.get('limit', 10))
         # You can add filters like ?project_id=... or ?filter=...
-        resp = requests.get(f"{TODOIST_BASE_URL}/tasks", headers=todoist_headers(), timeout=20)
-        resp.raise_for_status()
-        tasks = resp.json()
+        tasks = todoist.get_tasks()
         return jsonify({
             'tasks': tasks[:limit],
             'success': True,
@@ -404,18 +612,12 @@ def add_todoist_task():
 
         # Optional passthrough fields (see Todoist docs for more)
         payload = {"content": content}
-        for k in ("due_string", "project_id", "priority", "description", "labels", "due_date", "due_datetime"):
+        for k in TASK_FIELDS:
             if k in data:
                 payload[k] = data[k]
 
-        resp = requests.post(
-            f"{TODOIST_BASE_URL}/tasks",
-            headers=todoist_headers(),
-            json=payload,
-            timeout=20
-        )
-        resp.raise_for_status()
-        return jsonify({'task': resp.json(), 'success': True})
+        task = todoist.add_task(payload)
+        return jsonify({'task': task, 'success': True})
     except requests.HTTPError as http_err:
         print(f"Todoist HTTP error: {http_err} | Response: {http_err.response.text}")
         status = http_err.response.status_code if getattr(http_err, 'response', None) else 500
@@ -425,6 +627,48 @@ def add_todoist_task():
         return jsonify({'error': 'Failed to create task', 'success': False}), 500
 
 
+@app.route('/api/todoist/tasks/batch', methods=['POST'])
+def add_todoist_tasks_batch():
+    """
+    Create several Todoist tasks with Sync API commands (up to 100 per upstream request).
+    Body: { "tasks": [ { "content": "Hydrate", "due_string": "every 2 hours" }, ... ] }
+    Returns one result per task, in order, with its temp_id and the created id or error.
+    """
+    token_check = require_todoist_token()
+    if token_check:
+        return token_check
+
+    try:
+        data = request.get_json(silent=True) or {}
+        tasks = data.get("tasks")
+        if not isinstance(tasks, list) or not tasks:
+            return jsonify({'error': 'A non-empty tasks list is required', 'success': False}), 400
+
+        payloads = []
+        for i, task in enumerate(tasks):
+            content = (task.get("content") or "").strip() if isinstance(task, dict) else ""
+            if not content:
+                return jsonify({'error': f'Task {i} has no content', 'success': False}), 400
+            payload = {"content": content}
+            for k in TASK_FIELDS:
+                if k in task:
+                    payload[k] = task[k]
+            payloads.append(payload)
+
+        results = todoist.add_tasks(payloads)
+        created = sum(1 for r in results if r['success'])
+        return jsonify({
+            'success': created == len(results),
+            'created': created,
+            'failed': len(results) - created,
+            'requests': -(-len(payloads) // SYNC_BATCH_SIZE),
+            'results': results,
+        })
+    except Exception as e:
+        print(f"Error creating Todoist tasks: {e}")
+        return jsonify({'error': 'Failed to create tasks', 'success': False}), 500
+
+
 @app.route('/api/todoist/tasks/<task_id>/complete', methods=['POST'])
 def complete_task(task_id):
     """
@@ -435,11 +679,7 @@ def complete_task(task_id):
         return token_check
 
     try:
-        resp = requests.post(
-            f"{TODOIST_BASE_URL}/tasks/{task_id}/close",
-            headers=todoist_headers(),
-            timeout=20
-        )
+        resp = todoist.close_task(task_id)
         if resp.status_code == 204:
             return jsonify({'success': True, 'message': f'Task {task_id} completed successfully'})
         else:
@@ -457,6 +697,14 @@ def complete_task(task_id):
         return jsonify({'error': 'Failed to complete task', 'success': False}), 500
 
 
+@app.route('/api/todoist/stats', methods=['GET'])
+def todoist_stats():
+    """
+    Connection-pool and request counters for the shared Todoist session.
+    """
+    return jsonify({'success': True, 'stats': todoist.stats()})
+
+
 # -----------------------------------------------------------------------------
 # PDF Processing Routes
 # -----------------------------------------------------------------------------
@@ -478,6 +726,7 @@ def upload_pdf():
             filename = secure_filename(file.filename)
             filepath = os.path.join(UPLOAD_FOLDER, filename)
             file.save(filepath)
+            metrics.upload_size.observe(os.path.getsize(filepath), kind='pdf')
             
             return jsonify({
                 'success': True,
@@ -503,6 +752,11 @@ def process_pdf():
         
         if not filename:
             return jsonify({'error': 'No filename provided', 'success': False}), 400
+
+        try:
+            optimize = optimize_options(data.get('optimize'))
+        except ValueError as e:
+            return jsonify({'error': str(e), 'success': False}), 400
         
         # Check if file exists
         filepath = os.path.join(UPLOAD_FOLDER, filename)
@@ -513,45 +767,82 @@ def process_pdf():
         output_filename = f"{Path(filename).stem}_filled{Path(filename).suffix}"
         output_path = os.path.join(PROCESSED_FOLDER, output_filename)
         
+        # Use appropriate example data based on form type
+        if form_type == "health_declaration":
+            example_data = "../pdf/health_example_data.json"
+        else:
+            example_data = "../pdf/example_data.json"
+
+        variant = 'optimize:' + ','.join(step for step, on in optimize.items() if on) if optimize else ''
+        cache_key = pdf_cache.key_for(filepath, os.path.join(BACKEND_DIR, example_data), variant)
+        with tracing.span("pdf.cache_lookup") as cache_span, metrics.time_stage('cache_lookup'):
+            cache_hit = pdf_cache.get(cache_key, output_path)
+            cache_span.set_attribute("hit", cache_hit)
+        metrics.dedupe.inc(kind='pdf_result_cache', result='hit' if cache_hit else 'miss')
+        if cache_hit:
+            print(f"⚡ Cache hit for PDF: {filename}")
+            return jsonify({
+                'success': True,
+                'original_filename': filename,
+                'processed_filename': output_filename,
+                'form_type': form_type,
+                'cached': True,
+                'message': 'PDF processed successfully'
+            })
+
         print(f"🔄 Processing PDF: {filename}")
         
         # Step 1: Extract form fields
+        # Steps write to a private copy; output_path is replaced in one step at the end, so
+        # concurrent requests for the same PDF never read each other's half-written output
         with tempfile.TemporaryDirectory() as temp_dir:
+            work_path = os.path.join(temp_dir, output_filename)
             fields_json = os.path.join(temp_dir, "fields.json")
-            result = subprocess.run([
-                "python", "../pdf/json_dump2.py",
-                "--pdf", filepath,
-                "--out", fields_json
-            ], check=True, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
-            
-            # Step 2: Use appropriate example data based on form type
-            if form_type == "health_declaration":
-                example_data = "../pdf/health_example_data.json"
-            else:
-                example_data = "../pdf/example_data.json"
+            with tracing.span("pdf.extract_fields"), metrics.time_stage('extract_fields'):
+                result = subprocess.run([
+                    "python", "../pdf/json_dump2.py",
+                    "--pdf", filepath,
+                    "--out", fields_json
+                ], check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+                    env=tracing.subprocess_env())
             
             # Step 3: Merge data with fields
             values_json = os.path.join(temp_dir, "values.json")
-            result = subprocess.run([
-                "python", "../pdf/fetchdb.py",
-                "--dump", fields_json,
-                "--example-data", example_data,
-                "--out", values_json
-            ], check=True, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            # In-process, so the prepared example data and stored mappings are reused across requests
+            with tracing.span("pdf.merge_values"), metrics.time_stage('merge_values'):
+                fetchdb.merge_example_data(fields_json, os.path.join(BACKEND_DIR, example_data), values_json)
             
             # Step 4: Fill PDF
-            result = subprocess.run([
-                "python", "../pdf/autofill.py",
-                "--pdf-in", filepath,
-                "--pdf-out", output_path,
-                "--values", values_json
-            ], check=True, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            with tracing.span("pdf.fill"), metrics.time_stage('fill'):
+                result = subprocess.run([
+                    "python", "../pdf/autofill.py",
+                    "--pdf-in", filepath,
+                    "--pdf-out", work_path,
+                    "--values", values_json
+                ], check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+                    env=tracing.subprocess_env())
+
+            # Step 5: Shrink the output
+            optimization = None
+            if optimize:
+                with tracing.span("pdf.optimize"), metrics.time_stage('optimize'):
+                    result = subprocess.run([
+                        "python", "../pdf/pdf_optimizer.py", work_path, "--json"
+                    ] + [flag for step, flag in PDF_OPTIMIZE_FLAGS.items() if not optimize[step]],
+                        check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+                        env=tracing.subprocess_env())
+                optimization = json.loads(result.stdout)
+
+            pdf_cache.put(cache_key, work_path)
+            replace_file(work_path, output_path)
         
         return jsonify({
             'success': True,
             'original_filename': filename,
             'processed_filename': output_filename,
             'form_type': form_type,
+            'cached': False,
+            'optimization': optimization,
             'message': 'PDF processed successfully'
         })
         
@@ -562,61 +853,139 @@ def process_pdf():
         print(f"Error processing PDF: {str(e)}")
         return jsonify({'error': 'Failed to process PDF', 'success': False}), 500
 
+@app.route('/api/pdf/cache/stats', methods=['GET'])
+def pdf_cache_stats():
+    """
+    Hit-rate and size statistics for the filled-PDF cache.
+    """
+    return jsonify({'success': True, 'stats': pdf_cache.stats()})
+
+@app.route('/api/pdf/jobs', methods=['GET'])
+def list_pdf_jobs():
+    """
+    Recent background PDF jobs (submitted by the agent's PDF tools), newest first.
+    """
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({'success': True, 'jobs': [job.to_dict() for job in pdf_jobs.list(limit=limit)]})
+
+@app.route('/api/pdf/jobs/<job_id>', methods=['GET'])
+def pdf_job_status(job_id):
+    """
+    Status of one background PDF job: queued/running with remaining ETA, done with
+    the output file, or failed with the error.
+    """
+    job = pdf_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found', 'success': False}), 404
+    info = job.to_dict()
+    if info['status'] == 'done' and os.path.dirname(os.path.abspath(info['output'])) == os.path.abspath(PROCESSED_FOLDER):
+        info['processed_filename'] = os.path.basename(info['output'])  # downloadable via /api/pdf/download
+    return jsonify({'success': True, 'job': info})
+
+FORM_DATA_MIMETYPES = {'fdf': 'application/vnd.fdf', 'xfdf': 'application/vnd.adobe.xfdf'}
+
+def _template_for(processed_filename):
+    """The upload a processed PDF was filled from ("x_filled.pdf" -> "x.pdf"), if it is still there."""
+    stem = Path(processed_filename).stem
+    if stem.endswith('_filled'):
+        upload = os.path.join(UPLOAD_FOLDER, f"{stem[:-len('_filled')]}.pdf")
+        if os.path.exists(upload):
+            return upload
+    return None
+
 @app.route('/api/pdf/download/<filename>', methods=['GET'])
 def download_pdf(filename):
     """
-    Download a processed PDF file.
+    Download a processed PDF file. With ?format=fdf or ?format=xfdf, download
+    only its field values, referring to the template by fingerprint (merge them
+    back with /api/pdf/merge).
     """
     try:
         filepath = os.path.join(PROCESSED_FOLDER, filename)
         if not os.path.exists(filepath):
             return jsonify({'error': 'File not found', 'success': False}), 404
-        
-        return send_file(filepath, as_attachment=True, download_name=filename)
-        
+
+        fmt = request.args.get('format', 'pdf').lower()
+        if fmt == 'pdf':
+            return send_file(filepath, as_attachment=True, download_name=filename)
+        if fmt not in FORM_DATA_MIMETYPES:
+            return jsonify({'error': 'Invalid format. Use pdf, fdf or xfdf.', 'success': False}), 400
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            data_path = os.path.join(temp_dir, f"values.{fmt}")
+            cmd = ["python", "../pdf/form_data.py", "export", filepath, "--format", fmt, "--out", data_path]
+            template = _template_for(filename)
+            if template:
+                cmd += ["--template", template]
+            with tracing.span("pdf.export_form_data", format=fmt), metrics.time_stage('export_form_data'):
+                subprocess.run(cmd, check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+                               env=tracing.subprocess_env())
+            with open(data_path, 'rb') as f:
+                data = f.read()
+
+        return send_file(io.BytesIO(data), mimetype=FORM_DATA_MIMETYPES[fmt], as_attachment=True,
+                         download_name=f"{Path(filename).stem}.{fmt}")
+
+    except subprocess.CalledProcessError as e:
+        print(f"Error exporting form data: {e.stderr}")
+        return jsonify({'error': f'Form data export failed: {e.stderr}', 'success': False}), 500
     except Exception as e:
         print(f"Error downloading PDF: {str(e)}")
         return jsonify({'error': 'Failed to download file', 'success': False}), 500
 
+@app.route('/api/pdf/merge', methods=['POST'])
+def merge_form_data():
+    """
+    Merge an uploaded FDF/XFDF file into the template it refers to (by
+    fingerprint, from the template registry) and store the filled PDF with the
+    processed files.
+    """
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file provided', 'success': False}), 400
+
+        file = request.files['file']
+        filename = secure_filename(file.filename or '')
+        fmt = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        if fmt not in FORM_DATA_MIMETYPES:
+            return jsonify({'error': 'Invalid file type. Only FDF and XFDF files are allowed.', 'success': False}), 400
+
+        output_filename = f"{Path(filename).stem}_merged.pdf"
+        output_path = os.path.join(PROCESSED_FOLDER, output_filename)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            data_path = os.path.join(temp_dir, filename)
+            file.save(data_path)
+            with tracing.span("pdf.merge_form_data", format=fmt), metrics.time_stage('merge_form_data'):
+                subprocess.run([
+                    "python", "../pdf/form_data.py", "merge", data_path,
+                    "--out", output_path
+                ], check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+                    env=tracing.subprocess_env())
+
+        return jsonify({
+            'success': True,
+            'processed_filename': output_filename,
+            'message': 'Form data merged successfully'
+        })
+
+    except subprocess.CalledProcessError as e:
+        print(f"Error merging form data: {e.stderr}")
+        return jsonify({'error': f'Form data merge failed: {e.stderr.strip()}', 'success': False}), 400
+    except Exception as e:
+        print(f"Error merging form data: {str(e)}")
+        return jsonify({'error': 'Failed to merge form data', 'success': False}), 500
+
 @app.route('/api/pdf/list', methods=['GET'])
 def list_pdfs():
     """
     List uploaded and processed PDF files.
     """
     try:
-        uploaded_files = []
-        processed_files = []
-        
-        # List uploaded files
-        if os.path.exists(UPLOAD_FOLDER):
-            for filename in os.listdir(UPLOAD_FOLDER):
-                if filename.lower().endswith('.pdf'):
-                    filepath = os.path.join(UPLOAD_FOLDER, filename)
-                    stat = os.stat(filepath)
-                    uploaded_files.append({
-                        'filename': filename,
-                        'size': stat.st_size,
-                        'uploaded_at': stat.st_mtime,
-                        'type': 'uploaded'
-                    })
-        
-        # List processed files
-        if os.path.exists(PROCESSED_FOLDER):
-            for filename in os.listdir(PROCESSED_FOLDER):
-                if filename.lower().endswith('.pdf'):
-                    filepath = os.path.join(PROCESSED_FOLDER, filename)
-                    stat = os.stat(filepath)
-                    processed_files.append({
-                        'filename': filename,
-                        'size': stat.st_size,
-                        'processed_at': stat.st_mtime,
-                        'type': 'processed'
-                    })
-        
+        manifest = build_pdf_manifest()
         return jsonify({
             'success': True,
-            'uploaded_files': uploaded_files,
-            'processed_files': processed_files
+            'uploaded_files': manifest['uploaded_files'],
+            'processed_files': manifest['processed_files']
         })
         
     except Exception as e:
@@ -653,6 +1022,13 @@ def delete_pdf(filename):
 # Register Ultravox integration routes
 register_ultravox_routes(app)
 
+@app.route('/api/ratelimit/stats', methods=['GET'])
+def rate_limit_stats():
+    """
+    Configured buckets and allowed/rejected counters per endpoint class.
+    """
+    return jsonify({'success': True, 'stats': get_rate_limiter().stats()})
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """
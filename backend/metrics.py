@@ -0,0 +1,282 @@
+"""
+Prometheus-compatible metrics for the AHMA Backend.
+
+Metrics are kept in process memory (a dict update under a lock per
+observation). With several gunicorn workers, set PROMETHEUS_MULTIPROC_DIR:
+each worker then snapshots its values to <dir>/metrics_<pid>.json every few
+seconds, and /metrics merges the snapshots of all workers. Counters and
+histograms are summed across every snapshot; gauges only across live workers.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+from flask import Response, g, request
+
+from pdf_jobs import jobs as pdf_jobs
+from tracking_agent import todoist_client
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 512 * 1024, 1024 ** 2, 5 * 1024 ** 2, 20 * 1024 ** 2, 100 * 1024 ** 2)
+
+SNAPSHOT_INTERVAL = 5.0
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}      # name -> (type, help, buckets)
+        self._values = {}    # name -> {label tuple -> value | [bucket counts..., sum, count]}
+
+    def _register(self, name, kind, help_text, buckets=None):
+        self._meta[name] = (kind, help_text, buckets)
+        self._values.setdefault(name, {})
+        return Metric(self, name)
+
+    def counter(self, name, help_text):
+        return self._register(name, 'counter', help_text)
+
+    def gauge(self, name, help_text):
+        return self._register(name, 'gauge', help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._register(name, 'histogram', help_text, tuple(buckets))
+
+    def _add(self, name, labels, amount):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0) + amount
+
+    def _observe(self, name, labels, value):
+        buckets = self._meta[name][2]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values[name]
+            row = series.get(key)
+            if row is None:
+                row = series[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: [[list(key), value if not isinstance(value, list) else list(value)]
+                       for key, value in series.items()]
+                for name, series in self._values.items()
+            }
+
+
+class Metric:
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def inc(self, amount=1, **labels):
+        self.registry._add(self.name, labels, amount)
+
+    def dec(self, amount=1, **labels):
+        self.registry._add(self.name, labels, -amount)
+
+    def observe(self, value, **labels):
+        self.registry._observe(self.name, labels, value)
+
+
+registry = Registry()
+
+http_requests = registry.counter('ahma_http_requests_total', 'HTTP requests by route, method and status')
+http_latency = registry.histogram('ahma_http_request_duration_seconds', 'HTTP request latency by route')
+http_in_flight = registry.gauge('ahma_http_requests_in_flight', 'HTTP requests currently being served')
+pdf_stage_latency = registry.histogram('ahma_pdf_stage_duration_seconds', 'PDF pipeline stage duration')
+upload_size = registry.histogram('ahma_upload_size_bytes', 'Uploaded file sizes', SIZE_BUCKETS)
+dedupe = registry.counter('ahma_dedupe_total', 'Dedupe/cache lookups by kind and result (hit|miss)')
+upstream_latency = registry.histogram('ahma_upstream_request_duration_seconds', 'Latency of calls to external APIs')
+upstream_responses = registry.counter('ahma_upstream_responses_total', 'Responses from external APIs by code')
+
+
+@contextlib.contextmanager
+def time_stage(stage):
+    """Observe the duration of a PDF pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        pdf_stage_latency.observe(time.perf_counter() - start, stage=stage)
+
+
+def observe_upstream(upstream, seconds, code):
+    upstream_latency.observe(seconds, upstream=upstream)
+    upstream_responses.inc(upstream=upstream, code=str(code))
+
+
+@contextlib.contextmanager
+def time_upstream(upstream):
+    """Observe a call to an external API; code is 'error' if it raises, else 'ok'."""
+    start = time.perf_counter()
+    code = 'ok'
+    try:
+        yield
+    except Exception:
+        code = 'error'
+        raise
+    finally:
+        observe_upstream(upstream, time.perf_counter() - start, code)
+
+
+def _on_pdf_job(job):
+    # Background pipeline runs started by the agent's PDF tools
+    if job['started'] and job['finished']:
+        pdf_stage_latency.observe(job['finished'] - job['started'], stage='job')
+
+
+# ----------------------------------------------------------------------------
+# Multiprocess snapshots
+# ----------------------------------------------------------------------------
+
+def _multiproc_dir():
+    return os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+
+def write_snapshot():
+    directory = _multiproc_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"metrics_{os.getpid()}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'pid': os.getpid(), 'values': registry.snapshot()}, f)
+    os.replace(tmp_path, path)
+
+
+def _snapshot_loop():
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+        try:
+            write_snapshot()
+        except Exception as e:
+            print(f"⚠️ Failed to write metrics snapshot: {e}")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+
+def _collect():
+    """Merged {name: {label tuple: value}} across this process and sibling workers."""
+    directory = _multiproc_dir()
+    if not directory:
+        snapshots = [(True, registry.snapshot())]
+    else:
+        write_snapshot()
+        snapshots = []
+        for fname in os.listdir(directory):
+            if not (fname.startswith('metrics_') and fname.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(directory, fname)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            snapshots.append((_pid_alive(data['pid']), data['values']))
+
+    merged = {}
+    for alive, values in snapshots:
+        for name, rows in values.items():
+            if name not in registry._meta:
+                continue
+            if registry._meta[name][0] == 'gauge' and not alive:
+                continue
+            series = merged.setdefault(name, {})
+            for key, value in rows:
+                key = tuple(tuple(kv) for kv in key)
+                if isinstance(value, list):
+                    current = series.setdefault(key, [0] * len(value))
+                    series[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    series[key] = series.get(key, 0) + value
+    return merged
+
+
+def _fmt_labels(key, extra=None):
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ''
+    body = ','.join(f'{k}="{str(v)}"'.replace('\n', ' ') for k, v in items)
+    return '{' + body + '}'
+
+
+def render():
+    """Prometheus text exposition format (0.0.4)."""
+    lines = []
+    merged = _collect()
+    for name, (kind, help_text, buckets) in registry._meta.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in sorted(merged.get(name, {}).items()):
+            if kind == 'histogram':
+                cumulative = 0
+                for bound, count in zip(buckets, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_fmt_labels(key, ('le', repr(float(bound))))} {cumulative}")
+                lines.append(f"{name}_bucket{_fmt_labels(key, ('le', '+Inf'))} {value[-1]}")
+                lines.append(f"{name}_sum{_fmt_labels(key)} {value[-2]}")
+                lines.append(f"{name}_count{_fmt_labels(key)} {value[-1]}")
+            else:
+                lines.append(f"{name}{_fmt_labels(key)} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+# ----------------------------------------------------------------------------
+# Flask wiring
+# ----------------------------------------------------------------------------
+
+def init_app(app):
+    """Time every request, count Todoist calls and agent PDF jobs, and serve /metrics."""
+
+    def _route():
+        return request.url_rule.rule if request.url_rule else 'unmatched'
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_start = time.perf_counter()
+        g._metrics_route = _route()
+        http_in_flight.inc(route=g._metrics_route)
+
+    @app.teardown_request
+    def _metrics_end(exc):
+        start = g.pop('_metrics_start', None)
+        route = g.pop('_metrics_route', None)
+        if start is None:
+            return
+        http_in_flight.dec(route=route)
+        http_latency.observe(time.perf_counter() - start, route=route, method=request.method)
+
+    @app.after_request
+    def _metrics_count(response):
+        if getattr(g, '_metrics_route', None) is not None:
+            http_requests.inc(route=g._metrics_route, method=request.method, status=str(response.status_code))
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+
+    todoist_client.add_request_listener(
+        lambda seconds, code: observe_upstream('todoist', seconds, code))
+    pdf_jobs.add_listener(_on_pdf_job)
+
+    if _multiproc_dir():
+        threading.Thread(target=_snapshot_loop, name='metrics-snapshot', daemon=True).start()
@@ -0,0 +1,189 @@
+"""
+Content-addressed cache of filled PDFs for the AHMA Backend.
+
+Entries are keyed by (SHA-256 of the input PDF, SHA-256 of the data file,
+pipeline version, mapping store generation) and stored under
+pdf_processed/.cache. The generation is bumped by pdf/mapping_store.py on every
+pin, unpin and remove, since those change fills for the same inputs. The cache is bounded
+by total size and evicts least-recently-used entries first.
+
+index.json is shared by every gunicorn worker, so each read-modify-write of
+it holds an exclusive flock on index.lock as well as the in-process lock.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+# Bump whenever extraction, matching or filling changes output for the same inputs.
+PDF_PIPELINE_VERSION = "3"
+
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class PdfResultCache:
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, pipeline_version=PDF_PIPELINE_VERSION,
+                 mapping_store_dir=None):
+        self.cache_dir = cache_dir
+        self.mapping_store_dir = mapping_store_dir
+        self.max_bytes = max_bytes
+        self.pipeline_version = pipeline_version
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.lock_path = os.path.join(cache_dir, 'index.lock')
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Exclusive access to the index across threads and worker processes; yields the fresh index."""
+        with self._lock, open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._index = self._load_index()
+                yield self._index
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    index = json.load(f)
+                index.setdefault('entries', {})
+                index.setdefault('stats', {})
+                return index
+            except Exception:
+                pass
+        return {'entries': {}, 'stats': {}}
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def _bump(self, counter, n=1):
+        stats = self._index['stats']
+        stats[counter] = stats.get(counter, 0) + n
+
+    def key_for(self, input_pdf, data_file, variant=''):
+        """Cache key for running the pipeline on input_pdf with data_file (and output options in variant)."""
+        parts = [sha256_file(input_pdf), sha256_file(data_file), self.pipeline_version]
+        if self.mapping_store_dir:
+            parts.append(f"mappings:{self._mapping_generation()}")
+        if variant:
+            parts.append(variant)
+        return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def _mapping_generation(self):
+        # Same file and format as pdf/mapping_store.py read_generation()
+        try:
+            with open(os.path.join(self.mapping_store_dir, 'generation'), 'r') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def get(self, key, dest_path):
+        """Copy the cached output for key to dest_path. Returns True on a hit."""
+        with self._locked():
+            entry = self._index['entries'].get(key)
+            stored = self._entry_path(key)
+            if entry is None or not os.path.exists(stored):
+                if entry is not None:
+                    del self._index['entries'][key]
+                self._bump('misses')
+                self._save_index()
+                return False
+
+            if os.path.abspath(stored) != os.path.abspath(dest_path):
+                # Replaced in one step, so a reader of dest_path never sees it truncated
+                tmp_path = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                shutil.copyfile(stored, tmp_path)
+                os.replace(tmp_path, dest_path)
+            entry['last_access'] = time.time()
+            entry['hits'] = entry.get('hits', 0) + 1
+            self._bump('hits')
+            self._save_index()
+            return True
+
+    def put(self, key, produced_path):
+        """Store a copy of produced_path under key and evict down to the size bound."""
+        size = os.path.getsize(produced_path)
+        if size > self.max_bytes:
+            return
+
+        with self._locked():
+            tmp_path = f"{self._entry_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.copyfile(produced_path, tmp_path)
+            os.replace(tmp_path, self._entry_path(key))
+            now = time.time()
+            self._index['entries'][key] = {
+                'size': size,
+                'created': now,
+                'last_access': now,
+                'hits': 0,
+                'pipeline_version': self.pipeline_version,
+            }
+            self._bump('stores')
+            self._drop_untracked()
+            self._evict()
+            self._save_index()
+
+    def _drop_untracked(self):
+        # Entry files the index doesn't list (e.g. lost to an unlocked write by an
+        # older version) would never be evicted and would escape the size bound
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.pdf') and name[:-4] not in self._index['entries']:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    def _evict(self):
+        entries = self._index['entries']
+        total = sum(e['size'] for e in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]['last_access']):
+            if total <= self.max_bytes:
+                break
+            total -= entries[key]['size']
+            del entries[key]
+            try:
+                os.remove(self._entry_path(key))
+            except FileNotFoundError:
+                pass
+            self._bump('evictions')
+
+    def stats(self):
+        with self._locked():
+            stats = dict(self._index['stats'])
+            entries = self._index['entries']
+        hits = stats.get('hits', 0)
+        lookups = hits + stats.get('misses', 0)
+        return {
+            'hits': hits,
+            'misses': stats.get('misses', 0),
+            'stores': stats.get('stores', 0),
+            'evictions': stats.get('evictions', 0),
+            'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+            'entries': len(entries),
+            'bytes': sum(e['size'] for e in entries.values()),
+            'max_bytes': self.max_bytes,
+            'pipeline_version': self.pipeline_version,
+        }
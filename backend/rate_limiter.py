@@ -0,0 +1,201 @@
+"""
+Token-bucket rate limiting for the LLM-backed AHMA Backend routes.
+
+Each endpoint class (chat, medicine image, voice transcript) has its own bucket
+per caller, keyed by client IP. Buckets live in process memory by default;
+set RATE_LIMIT_BACKEND=sqlite:/path/to/ratelimit.db so all
+gunicorn workers on a host share one budget.
+
+Limits are configured as "<capacity>/<seconds>", e.g. RATE_LIMIT_CHAT=10/60
+allows bursts of 10 requests and refills 10 tokens every 60 seconds.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import jsonify, request
+
+DEFAULT_LIMITS = {
+    'chat': '10/60',
+    'medicine_image': '5/60',
+    'transcript': '5/60',
+}
+
+
+def parse_limit(spec):
+    """'10/60' -> (capacity=10.0, refill_per_second=10/60)."""
+    capacity, seconds = spec.split('/', 1)
+    capacity = float(capacity)
+    return capacity, capacity / float(seconds)
+
+
+class MemoryBackend:
+    """Buckets in a dict; correct within one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._counters = {}
+
+    def take(self, bucket, capacity, rate, now):
+        with self._lock:
+            tokens, updated = self._buckets.get(bucket, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[bucket] = (tokens, now)
+            return allowed, tokens
+
+    def count(self, counter):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + 1
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+class SQLiteBackend:
+    """Buckets in a SQLite file; BEGIN IMMEDIATE makes each take atomic across processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (bucket TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, bucket, capacity, rate, now):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated FROM buckets WHERE bucket = ?", (bucket,)
+            ).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (bucket, tokens, updated) VALUES (?, ?, ?)",
+                (bucket, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, tokens
+
+    def count(self, counter):
+        self._conn().execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (counter,),
+        )
+
+    def counters(self):
+        return dict(self._conn().execute("SELECT name, value FROM counters").fetchall())
+
+
+class RateLimiter:
+    def __init__(self, limits, backend):
+        self.limits = {name: parse_limit(spec) for name, spec in limits.items()}
+        self.backend = backend
+
+    @classmethod
+    def from_env(cls):
+        limits = {
+            name: os.getenv(f"RATE_LIMIT_{name.upper()}", default)
+            for name, default in DEFAULT_LIMITS.items()
+        }
+        backend_spec = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+        if backend_spec.startswith('sqlite:'):
+            backend = SQLiteBackend(backend_spec[len('sqlite:'):])
+        else:
+            backend = MemoryBackend()
+        return cls(limits, backend)
+
+    def check(self, endpoint_class, client_key):
+        """Take one token. Returns (allowed, retry_after_seconds)."""
+        capacity, rate = self.limits[endpoint_class]
+        allowed, tokens = self.backend.take(
+            f"{endpoint_class}:{client_key}", capacity, rate, time.time()
+        )
+        self.backend.count(f"{endpoint_class}.{'allowed' if allowed else 'rejected'}")
+        if allowed:
+            return True, 0
+        return False, max(1, math.ceil((1 - tokens) / rate))
+
+    def stats(self):
+        counters = self.backend.counters()
+        return {
+            name: {
+                'capacity': capacity,
+                'refill_per_second': round(rate, 4),
+                'allowed': counters.get(f"{name}.allowed", 0),
+                'rejected': counters.get(f"{name}.rejected", 0),
+            }
+            for name, (capacity, rate) in self.limits.items()
+        }
+
+
+def client_key():
+    """
+    Identify the caller by client IP. The app has no authentication, so user
+    ids, session ids and cookies are whatever the caller chooses to send;
+    keying on them would let anyone skip the limit with a fresh id per request.
+    Behind a reverse proxy, wrap the app in werkzeug's ProxyFix so remote_addr
+    is the client rather than the proxy.
+    """
+    return f"ip:{request.remote_addr}"
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter.from_env()
+    return _limiter
+
+
+def rate_limited(endpoint_class):
+    """Decorator for Flask views: 429 with Retry-After once the caller's bucket is empty."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            allowed, retry_after = get_rate_limiter().check(endpoint_class, client_key())
+            if not allowed:
+                response = jsonify({
+                    'success': False,
+                    'error': 'Rate limit exceeded, please try again later',
+                    'retry_after': retry_after
+                })
+                response.status_code = 429
+                response.headers['Retry-After'] = str(retry_after)
+                return response
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -7,13 +7,16 @@ import os
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import tracing
 from superagent_test import router_agent
+from rate_limiter import rate_limited
 
 
 def register_ultravox_routes(app):
     """Register Ultravox integration routes"""
 
     @app.route('/api/ultravox/transcript', methods=['POST'])
+    @rate_limited('transcript')
     def receive_transcript():
         """
         Receive call transcript from Flutter app after Ultravox call ends.
@@ -59,7 +62,8 @@ Provide a summary of actions taken.
 """
 
             # Process with router agent
-            result = router_agent(agent_prompt)
+            with tracing.span("router_agent", call_id=call_id):
+                result = router_agent(agent_prompt)
 
             # Extract result text
             result_text = _extract_text(result)
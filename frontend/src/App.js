@@ -26,11 +26,8 @@ function App() {
   }, [messages]);
 
   useEffect(() => {
-    // Load initial data
-    loadCalendarEvents();
-    loadTodoistTasks();
-    loadPdfFiles();
-    setIsLoading(false);
+    // Load initial data (calendar, tasks and PDFs in one request)
+    loadDashboard().finally(() => setIsLoading(false));
 
     // Add welcome message
     setMessages([
@@ -51,15 +48,22 @@ function App() {
     return () => clearInterval(taskRefreshInterval);
   }, []);
 
-  // Load Google Calendar Events
-  const loadCalendarEvents = async () => {
+  // Load Dashboard (backend fetches all sources concurrently)
+  const loadDashboard = async () => {
     try {
-      const response = await fetch('/api/google-calendar/events?max_results=5');
+      const response = await fetch('/api/dashboard?max_results=5&limit=10');
       const data = await response.json();
-      setCalendarEvents(data.events || []);
+      setCalendarEvents(data.calendar?.events || []);
+      setTodoistTasks(data.tasks?.tasks || []);
+      setPdfFiles({
+        uploaded: data.pdfs?.uploaded_files || [],
+        processed: data.pdfs?.processed_files || []
+      });
     } catch (error) {
-      console.error('Error loading calendar events:', error);
+      console.error('Error loading dashboard:', error);
       setCalendarEvents([]);
+      setTodoistTasks([]);
+      setPdfFiles({ uploaded: [], processed: [] });
     }
   };
 
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+Appearance streams and flattening for filled AcroForm widgets.
+
+Setting /NeedAppearances makes every viewer rebuild field appearances when it
+opens the file, which is slow on mobile and renders differently per reader.
+Instead, build_appearance() generates the widget's normal (/N) appearance
+itself from the field's default appearance string (/DA: font, size, colour):
+
+- text fields: single line, multiline (word-wrapped), comb and password
+- choice fields: combo boxes like text, list boxes with the selection highlighted
+- checkboxes/radios: only if the widget has no appearance for its state yet
+  (forms normally ship both states; /MK /CA picks the ZapfDingbats glyph)
+
+Glyph widths come from the /DR font's /Widths, or a built-in Helvetica table
+for standard fonts without one. Composite (Type0) fonts can't be measured or
+encoded here, so such fields fall back to Helvetica.
+
+flatten_page() draws each widget's normal appearance into the page content
+as a form XObject (PDF 32000-1:2008, 12.5.5) and drops the widget
+annotations, so the output needs no AcroForm at all.
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, IndirectObject, NameObject,
+    NumberObject, StreamObject,
+)
+
+from template_registry import inherited
+
+FALLBACK_FONT = "/HelvAP"
+DEFAULT_DA = "/Helv 0 Tf 0 g"
+AUTO_SIZE_MAX = 12.0
+MULTILINE_AUTO_SIZE = 10.0
+PADDING = 2.0
+LEADING = 1.15
+# Ascent/descent of the em box used to centre single-line text vertically
+DESCENT = 0.22
+HIGHLIGHT_RGB = "0.6 0.75 0.87"
+
+# Field flags (PDF 32000-1:2008, tables 226, 228, 230)
+FF_MULTILINE = 1 << 12
+FF_PASSWORD = 1 << 13
+FF_COMBO = 1 << 17
+FF_COMB = 1 << 24
+# Annotation flags (table 165)
+F_HIDDEN = 1 << 1
+F_NOVIEW = 1 << 5
+
+# Helvetica advance widths for chars 32..126 (Adobe AFM), in 1/1000 em
+_HELVETICA_WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)
+_ZAPF_CHECK_WIDTH = 846
+
+_DA_TOKEN_RE = re.compile(r"/[^\s/\[\]()<>]+|[-+]?\d*\.?\d+|[A-Za-z]+")
+
+
+def _resolve(obj):
+    while isinstance(obj, IndirectObject):
+        obj = obj.get_object()
+    return obj
+
+
+def _num(x: float) -> str:
+    return f"{x:.2f}".rstrip("0").rstrip(".") or "0"
+
+
+def parse_da(da: str) -> Tuple[str, float, str]:
+    """'/Helv 0 Tf 0 g' -> ('/Helv', 0.0, '0 g'). Colour defaults to black."""
+    font, size, color = "/Helv", 0.0, "0 g"
+    operands: List[str] = []
+    for tok in _DA_TOKEN_RE.findall(da or ""):
+        if tok in ("Tf", "g", "rg", "k"):
+            if tok == "Tf" and len(operands) >= 2:
+                font = operands[-2]
+                try:
+                    size = float(operands[-1])
+                except ValueError:
+                    size = 0.0
+            elif tok != "Tf":
+                n = {"g": 1, "rg": 3, "k": 4}[tok]
+                if len(operands) >= n:
+                    color = " ".join(operands[-n:] + [tok])
+            operands = []
+        else:
+            operands.append(tok)
+    return font, size, color
+
+
+def _escape(data: bytes) -> bytes:
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)").replace(b"\r", b"\\r")
+
+
+class _Font:
+    """A /DR font (or the Helvetica fallback): resource name, dict and metrics."""
+
+    def __init__(self, name: str, font: Optional[DictionaryObject], ref: Any):
+        self.name = name
+        self.ref = ref
+        self.widths: Dict[int, float] = {}
+        self.default_width = 556.0
+        self.fixed = None
+        if font is not None:
+            first = int(font.get("/FirstChar", 0))
+            widths = _resolve(font.get("/Widths"))
+            if widths:
+                self.widths = {first + i: float(_resolve(w)) for i, w in enumerate(widths)}
+            descriptor = _resolve(font.get("/FontDescriptor"))
+            if isinstance(descriptor, DictionaryObject) and "/MissingWidth" in descriptor:
+                self.default_width = float(descriptor["/MissingWidth"])
+            if not self.widths and "courier" in str(font.get("/BaseFont", "")).lower():
+                self.fixed = 600.0
+
+    def encode(self, text: str) -> bytes:
+        return text.encode("cp1252", errors="replace")
+
+    def width(self, data: bytes, size: float) -> float:
+        total = 0.0
+        for b in data:
+            if self.fixed is not None:
+                total += self.fixed
+            elif self.widths:
+                total += self.widths.get(b, self.default_width)
+            else:
+                total += _HELVETICA_WIDTHS[b - 32] if 32 <= b <= 126 else self.default_width
+        return total * size / 1000.0
+
+
+def _helvetica() -> DictionaryObject:
+    return DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+        NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+    })
+
+
+def _zapf() -> DictionaryObject:
+    return DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/ZapfDingbats"),
+    })
+
+
+def _find_font(name: str, annot: DictionaryObject, acroform: Optional[DictionaryObject]) -> _Font:
+    for holder in (annot, acroform):
+        dr = _resolve(holder.get("/DR")) if isinstance(holder, DictionaryObject) else None
+        fonts = _resolve(dr.get("/Font")) if isinstance(dr, DictionaryObject) else None
+        if isinstance(fonts, DictionaryObject) and name in fonts:
+            font = _resolve(fonts[name])
+            if isinstance(font, DictionaryObject) and font.get("/Subtype") != "/Type0":
+                return _Font(name, font, fonts.raw_get(name))
+    return _Font(FALLBACK_FONT, None, _helvetica())
+
+
+def _box(annot: DictionaryObject) -> Tuple[float, float, int]:
+    """(width, height, rotation) of the widget in its own (unrotated) space."""
+    rect = [float(_resolve(x)) for x in _resolve(annot.get("/Rect", [0, 0, 0, 0]))]
+    w, h = abs(rect[2] - rect[0]), abs(rect[3] - rect[1])
+    mk = _resolve(annot.get("/MK"))
+    rotation = int(mk.get("/R", 0)) % 360 if isinstance(mk, DictionaryObject) else 0
+    if rotation in (90, 270):
+        w, h = h, w
+    return w, h, rotation
+
+
+def _border_ops(annot: DictionaryObject, w: float, h: float) -> Tuple[str, float]:
+    """Background/border from /MK /BG and /BC; returns (ops, border width)."""
+    mk = _resolve(annot.get("/MK"))
+    if not isinstance(mk, DictionaryObject):
+        return "", 0.0
+    ops = []
+    colour_ops = {1: "g", 3: "rg", 4: "k"}
+    bg = _resolve(mk.get("/BG"))
+    if bg and len(bg) in colour_ops:
+        ops.append(f"{' '.join(_num(float(c)) for c in bg)} {colour_ops[len(bg)]} 0 0 {_num(w)} {_num(h)} re f")
+    bc = _resolve(mk.get("/BC"))
+    bw = 0.0
+    if bc and len(bc) in colour_ops:
+        bs = _resolve(annot.get("/BS"))
+        bw = float(bs.get("/W", 1)) if isinstance(bs, DictionaryObject) else 1.0
+        if bw > 0:
+            ops.append(f"{' '.join(_num(float(c)) for c in bc)} {colour_ops[len(bc)].upper()} {_num(bw)} w "
+                       f"{_num(bw / 2)} {_num(bw / 2)} {_num(w - bw)} {_num(h - bw)} re S")
+    return "\n".join(ops), bw
+
+
+def _stream(ops: str, w: float, h: float, rotation: int, font: Optional[_Font] = None,
+            font_obj: Any = None) -> StreamObject:
+    stream = DecodedStreamObject()
+    stream.set_data(ops.encode("latin-1"))
+    stream.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/BBox"): ArrayObject([FloatObject(0), FloatObject(0), FloatObject(_num(w)), FloatObject(_num(h))]),
+    })
+    matrix = {90: (0, 1, -1, 0), 180: (-1, 0, 0, -1), 270: (0, -1, 1, 0)}.get(rotation)
+    if matrix:
+        stream[NameObject("/Matrix")] = ArrayObject([NumberObject(v) for v in matrix] + [NumberObject(0)] * 2)
+    if font is not None:
+        stream[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject(font.name): font_obj}),
+        })
+    return stream
+
+
+def _fit_size(font: _Font, data: bytes, w: float, h: float) -> float:
+    size = min(AUTO_SIZE_MAX, max(1.0, (h - 2 * PADDING) / LEADING))
+    width = font.width(data, size)
+    if width > w - 2 * PADDING > 0:
+        size = max(4.0, size * (w - 2 * PADDING) / width)
+    return size
+
+
+def _wrap(font: _Font, text: str, size: float, width: float) -> List[bytes]:
+    lines: List[bytes] = []
+    for paragraph in text.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        line = b""
+        for word in paragraph.split(" "):
+            candidate = line + b" " + font.encode(word) if line else font.encode(word)
+            if line and font.width(candidate, size) > width:
+                lines.append(line)
+                line = font.encode(word)
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def _text_ops(font: _Font, size: float, color: str, lines: List[Tuple[float, float, bytes]]) -> str:
+    ops = [f"BT {font.name} {_num(size)} Tf {color}"]
+    for x, y, data in lines:
+        ops.append(f"1 0 0 1 {_num(x)} {_num(y)} Tm ({_escape(data).decode('latin-1')}) Tj")
+    ops.append("ET")
+    return "\n".join(ops)
+
+
+def _choice_display(annot: DictionaryObject) -> List[Tuple[str, str]]:
+    """[(export, display)] from /Opt (entries are strings or [export, display] pairs)."""
+    opts = _resolve(inherited(annot, "/Opt")) or []
+    out = []
+    for opt in opts:
+        opt = _resolve(opt)
+        if isinstance(opt, ArrayObject) and len(opt) == 2:
+            out.append((str(_resolve(opt[0])), str(_resolve(opt[1]))))
+        else:
+            out.append((str(opt), str(opt)))
+    return out
+
+
+def _variable_text(annot: DictionaryObject, ft: str, acroform: Optional[DictionaryObject]) -> Optional[StreamObject]:
+    value = annot.get("/V")
+    if value is None:
+        value = inherited(annot, "/V")
+    text = "" if value is None else str(_resolve(value))
+    flags = int(inherited(annot, "/Ff") or 0)
+
+    da = inherited(annot, "/DA")
+    if da is None and isinstance(acroform, DictionaryObject):
+        da = acroform.get("/DA")
+    font_name, size, color = parse_da(str(da or DEFAULT_DA))
+    font = _find_font(font_name, annot, acroform)
+    q = inherited(annot, "/Q")
+    if q is None and isinstance(acroform, DictionaryObject):
+        q = acroform.get("/Q")
+    quadding = int(q or 0)
+
+    w, h, rotation = _box(annot)
+    border, bw = _border_ops(annot, w, h)
+    pad = PADDING + bw
+    inner = max(0.0, w - 2 * pad)
+    ops = [border] if border else []
+    ops += ["/Tx BMC", "q", f"{_num(bw)} {_num(bw)} {_num(w - 2 * bw)} {_num(h - 2 * bw)} re W n"]
+
+    def x_for(data: bytes, sz: float) -> float:
+        tw = font.width(data, sz)
+        if quadding == 1:
+            return (w - tw) / 2
+        if quadding == 2:
+            return w - pad - tw
+        return pad
+
+    lines: List[Tuple[float, float, bytes]] = []
+    if ft == "/Ch" and not flags & FF_COMBO:
+        # List box: every option from the top, the selected one highlighted
+        options = _choice_display(annot) or [(text, text)]
+        size = size or MULTILINE_AUTO_SIZE
+        step = size * LEADING
+        for i, (export, display) in enumerate(options):
+            top = h - bw - i * step
+            if top <= 0:
+                break
+            if export == text or display == text:
+                ops.append(f"{HIGHLIGHT_RGB} rg {_num(bw)} {_num(top - step)} {_num(w - 2 * bw)} {_num(step)} re f")
+            data = font.encode(display)
+            lines.append((x_for(data, size), top - step + DESCENT * size + (step - size) / 2, data))
+    else:
+        if ft == "/Ch":
+            text = next((display for export, display in _choice_display(annot) if export == text), text)
+        if flags & FF_PASSWORD:
+            text = "*" * len(text)
+        max_len = inherited(annot, "/MaxLen")
+        if ft == "/Tx" and flags & FF_COMB and max_len:
+            # Comb: one character centred per cell
+            cells = int(max_len)
+            cell = w / cells
+            data = font.encode(text)[:cells]
+            size = size or _fit_size(font, b"W", cell + 2 * PADDING, h)
+            y = (h - size) / 2 + DESCENT * size
+            for i in range(len(data)):
+                ch = data[i:i + 1]
+                lines.append((i * cell + (cell - font.width(ch, size)) / 2, y, ch))
+        elif ft == "/Tx" and flags & FF_MULTILINE:
+            size = size or MULTILINE_AUTO_SIZE
+            y = h - pad - (1 - DESCENT) * size
+            for data in _wrap(font, text, size, inner):
+                lines.append((x_for(data, size), y, data))
+                y -= size * LEADING
+        else:
+            data = font.encode(text.replace("\r", " ").replace("\n", " "))
+            size = size or _fit_size(font, data, w - 2 * bw, h - 2 * bw)
+            lines.append((x_for(data, size), (h - size) / 2 + DESCENT * size, data))
+
+    if lines:
+        ops.append(_text_ops(font, size, color, lines))
+    ops += ["Q", "EMC"]
+    return _stream("\n".join(ops), w, h, rotation, font, font.ref)
+
+
+def _checkbox(annot: DictionaryObject) -> Optional[Dict[str, StreamObject]]:
+    state = str(annot.get("/AS", "/Off"))
+    ap = _resolve(annot.get("/AP"))
+    normal = _resolve(ap.get("/N")) if isinstance(ap, DictionaryObject) else None
+    if isinstance(normal, DictionaryObject) and not isinstance(normal, StreamObject) and state in normal:
+        return None  # the form already draws this state
+
+    on_state = state if state != "/Off" else "/Yes"
+    if isinstance(normal, DictionaryObject) and not isinstance(normal, StreamObject):
+        on_state = next((str(k) for k in normal if str(k) != "/Off"), on_state)
+    w, h, rotation = _box(annot)
+    border, _bw = _border_ops(annot, w, h)
+    mk = _resolve(annot.get("/MK"))
+    glyph = str(mk.get("/CA", "4")) if isinstance(mk, DictionaryObject) else "4"
+    size = min(w, h) * 0.8
+    x = (w - _ZAPF_CHECK_WIDTH * size / 1000.0) / 2
+    y = (h - size) / 2 + DESCENT * size
+    zapf = _Font("/ZaDb", None, _zapf())
+    on_ops = (border + "\n" if border else "") + \
+        f"q BT /ZaDb {_num(size)} Tf 0 g 1 0 0 1 {_num(x)} {_num(y)} Tm ({_escape(glyph.encode('latin-1', 'replace')).decode('latin-1')}) Tj ET Q"
+    return {
+        on_state: _stream(on_ops, w, h, rotation, zapf, zapf.ref),
+        "/Off": _stream(border, w, h, rotation),
+    }
+
+
+def build_appearance(annot: DictionaryObject, ft: Optional[str],
+                     acroform: Optional[DictionaryObject]) -> Optional[Dict[Optional[str], StreamObject]]:
+    """
+    New normal appearance for a widget whose /V (and /AS) are already set.
+    Returns {None: stream} for text/choice fields, {state: stream} for
+    checkboxes, or None when the existing appearance should be kept.
+    """
+    if ft == "/Btn":
+        flags = int(inherited(annot, "/Ff") or 0)
+        if flags & (1 << 16):  # push button: nothing to show for a value
+            return None
+        return _checkbox(annot)
+    if ft in ("/Tx", "/Ch") or ft is None:
+        stream = _variable_text(annot, ft or "/Tx", acroform)
+        return {None: stream} if stream is not None else None
+    return None
+
+
+# ----------------------------
+# Flattening
+# ----------------------------
+
+def _normal_appearance(annot: DictionaryObject) -> Any:
+    """The /N appearance to draw (state picked by /AS), unresolved; None if missing."""
+    ap = _resolve(annot.get("/AP"))
+    if not isinstance(ap, DictionaryObject) or "/N" not in ap:
+        return None
+    normal_ref = ap.raw_get("/N")
+    normal = _resolve(normal_ref)
+    if isinstance(normal, StreamObject):
+        return normal_ref
+    if isinstance(normal, DictionaryObject):
+        state = annot.get("/AS")
+        if state is not None and state in normal:
+            return normal.raw_get(state)
+    return None
+
+
+def _placement(annot: DictionaryObject, xobject: StreamObject) -> Optional[str]:
+    """cm operator mapping the appearance's transformed /BBox onto the widget /Rect."""
+    rect = [float(_resolve(x)) for x in _resolve(annot.get("/Rect", []))]
+    bbox = [float(_resolve(x)) for x in _resolve(xobject.get("/BBox", []))]
+    if len(rect) != 4 or len(bbox) != 4:
+        return None
+    a, b, c, d, e, f = [float(_resolve(x)) for x in _resolve(xobject.get("/Matrix", [1, 0, 0, 1, 0, 0]))]
+    corners = [(x * a + y * c + e, x * b + y * d + f) for x in (bbox[0], bbox[2]) for y in (bbox[1], bbox[3])]
+    xs, ys = [p[0] for p in corners], [p[1] for p in corners]
+    bw, bh = max(xs) - min(xs), max(ys) - min(ys)
+    if bw <= 0 or bh <= 0:
+        return None
+    x0, y0 = min(rect[0], rect[2]), min(rect[1], rect[3])
+    sx, sy = abs(rect[2] - rect[0]) / bw, abs(rect[3] - rect[1]) / bh
+    return f"{_num_exact(sx)} 0 0 {_num_exact(sy)} {_num_exact(x0 - min(xs) * sx)} {_num_exact(y0 - min(ys) * sy)} cm"
+
+
+def _num_exact(x: float) -> str:
+    return f"{x:.4f}".rstrip("0").rstrip(".") or "0"
+
+
+def flatten_page(page: DictionaryObject, as_ref: Callable[[Any], IndirectObject]) -> Tuple[bytes, Dict[str, IndirectObject], ArrayObject]:
+    """
+    Plan the flattening of one page's widgets. Returns (content to append,
+    {XObject resource name: appearance ref}, annotations to keep). as_ref
+    turns a direct appearance stream into an indirect reference.
+    """
+    annots = _resolve(page.get("/Annots")) or ArrayObject()
+    ops: List[str] = []
+    xobjects: Dict[str, IndirectObject] = {}
+    keep = ArrayObject()
+    for aref in annots:
+        annot = _resolve(aref)
+        if not isinstance(annot, DictionaryObject) or annot.get("/Subtype") != "/Widget":
+            keep.append(aref)
+            continue
+        if int(annot.get("/F", 0)) & (F_HIDDEN | F_NOVIEW):
+            continue
+        appearance = _normal_appearance(annot)
+        if appearance is None:
+            continue
+        xobject = _resolve(appearance)
+        placement = _placement(annot, xobject) if isinstance(xobject, StreamObject) else None
+        if placement is None:
+            continue
+        name = f"/FlatW{len(xobjects)}"
+        xobjects[name] = appearance if isinstance(appearance, IndirectObject) else as_ref(appearance)
+        ops.append(f"q {placement} {name} Do Q")
+    return "\n".join(ops).encode("latin-1"), xobjects, keep
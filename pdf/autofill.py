@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
-import argparse, json
-from typing import Any, Dict
+import argparse, csv, json, os, re, time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from PyPDF2 import PdfReader, PdfWriter
-from PyPDF2.generic import NameObject, TextStringObject, BooleanObject, IndirectObject
+from PyPDF2.generic import (
+    ArrayObject, BooleanObject, DecodedStreamObject, DictionaryObject, IndirectObject, NameObject,
+    TextStringObject,
+)
+
+from appearance import build_appearance, flatten_page
+from form_data import FORMATS, form_data_bytes
+from incremental_writer import IncrementalUpdate, next_object_number
+from pdf_optimizer import optimize_pdf
+from pdf_source import PdfSource, open_map, open_reader
+from template_registry import TemplateRegistry, fingerprint_reader, inherited, qualified_name, walk_fields
 
 # ---------- helpers ----------
 def resolve(obj):
@@ -39,101 +49,544 @@ def pick_checkbox_on_state(annot_dict) -> NameObject:
                     return NameObject(str(state))
     return NameObject("/Yes")
 
-def load_values(path: str) -> Dict[str, Any]:
-    with open(path, "r", encoding="utf-8-sig") as f:
-        raw = json.load(f)
+def _unwrap_values(raw: Dict[str, Any]) -> Dict[str, Any]:
     out = {}
     for k, v in raw.items():
         out[k] = v.get("V") if isinstance(v, dict) and "V" in v else v
     return out
 
+def load_values(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8-sig") as f:
+        raw = json.load(f)
+    return _unwrap_values(raw)
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Stream records from JSONL (one {name: value} object per line) or CSV
+    (header row = field names). Empty CSV cells leave the template value alone.
+    """
+    if path.lower().endswith(".csv"):
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                yield {k: v for k, v in row.items() if k and v not in (None, "")}
+    else:
+        with open(path, "r", encoding="utf-8-sig") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield _unwrap_values(json.loads(line))
+
+def _set_widget(annot, ft_str: Optional[str], desired: Any) -> None:
+    # /Btn = checkbox/radio
+    if ft_str == "/Btn":
+        truthy = is_true_like(desired)
+        if truthy is None:
+            s = str(desired).strip()
+            if s.startswith("/"):
+                on_state = NameObject(s)
+                annot.update({NameObject("/V"): on_state})
+                annot.update({NameObject("/AS"): on_state})
+            else:
+                annot.update({NameObject("/V"): NameObject("/Off")})
+                annot.update({NameObject("/AS"): NameObject("/Off")})
+        elif truthy:
+            on_state = pick_checkbox_on_state(annot)
+            annot.update({NameObject("/V"): on_state})
+            annot.update({NameObject("/AS"): on_state})
+        else:
+            annot.update({NameObject("/V"): NameObject("/Off")})
+            annot.update({NameObject("/AS"): NameObject("/Off")})
+
+    # /Tx (text) or unknown (some PDFs omit /FT on widget)
+    elif ft_str == "/Tx" or ft_str is None:
+        annot.update({NameObject("/V"): TextStringObject(str(desired))})
+
+    # /Ch (choice: dropdown/list)
+    elif ft_str == "/Ch":
+        annot.update({NameObject("/V"): TextStringObject(str(desired))})
+
+    # else ignore unsupported types
+
+def _same_state(annot, original) -> bool:
+    """True if /V and /AS match the template (None and "" count as equal)."""
+    _annot, v, as_, _ap = original
+    return str(annot.get("/V") or "") == str(v or "") and str(annot.get("/AS") or "") == str(as_ or "")
+
+def _restore(original) -> None:
+    annot, v, as_, ap = original
+    for key, value in (("/V", v), ("/AS", as_), ("/AP", ap)):
+        if value is None:
+            annot.pop(NameObject(key), None)
+        else:
+            annot[NameObject(key)] = value
+
+# ---------- template ----------
+class FormTemplate:
+    """
+    A parsed template that can be filled many times. The widget index (fully
+    qualified field name -> widget annotations with their field type) is
+    built once; each fill restores the widgets the previous fill changed and
+    applies the new values. Values may be keyed by qualified names
+    ("claimant.address.line1") or, as in json_dump2 dumps, by partial /T
+    names; a partial name shared by several fields fills all of them.
+
+    By default the template is cloned into a PdfWriter once and every fill
+    re-serializes that writer. With incremental=True the original bytes are
+    kept and each fill appends only the changed widget objects plus a new
+    xref section (see incremental_writer.py).
+
+    With appearances=True (the default) every filled widget gets a generated
+    /AP stream (see appearance.py) instead of /NeedAppearances. flatten=True
+    draws the widgets into the page content and writes no AcroForm.
+    """
+
+    def __init__(self, pdf_in: PdfSource, incremental: bool = False, appearances: bool = True, flatten: bool = False):
+        if incremental and flatten:
+            raise ValueError("Flattening rewrites pages; use incremental=False")
+        self.incremental = incremental
+        self.appearances = appearances or flatten
+        self.flatten = flatten
+        self.writer = None
+        self._always_dirty: List[IndirectObject] = []
+        self._acroform_owner = None
+        if incremental:
+            # The map is both the reader's input and the bytes copied ahead of each update
+            self._original = open_map(pdf_in)
+            self.reader = PdfReader(self._original)
+            self._first_new = next_object_number(self.reader)
+            root_ref = self.reader.trailer.raw_get("/Root")
+            root = resolve(root_ref)
+            self.acroform = None
+            if "/AcroForm" in root:
+                acroform_ref = root.raw_get("/AcroForm")
+                self.acroform = resolve(acroform_ref)
+                # A direct /AcroForm lives inside the catalog, so rewrite that instead
+                self._acroform_owner = acroform_ref if isinstance(acroform_ref, IndirectObject) else root_ref
+                if not self.appearances:
+                    self.acroform.update({NameObject("/NeedAppearances"): BooleanObject(True)})
+                    self._always_dirty.append(self._acroform_owner)
+            pages = self.reader.pages
+        else:
+            self.reader = open_reader(pdf_in)
+            self.writer = PdfWriter()
+            for page in self.reader.pages:
+                self.writer.add_page(page)
+
+            # Resolve /AcroForm and set NeedAppearances. Cloned after the pages so
+            # /Fields points at the writer's widget copies.
+            self.acroform = None
+            acroform = self.reader.trailer["/Root"].get("/AcroForm")
+            if acroform:
+                self.acroform = resolve(acroform).clone(self.writer)
+                if not self.appearances:
+                    self.acroform.update({NameObject("/NeedAppearances"): BooleanObject(True)})
+                self.writer._root_object.update({NameObject("/AcroForm"): self.writer._add_object(self.acroform)})
+            pages = self.writer.pages
+
+        # Writer mode: one appearance object per (widget, state), rewritten on every fill
+        self._ap_refs: Dict[Tuple[int, Optional[str]], IndirectObject] = {}
+        # Flatten mode: per page, the objects wrapping and extending its content
+        self._flat_streams: Dict[int, Tuple[IndirectObject, IndirectObject]] = {}
+        self._build_index(pages)
+        self._dirty: List[Tuple[Any, Any, Any, Any]] = []
+
+        # Filled widgets get their own streams, so a template's NeedAppearances
+        # is only kept for pre-filled widgets that have no appearance yet
+        if self.appearances and self.acroform is not None and self.acroform.get("/NeedAppearances"):
+            if all("/AP" in annot or annot.get("/V") in (None, "") for annot, *_ in self._originals.values()):
+                self.acroform[NameObject("/NeedAppearances")] = BooleanObject(False)
+                if self.incremental:
+                    self._always_dirty.append(self._acroform_owner)
+
+    def _build_index(self, pages) -> None:
+        """
+        One-time index: fully qualified field name -> [(widget, /FT, owner)],
+        where owner is the indirect object to rewrite when the widget changes.
+        Built from /AcroForm /Fields; widgets missing from /Fields (forms whose
+        /Fields is incomplete) are picked up from the pages and named by their
+        /Parent chain. Partial names (widget /T, else parent /T, as used in
+        json_dump2 dumps) are kept as aliases.
+        """
+        self.widgets: Dict[str, List[Tuple[Any, Optional[str], Any]]] = {}
+        self.aliases: Dict[str, List[Tuple[Any, Optional[str], Any]]] = {}
+        self._originals: Dict[int, Tuple[Any, Any, Any, Any]] = {}
+
+        def add(name, annot, ft, owner, parent):
+            if not name or id(annot) in self._originals:
+                return
+            entry = (annot, ft, owner)
+            self.widgets.setdefault(name, []).append(entry)
+            partial = annot.get("/T")
+            if partial is None and isinstance(parent, DictionaryObject):
+                partial = parent.get("/T")
+            if partial is not None and str(partial) != name:
+                self.aliases.setdefault(str(partial), []).append(entry)
+            self._originals[id(annot)] = (
+                annot, annot.get("/V"), annot.get("/AS"), annot.raw_get("/AP") if "/AP" in annot else None,
+            )
+
+        fields_ref = self.acroform.raw_get("/Fields") if self.acroform is not None and "/Fields" in self.acroform else None
+        fields = resolve(fields_ref)
+        if isinstance(fields, ArrayObject):
+            # Fields held directly in /Fields are written with the array (or the AcroForm)
+            fallback = fields_ref if isinstance(fields_ref, IndirectObject) else self._acroform_owner
+            for name, ft, node, parent, ref, terminal in walk_fields(fields):
+                if terminal and node.get("/Subtype") == "/Widget":
+                    add(name, node, ft, ref or fallback, parent)
+
+        for page in pages:
+            # Resolve /Annots — it can be an IndirectObject to an Array
+            annots_ref = page.get("/Annots")
+            if not annots_ref:
+                continue
+            annots = resolve(annots_ref)
+            if not isinstance(annots, list):
+                continue
+            for aref in annots:
+                annot = resolve(aref)
+                if annot.get("/Subtype") != "/Widget" or id(annot) in self._originals:
+                    continue
+                ft = inherited(annot, "/FT")
+                if isinstance(aref, IndirectObject):
+                    owner = aref
+                elif isinstance(annots_ref, IndirectObject):
+                    owner = annots_ref
+                else:
+                    owner = page.indirect_reference
+                add(qualified_name(annot), annot, str(ft) if ft else None, owner, resolve(annot.get("/Parent")))
+
+    def lookup(self, name: str) -> List[Tuple[Any, Optional[str], Any]]:
+        """Widgets for a fully qualified name, else for a partial (/T) name."""
+        return self.widgets.get(name) or self.aliases.get(name, [])
+
+    def apply(self, values: Dict[str, Any], add_object=None) -> List[Any]:
+        """
+        Undo the previous fill, then set values. Both steps only touch the
+        widgets named in values, so a fill costs O(len(values)), not
+        O(widgets). Returns the indirect objects holding the widgets that
+        were set. add_object registers new appearance streams (incremental
+        mode); by default they go into the template writer.
+        """
+        for original in self._dirty:
+            _restore(original)
+        self._dirty = []
+
+        touched = []
+        for name, desired in values.items():
+            for annot, ft_str, owner in self.lookup(name):
+                original = self._originals[id(annot)]
+                _set_widget(annot, ft_str, desired)
+                if _same_state(annot, original):
+                    # Same value as the template: keep its appearance, nothing to write
+                    _restore(original)
+                    continue
+                self._dirty.append(original)
+                if self.appearances:
+                    self._set_appearance(annot, ft_str, add_object)
+                touched.append(owner)
+        return touched
+
+    def field_values(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Apply values and return {fully qualified name: /V} for every field
+        that holds a value afterwards (template defaults included), without
+        writing a PDF. Unchecked boxes and empty fields are left out.
+        """
+        self.apply(values)
+        out: Dict[str, Any] = {}
+        for name, entries in self.widgets.items():
+            for annot, _ft, _owner in entries:
+                value = resolve(annot.get("/V"))
+                if value is not None and str(value) not in ("", "/Off"):
+                    out[name] = value if isinstance(value, NameObject) else str(value)
+                    break
+        return out
+
+    def _set_appearance(self, annot, ft_str: Optional[str], add_object=None) -> None:
+        streams = build_appearance(annot, ft_str, self.acroform)
+        if not streams:
+            return
+        refs = {}
+        for state, stream in streams.items():
+            if add_object is not None:
+                refs[state] = add_object(stream)
+                continue
+            if self.writer is None:
+                raise ValueError("Incremental templates add appearance streams through add_object")
+            key = (id(annot), state)
+            ref = self._ap_refs.get(key)
+            if ref is None:
+                ref = self._ap_refs[key] = self.writer._add_object(stream)
+            else:
+                stream.indirect_reference = ref
+                self.writer._objects[ref.idnum - 1] = stream
+            refs[state] = ref
+        if None in refs:
+            normal = refs[None]
+        else:
+            normal = DictionaryObject({NameObject(state): ref for state, ref in refs.items()})
+        annot[NameObject("/AP")] = DictionaryObject({NameObject("/N"): normal})
+
+    def _flattened_pages(self) -> Iterator[Any]:
+        """
+        Yield the template pages with widgets burned into their content and
+        removed from /Annots. Each page is restored once the caller (which
+        clones it into an output writer) moves on to the next.
+        """
+        for i, page in enumerate(self.writer.pages):
+            ops, xobjects, keep = flatten_page(page, self.writer._add_object)
+            if not xobjects and len(keep) == len(resolve(page.get("/Annots")) or ()):
+                yield page
+                continue
+
+            saved = {key: page.raw_get(key) for key in ("/Annots", "/Contents", "/Resources") if key in page}
+            if i not in self._flat_streams:
+                self._flat_streams[i] = (self.writer._add_object(DecodedStreamObject()),
+                                         self.writer._add_object(DecodedStreamObject()))
+            head_ref, tail_ref = self._flat_streams[i]
+            head_ref.get_object().set_data(b"q\n")
+            tail_ref.get_object().set_data(b"\nQ\n" + ops + b"\n")
+
+            contents = resolve(saved.get("/Contents"))
+            if isinstance(contents, ArrayObject):
+                parts = list(contents)
+            elif "/Contents" in saved:
+                parts = [saved["/Contents"]]
+            else:
+                parts = []
+            page[NameObject("/Contents")] = ArrayObject([head_ref] + parts + [tail_ref])
+
+            # Shallow copies, so a shared /Resources dict is left untouched
+            resources = DictionaryObject(resolve(saved.get("/Resources")) or {})
+            xobject_dict = DictionaryObject(resolve(resources.get("/XObject")) or {})
+            for name, ref in xobjects.items():
+                xobject_dict[NameObject(name)] = ref
+            resources[NameObject("/XObject")] = xobject_dict
+            page[NameObject("/Resources")] = resources
+            if keep:
+                page[NameObject("/Annots")] = keep
+            else:
+                page.pop(NameObject("/Annots"), None)
+            try:
+                yield page
+            finally:
+                for key in ("/Annots", "/Contents", "/Resources"):
+                    if key in saved:
+                        page[NameObject(key)] = saved[key]
+                    else:
+                        page.pop(NameObject(key), None)
+
+    def fill(self, values: Dict[str, Any], pdf_out: str) -> None:
+        with open(pdf_out, "wb") as f:
+            if self.incremental:
+                update = IncrementalUpdate(self.reader, self._original, self._first_new)
+                touched = self.apply(values, update.add_object)
+                for ref in self._always_dirty + touched:
+                    update.mark(ref)
+                update.write(f)
+            elif self.flatten:
+                self.apply(values)
+                # Only what the flattened pages reference is cloned: no widgets, no AcroForm
+                out = PdfWriter()
+                for page in self._flattened_pages():
+                    out.add_page(page)
+                out.write(f)
+            else:
+                self.apply(values)
+                self.writer.write(f)
+
+    def fill_merged(self, records: Iterable[Dict[str, Any]], pdf_out: str) -> int:
+        """
+        Write every record's pages into one PDF. Each record's fields are put
+        under a parent field "record_<n>" so names stay unique across records
+        (e.g. "record_2.Policy no"). Returns the number of records written.
+        """
+        if self.incremental:
+            raise ValueError("Merged output needs a full rewrite; use incremental=False")
+        merged = PdfWriter()
+        acroform = None
+        parents = ArrayObject()
+        count = 0
+        for count, values in enumerate(records, start=1):
+            self.apply(values)
+            # Forget the previous record's copies so this record gets its own widgets
+            merged._id_translated.pop(id(self.writer), None)
+            for page in (self._flattened_pages() if self.flatten else self.writer.pages):
+                merged.add_page(page)
+            if self.acroform is None or self.flatten:
+                continue
+
+            record_acroform = self.acroform.clone(merged)
+            if acroform is None:
+                acroform = record_acroform
+            parent = DictionaryObject({
+                NameObject("/T"): TextStringObject(f"record_{count}"),
+                NameObject("/Kids"): record_acroform.get("/Fields", ArrayObject()),
+            })
+            parent_ref = merged._add_object(parent)
+            for kid in parent["/Kids"]:
+                resolve(kid)[NameObject("/Parent")] = parent_ref
+            parents.append(parent_ref)
+
+        if acroform is not None:
+            acroform[NameObject("/Fields")] = parents
+            merged._root_object.update({NameObject("/AcroForm"): merged._add_object(acroform)})
+        with open(pdf_out, "wb") as f:
+            merged.write(f)
+        return count
+
 # ---------- main fill ----------
-def fill_pdf_from_values(pdf_in: str, pdf_out: str, values: Dict[str, Any]) -> None:
-    reader = PdfReader(pdf_in)
-    writer = PdfWriter()
-
-    # Resolve /AcroForm and set NeedAppearances
-    acroform = reader.trailer["/Root"].get("/AcroForm")
-    if acroform:
-        acroform_obj = resolve(acroform)
-        acroform_obj.update({NameObject("/NeedAppearances"): BooleanObject(True)})
-        writer._root_object.update({NameObject("/AcroForm"): acroform_obj})
-
-    for page in reader.pages:
-        # Resolve /Annots — it can be an IndirectObject to an Array
-        annots = page.get("/Annots")
-        if annots:
-            annots = resolve(annots)
-            if isinstance(annots, list):
-                for aref in annots:
-                    annot = resolve(aref)
-                    if annot.get("/Subtype") != "/Widget":
-                        continue
-
-                    # Field name may be on widget or its parent
-                    name = None
-                    if "/T" in annot:
-                        name = str(annot["/T"])
-                    elif "/Parent" in annot:
-                        parent = resolve(annot["/Parent"])
-                        if "/T" in parent:
-                            name = str(parent["/T"])
-                    if not name or name not in values:
-                        continue
-
-                    desired = values[name]
-
-                    # Determine field type (prefer widget, else parent)
-                    ft = annot.get("/FT")
-                    if ft is None and "/Parent" in annot:
-                        ft = resolve(annot["/Parent"]).get("/FT")
-                    ft_str = str(ft) if ft else None
-
-                    # /Btn = checkbox/radio
-                    if ft_str == "/Btn":
-                        truthy = is_true_like(desired)
-                        if truthy is None:
-                            s = str(desired).strip()
-                            if s.startswith("/"):
-                                on_state = NameObject(s)
-                                annot.update({NameObject("/V"): on_state})
-                                annot.update({NameObject("/AS"): on_state})
-                            else:
-                                annot.update({NameObject("/V"): NameObject("/Off")})
-                                annot.update({NameObject("/AS"): NameObject("/Off")})
-                        elif truthy:
-                            on_state = pick_checkbox_on_state(annot)
-                            annot.update({NameObject("/V"): on_state})
-                            annot.update({NameObject("/AS"): on_state})
-                        else:
-                            annot.update({NameObject("/V"): NameObject("/Off")})
-                            annot.update({NameObject("/AS"): NameObject("/Off")})
-
-                    # /Tx (text) or unknown (some PDFs omit /FT on widget)
-                    elif ft_str == "/Tx" or ft is None:
-                        annot.update({NameObject("/V"): TextStringObject(str(desired))})
-
-                    # /Ch (choice: dropdown/list)
-                    elif ft_str == "/Ch":
-                        annot.update({NameObject("/V"): TextStringObject(str(desired))})
-
-                    # else ignore unsupported types
-
-        writer.add_page(page)
-
-    with open(pdf_out, "wb") as f:
-        writer.write(f)
+def fill_pdf_from_values(
+    pdf_in: PdfSource,
+    pdf_out: str,
+    values: Dict[str, Any],
+    incremental: bool = False,
+    appearances: bool = True,
+    flatten: bool = False,
+) -> None:
+    FormTemplate(pdf_in, incremental=incremental, appearances=appearances, flatten=flatten).fill(values, pdf_out)
+
+def write_form_data(
+    pdf_in: PdfSource,
+    out_path: str,
+    values: Dict[str, Any],
+    fmt: str,
+    registry: Optional[TemplateRegistry] = None,
+) -> str:
+    """
+    Write just the field values as FDF or XFDF (see form_data.py), naming the
+    template by fingerprint, and keep the template in the registry so the
+    server can merge the data back. Returns the fingerprint.
+    """
+    template = FormTemplate(pdf_in, incremental=True, appearances=False)
+    fingerprint = fingerprint_reader(template.reader)
+    if not fingerprint:
+        raise ValueError("FDF/XFDF output needs a PDF with AcroForm fields")
+    data = form_data_bytes(template.field_values(values), fingerprint, fmt)
+    (registry or TemplateRegistry()).save_pdf(fingerprint, pdf_in)
+    with open(out_path, "wb") as f:
+        f.write(data)
+    return fingerprint
+
+def _output_name(record: Dict[str, Any], index: int, name_field: Optional[str]) -> str:
+    if name_field and record.get(name_field):
+        stem = re.sub(r"[^A-Za-z0-9._-]+", "_", str(record[name_field])).strip("._") or f"record_{index:05d}"
+    else:
+        stem = f"record_{index:05d}"
+    return f"{stem}.pdf"
+
+def fill_batch(
+    pdf_in: str,
+    records: Iterable[Dict[str, Any]],
+    out_dir: Optional[str] = None,
+    merged_out: Optional[str] = None,
+    name_field: Optional[str] = None,
+    incremental: bool = False,
+    appearances: bool = True,
+    flatten: bool = False,
+) -> Dict[str, Any]:
+    """
+    Mail-merge: parse pdf_in once, then fill it with every record. Writes one
+    PDF per record into out_dir, or all records into merged_out.
+    Returns {"records", "seconds", "records_per_sec", "outputs"}.
+    """
+    if bool(out_dir) == bool(merged_out):
+        raise ValueError("Pass exactly one of out_dir or merged_out")
+
+    start = time.perf_counter()
+    template = FormTemplate(pdf_in, incremental=incremental and not merged_out, appearances=appearances, flatten=flatten)
+    outputs: List[str] = []
+    if merged_out:
+        count = template.fill_merged(records, merged_out)
+        outputs.append(merged_out)
+    else:
+        os.makedirs(out_dir, exist_ok=True)
+        count = 0
+        used = set()
+        for count, values in enumerate(records, start=1):
+            name = _output_name(values, count, name_field)
+            if name in used:
+                name = f"{name[:-4]}_{count:05d}.pdf"
+            used.add(name)
+            path = os.path.join(out_dir, name)
+            template.fill(values, path)
+            outputs.append(path)
+
+    seconds = time.perf_counter() - start
+    return {
+        "records": count,
+        "seconds": round(seconds, 3),
+        "records_per_sec": round(count / seconds, 2) if seconds else 0.0,
+        "outputs": outputs,
+    }
+
+def _print_optimized(reports: List[Dict[str, Any]]) -> None:
+    before = sum(r["input_bytes"] for r in reports)
+    after = sum(r["output_bytes"] for r in reports)
+    print(f"Optimized {len(reports)} PDF(s): {before:,} -> {after:,} bytes (saved {before - after:,})")
 
 def main():
     ap = argparse.ArgumentParser(description="Fill PDF (AcroForm) from JSON")
     ap.add_argument("--pdf-in", required=True)
-    ap.add_argument("--pdf-out", required=True)
-    ap.add_argument("--values", required=True, help="JSON {name:value} or {name:{V:..}}")
+    ap.add_argument("--pdf-out", help="Output PDF, or FDF/XFDF with --format (single --values fill)")
+    ap.add_argument("--format", choices=("pdf",) + FORMATS, default="pdf",
+                    help="Single fill: write the filled PDF (default) or only the field values as FDF/XFDF, "
+                         "referring to the template by fingerprint")
+    ap.add_argument("--values", help="JSON {name:value} or {name:{V:..}}")
+    ap.add_argument("--batch", help="JSONL or CSV of records to mail-merge into --pdf-in")
+    ap.add_argument("--out-dir", help="Batch: write one filled PDF per record here")
+    ap.add_argument("--merged-out", help="Batch: write all records into this single PDF")
+    ap.add_argument("--name-field", help="Batch: record field used to name each output file")
+    ap.add_argument("--incremental", action="store_true",
+                    help="Append only the changed objects to the original bytes instead of rewriting the PDF "
+                         "(not with --merged-out)")
+    ap.add_argument("--flatten", action="store_true",
+                    help="Draw the field values into the page content and drop the form (not with --incremental)")
+    ap.add_argument("--need-appearances", action="store_true",
+                    help="Set /NeedAppearances for viewers to draw fields instead of generating /AP streams")
+    ap.add_argument("--optimize", action="store_true",
+                    help="Rewrite each output PDF smaller: merge duplicate objects, compress streams, "
+                         "object streams, drop unused objects (see pdf_optimizer.py; not with --incremental)")
     args = ap.parse_args()
-    values = load_values(args.values)
-    fill_pdf_from_values(args.pdf_in, args.pdf_out, values)
-    print(f"Filled PDF written to {args.pdf_out}")
 
-if __name__ == "__main__":
-    main()
+    if args.incremental and args.flatten:
+        ap.error("--incremental can't be combined with --flatten")
+    if args.incremental and args.optimize:
+        # The optimizer rewrites the whole file, losing the original bytes (and any signatures)
+        ap.error("--incremental can't be combined with --optimize")
+
+    if bool(args.values) == bool(args.batch):
+        ap.error("pass exactly one of --values or --batch")
 
+    if args.values:
+        if not args.pdf_out:
+            ap.error("--values needs --pdf-out")
+        values = load_values(args.values)
+        if args.format != "pdf":
+            fingerprint = write_form_data(args.pdf_in, args.pdf_out, values, args.format)
+            print(f"{args.format.upper()} for template {fingerprint[:12]} written to {args.pdf_out}")
+            return
+        fill_pdf_from_values(args.pdf_in, args.pdf_out, values, incremental=args.incremental,
+                             appearances=not args.need_appearances, flatten=args.flatten)
+        print(f"Filled PDF written to {args.pdf_out}")
+        if args.optimize:
+            _print_optimized([optimize_pdf(args.pdf_out, args.pdf_out)])
+        return
+
+    if args.format != "pdf":
+        ap.error("--format fdf/xfdf is for single --values fills")
+    if bool(args.out_dir) == bool(args.merged_out):
+        ap.error("--batch needs exactly one of --out-dir or --merged-out")
+    if args.incremental and args.merged_out:
+        ap.error("--incremental can't be combined with --merged-out")
+    report = fill_batch(args.pdf_in, iter_records(args.batch), args.out_dir, args.merged_out, args.name_field,
+                        incremental=args.incremental, appearances=not args.need_appearances, flatten=args.flatten)
+    where = args.merged_out or args.out_dir
+    print(f"Filled {report['records']} records in {report['seconds']}s "
+          f"({report['records_per_sec']} records/sec) -> {where}")
+    if args.optimize:
+        _print_optimized([optimize_pdf(path, path) for path in report["outputs"]])
+
+if __name__ == "__main__":
+    from cli_trace import run_main
+    run_main("pdf.autofill", main)
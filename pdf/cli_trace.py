@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Tracing for the pdf/ command-line entry points.
+
+The backend and the agent tools run the pipeline steps (json_dump2, fetchdb,
+autofill, form_data, pdf_optimizer) as subprocesses and pass the current span
+in TRACEPARENT (see tracing.subprocess_env). Importing tracing adopts it, so
+each step's run is recorded as a child span of the stage that started it, and
+exported the same way (TRACE_EXPORT is inherited with the environment).
+Without TRACE_EXPORT the span is a no-op.
+"""
+
+import os
+import sys
+from typing import Callable
+
+# tracing.py lives at the repository root, next to the backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tracing  # noqa: E402
+
+
+def run_main(name: str, main: Callable[[], None]) -> None:
+    """Run a script's main() in a span; a clean sys.exit() is not an error."""
+    with tracing.span(name, **{"process.pid": os.getpid()}) as s:
+        try:
+            main()
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                s.set_attribute("exit_code", e.code)
+                raise
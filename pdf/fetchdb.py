@@ -1,15 +1,24 @@
 #!/usr/bin/env python3
-import argparse, json, re, sys
-from typing import Any, Dict, Optional, Tuple
-from difflib import get_close_matches
+import argparse, json, os, re, sys
+from typing import Any, Dict, Iterable, Optional, Tuple
 
 import boto3
 
+from field_matcher import FieldMatcher
+from mapping_store import DEFAULT_STORE, MappingStore, schema_hash, template_hash
+
+# Bump when the field matcher can return different keys; unpinned stored mappings get recompiled.
+MATCHER_VERSION = 2
+
 
 # ----------------------------
 # Helpers
 # ----------------------------
 
+def _no_log(*args, **kwargs) -> None:
+    pass
+
+
 def load_dump(path: str) -> Dict[str, Dict[str, Any]]:
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
@@ -76,66 +85,77 @@ def acro_checkbox_state(on_token: Optional[str], desired: bool) -> str:
     token = on_token if on_token and on_token != "/Off" else "/Yes"
     return token if desired else "/Off"
 
-def best_match_key(field_name: str, norm_to_original: Dict[str, str]) -> Optional[str]:
-    """Exact normalized match first, then fuzzy close match."""
-    norm = normalize_key(field_name)
-    if norm in norm_to_original:
-        return norm_to_original[norm]
-    
-    # Try partial matching for complex field names
-    candidates = list(norm_to_original.keys())
-    
-    # First try: find candidates that contain the field name as a substring
-    for candidate in candidates:
-        if norm in candidate or candidate in norm:
-            return norm_to_original[candidate]
-    
-    # Second try: fuzzy matching with lower threshold
-    hit = get_close_matches(norm, candidates, n=1, cutoff=0.7)
-    if hit:
-        return norm_to_original[hit[0]]
-    
-    return None
+def best_match_key(field_name: str, matcher: FieldMatcher) -> Optional[str]:
+    """Exact normalized match first, then the best trigram/token match from the index."""
+    return matcher.match(field_name)
 
 
 # ----------------------------
 # Core logic
 # ----------------------------
 
+def _field_title(key: str, field: Dict[str, Any]) -> str:
+    # Use /T if available; otherwise the dict key is the best we have
+    return field.get("T") or key
+
+
+def compile_mapping(
+    dump: Dict[str, Dict[str, Any]],
+    flat_keys: Iterable[str],
+    matcher: Optional[FieldMatcher] = None
+) -> Dict[str, Optional[str]]:
+    """
+    Match every field title to a flattened data key (None when nothing matches).
+    Pass a prebuilt matcher over flat_keys (e.g. profile_store.Profile.matcher) to reuse it.
+    """
+    if matcher is None:
+        matcher = FieldMatcher(flat_keys, normalize=normalize_key)
+    return {
+        _field_title(key, field): best_match_key(_field_title(key, field), matcher)
+        for key, field in dump.items()
+        if _field_title(key, field)
+    }
+
+
 def build_values_from_s3(
     dump: Dict[str, Dict[str, Any]],
-    patient_data: Dict[str, Any]
+    patient_data: Optional[Dict[str, Any]],
+    mapping: Optional[Dict[str, Optional[str]]] = None,
+    flat: Optional[Dict[str, Any]] = None,
+    verbose: bool = True
 ) -> Dict[str, Any]:
     """
     Return a { field_title: value } mapping:
       - Text/choice fields: string value
       - Checkboxes: '/Yes' or '/Off' (AcroForm checkbox states)
+    Pass a precompiled mapping (see compile_mapping / MappingStore) to skip matching,
+    and the already flattened data (e.g. profile_store.Profile.flat) to skip flattening.
+    verbose=False drops the per-field log lines.
     """
-    flat = flatten_dict(patient_data)
-    # Build normalized lookup
-    norm_to_original: Dict[str, str] = {}
-    for k in flat:
-        norm_to_original[normalize_key(k)] = k
+    log = print if verbose else _no_log
+    if flat is None:
+        flat = flatten_dict(patient_data)
+    if mapping is None:
+        mapping = compile_mapping(dump, flat)
 
     out: Dict[str, Any] = {}
     matched_count = 0
     total_fields = len(dump)
 
     for key, field in dump.items():
-        # Use /T if available; otherwise the dict key is the best we have
-        title = field.get("T") or key
+        title = _field_title(key, field)
         if not title:
             continue
 
-        patient_key = best_match_key(title, norm_to_original)
-        if not patient_key:
+        patient_key = mapping.get(title)
+        if not patient_key or patient_key not in flat:
             # No match: skip
-            print(f"No match for field: '{title}'")
+            log(f"No match for field: '{title}'")
             continue
 
         matched_count += 1
         src_value = flat[patient_key]
-        print(f"Matched '{title}' -> '{patient_key}' = {src_value}")
+        log(f"Matched '{title}' -> '{patient_key}' = {src_value}")
         
         # Decide how to encode
         if is_checkbox(field):
@@ -143,23 +163,92 @@ def build_values_from_s3(
             if bool_val is None:
                 # If the patient source is not interpretable as boolean,
                 # prefer not to set it rather than guess.
-                print(f"  Skipping checkbox '{title}' - cannot interpret value as boolean")
+                log(f"  Skipping checkbox '{title}' - cannot interpret value as boolean")
                 continue
             # Discover ON token from existing AS if any
             on_token = field.get("AS")
             checkbox_value = acro_checkbox_state(on_token, bool_val)
             out[title] = checkbox_value
-            print(f"  Checkbox '{title}' -> {checkbox_value}")
+            log(f"  Checkbox '{title}' -> {checkbox_value}")
         else:
             # Text/choice/signature/radio parent: just coerce to str
             text_value = "" if src_value is None else str(src_value)
             out[title] = text_value
-            print(f"  Text field '{title}' -> '{text_value}'")
+            log(f"  Text field '{title}' -> '{text_value}'")
 
-    print(f"\nMatched {matched_count}/{total_fields} fields")
+    log(f"\nMatched {matched_count}/{total_fields} fields")
     return out
 
 
+def load_or_compile_mapping(
+    dump: Dict[str, Dict[str, Any]],
+    patient_data: Optional[Dict[str, Any]],
+    store: MappingStore,
+    source: str = "",
+    profile=None,
+    verbose: bool = True
+) -> Dict[str, Optional[str]]:
+    """
+    Stored mapping for this (template, data schema), compiling and saving it on a miss.
+    With a profile_store.Profile, its flattened keys, schema hash and matcher are
+    reused and patient_data is ignored.
+    """
+    if profile is not None:
+        flat_keys, schema = profile.flat_keys, profile.schema
+    else:
+        flat_keys = list(flatten_dict(patient_data))
+        schema = schema_hash(flat_keys)
+    template = template_hash(dump)
+    mapping, status = store.get_or_compile(
+        template, schema, MATCHER_VERSION,
+        # The matcher is only built (once per profile) when the mapping must be compiled
+        lambda: compile_mapping(dump, flat_keys, profile.matcher if profile is not None else None),
+        source=source,
+    )
+    if verbose:
+        print(f"Mapping {template[:12]}/{schema[:12]}: {status}")
+    return mapping
+
+
+# ----------------------------
+# In-process use
+# ----------------------------
+
+# Kept for the life of the process, so long-running callers prepare each
+# example data file and load each stored mapping once
+_example_profiles = None
+_mapping_store: Optional[MappingStore] = None
+
+
+def merge_example_data(dump_path: str, example_data: str, out_path: str) -> int:
+    """
+    `fetchdb.py --dump <dump_path> --example-data <example_data> --out <out_path>`
+    as a function call, for the backend and the agent's PDF jobs. The example data
+    is flattened once per process and re-read only when the file changes.
+    Returns the number of values written.
+    """
+    global _example_profiles, _mapping_store
+    if _example_profiles is None:
+        # Imported here: profile_store imports this module's helpers
+        from profile_store import JsonFileBackend, ProfileStore
+        _example_profiles = ProfileStore(JsonFileBackend("."))
+    if _mapping_store is None:
+        _mapping_store = MappingStore()
+
+    profile = _example_profiles.get(example_data)
+    if profile is None:
+        raise FileNotFoundError(f"Example data file not found: {example_data}")
+    dump = load_dump(dump_path)
+    mapping = load_or_compile_mapping(
+        dump, None, _mapping_store, source=os.path.basename(example_data), profile=profile, verbose=False
+    )
+    values = build_values_from_s3(dump, None, mapping, flat=profile.flat, verbose=False)
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(values, f, indent=2, ensure_ascii=False)
+    return len(values)
+
+
 # ----------------------------
 # CLI
 # ----------------------------
@@ -170,7 +259,11 @@ def main():
     )
     ap.add_argument("--dump", required=True, help="Path to dump JSON (from your dump script)")
     ap.add_argument("--example-data", default="example_data.json", help="Path to example data JSON")
+    ap.add_argument("--profile", help="Fill from this stored patient profile (see profile_store.py) instead")
+    ap.add_argument("--profiles-db", help="Profile SQLite database (default: PDF_PROFILE_DB / PDF_PROFILE_S3_BUCKET)")
     ap.add_argument("--out", required=True, help="Output values JSON (for your PDF writer)")
+    ap.add_argument("--mappings", default=DEFAULT_STORE, help="Compiled mapping store directory")
+    ap.add_argument("--no-mapping-cache", action="store_true", help="Match from scratch; don't read or update stored mappings")
     args = ap.parse_args()
 
     try:
@@ -179,14 +272,32 @@ def main():
         print(f"ERROR: failed to load dump JSON: {e}", file=sys.stderr)
         sys.exit(1)
 
-    try:
-        with open(args.example_data, "r", encoding="utf-8") as f:
-            patient = json.load(f)
-    except Exception as e:
-        print(f"ERROR: failed to load example data JSON: {e}", file=sys.stderr)
-        sys.exit(2)
+    if args.profile:
+        # Imported here: profile_store imports this module's helpers
+        from profile_store import ProfileStore
+        try:
+            profile = ProfileStore.from_env(args.profiles_db).get(args.profile)
+        except Exception as e:
+            print(f"ERROR: failed to load profile '{args.profile}': {e}", file=sys.stderr)
+            sys.exit(2)
+        if profile is None:
+            print(f"ERROR: no stored profile '{args.profile}'", file=sys.stderr)
+            sys.exit(2)
+        patient, source = profile.data, f"profile:{profile.id}"
+    else:
+        profile = None
+        try:
+            with open(args.example_data, "r", encoding="utf-8") as f:
+                patient = json.load(f)
+        except Exception as e:
+            print(f"ERROR: failed to load example data JSON: {e}", file=sys.stderr)
+            sys.exit(2)
+        source = os.path.basename(args.example_data)
 
-    values = build_values_from_s3(dump, patient)
+    mapping = None
+    if not args.no_mapping_cache:
+        mapping = load_or_compile_mapping(dump, patient, MappingStore(args.mappings), source=source, profile=profile)
+    values = build_values_from_s3(dump, patient, mapping, flat=profile.flat if profile is not None else None)
 
     with open(args.out, "w", encoding="utf-8") as f:
         json.dump(values, f, indent=2, ensure_ascii=False)
@@ -195,4 +306,5 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    from cli_trace import run_main
+    run_main("pdf.fetchdb", main)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Indexed fuzzy matching of PDF field titles to data keys.
+
+fetchdb maps hundreds of field titles onto thousands of flattened data keys.
+Instead of scanning every key per field, the keys are indexed once:
+
+- character trigrams of the normalized key -> inverted index
+- word tokens of the key                   -> inverted index
+
+A query only scores keys sharing at least one trigram or token:
+
+    score = TRIGRAM_WEIGHT * trigram Jaccard + TOKEN_WEIGHT * token overlap
+
+where token overlap is the share of the shorter token set found in the other
+(so "Name" vs "personal_info.full_name" still scores as a containment match).
+Exact normalized matches always win. Ties go to the key whose length is
+closest to the query, then to the lexicographically smallest key, so results
+are deterministic.
+
+NumPy is optional: with it, candidate scoring is vectorized (bincount over
+posting lists); without it a pure-Python path produces identical results.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional speed-up
+    np = None
+
+TRIGRAM_WEIGHT = 0.6
+TOKEN_WEIGHT = 0.4
+DEFAULT_CUTOFF = 0.5
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def default_normalize(s: str) -> str:
+    """Same normalization as fetchdb.normalize_key."""
+    s = s.strip().lower()
+    s = re.sub(r"[\s_]+", " ", s)
+    s = re.sub(r"[^a-z0-9 ]+", "", s)
+    return re.sub(r"\s+", " ", s)
+
+
+def trigrams(norm: str) -> Set[str]:
+    padded = f"  {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def tokens(raw: str) -> Set[str]:
+    # Tokenize the raw key: normalization glues "info.full" into "infofull"
+    return set(_TOKEN_RE.findall(raw.lower()))
+
+
+class FieldMatcher:
+    def __init__(
+        self,
+        keys: Iterable[str],
+        normalize: Callable[[str], str] = default_normalize,
+        cutoff: float = DEFAULT_CUTOFF,
+        use_numpy: Optional[bool] = None,
+    ):
+        self.normalize = normalize
+        self.cutoff = cutoff
+        self.use_numpy = (np is not None) if use_numpy is None else (use_numpy and np is not None)
+
+        # Later keys with the same normalized form win, as in fetchdb's norm_to_original
+        norm_to_original: Dict[str, str] = {}
+        for k in keys:
+            norm_to_original[normalize(k)] = k
+        self.norm_to_original = norm_to_original
+
+        # Candidate ids in sorted order: the lowest id wins a tie on score and length
+        self.norms: List[str] = sorted(norm_to_original)
+        self.originals: List[str] = [norm_to_original[n] for n in self.norms]
+
+        self._tri_index: Dict[str, List[int]] = {}
+        self._tok_index: Dict[str, List[int]] = {}
+        tri_sizes, tok_sizes, lengths = [], [], []
+        for i, norm in enumerate(self.norms):
+            tris = trigrams(norm)
+            toks = tokens(self.originals[i])
+            for t in tris:
+                self._tri_index.setdefault(t, []).append(i)
+            for t in toks:
+                self._tok_index.setdefault(t, []).append(i)
+            tri_sizes.append(len(tris))
+            tok_sizes.append(len(toks))
+            lengths.append(len(norm))
+
+        if self.use_numpy:
+            self._tri_index_np = {t: np.asarray(ids, dtype=np.int64) for t, ids in self._tri_index.items()}
+            self._tok_index_np = {t: np.asarray(ids, dtype=np.int64) for t, ids in self._tok_index.items()}
+            self._tri_sizes = np.asarray(tri_sizes, dtype=np.float64)
+            self._tok_sizes = np.asarray(tok_sizes, dtype=np.float64)
+            self._lengths = np.asarray(lengths, dtype=np.int64)
+        else:
+            self._tri_sizes = tri_sizes
+            self._tok_sizes = tok_sizes
+            self._lengths = lengths
+
+    def __len__(self):
+        return len(self.norms)
+
+    def match(self, field_name: str) -> Optional[str]:
+        best = self.best(field_name)
+        return best[0] if best else None
+
+    def best(self, field_name: str) -> Optional[Tuple[str, float]]:
+        """(original key, score) of the best candidate at or above the cutoff, else None."""
+        norm = self.normalize(field_name)
+        if norm in self.norm_to_original:
+            return self.norm_to_original[norm], 1.0
+        if not self.norms:
+            return None
+
+        q_tris = trigrams(norm)
+        q_toks = tokens(field_name)
+        if self.use_numpy:
+            hit = self._best_numpy(q_tris, q_toks, len(norm))
+        else:
+            hit = self._best_python(q_tris, q_toks, len(norm))
+        if hit is None:
+            return None
+        idx, score = hit
+        if score < self.cutoff:
+            return None
+        return self.originals[idx], score
+
+    @staticmethod
+    def _score(tri_inter, q_tri, c_tri, tok_inter, q_tok, c_tok):
+        jaccard = tri_inter / (q_tri + c_tri - tri_inter) if (q_tri + c_tri - tri_inter) else 0.0
+        shorter = min(q_tok, c_tok)
+        overlap = tok_inter / shorter if shorter else 0.0
+        return TRIGRAM_WEIGHT * jaccard + TOKEN_WEIGHT * overlap
+
+    def _min_tri_inter(self, q_tri):
+        """
+        Fewest shared trigrams that can still reach the cutoff: token overlap adds
+        at most TOKEN_WEIGHT and Jaccard is at most inter / |query trigrams|.
+        """
+        needed = (self.cutoff - TOKEN_WEIGHT) / TRIGRAM_WEIGHT
+        return max(1, math.ceil(needed * q_tri - 1e-9)) if needed > 0 else 0
+
+    def _best_python(self, q_tris, q_toks, q_len):
+        tri_counts = Counter()
+        for t in q_tris:
+            tri_counts.update(self._tri_index.get(t, ()))
+        tok_counts = Counter()
+        for t in q_toks:
+            tok_counts.update(self._tok_index.get(t, ()))
+
+        min_inter = self._min_tri_inter(len(q_tris))
+        if min_inter:
+            candidates = [i for i, c in tri_counts.items() if c >= min_inter]
+        else:
+            candidates = set(tri_counts) | set(tok_counts)
+
+        best = None
+        best_key = None
+        for i in candidates:
+            score = self._score(tri_counts.get(i, 0), len(q_tris), self._tri_sizes[i],
+                                tok_counts.get(i, 0), len(q_toks), self._tok_sizes[i])
+            key = (-score, abs(self._lengths[i] - q_len), i)
+            if best_key is None or key < best_key:
+                best_key, best = key, (i, score)
+        return best
+
+    def _best_numpy(self, q_tris, q_toks, q_len):
+        n = len(self.norms)
+        tri_lists = [self._tri_index_np[t] for t in q_tris if t in self._tri_index_np]
+        tok_lists = [self._tok_index_np[t] for t in q_toks if t in self._tok_index_np]
+        if not tri_lists and not tok_lists:
+            return None
+        tri_inter = np.bincount(np.concatenate(tri_lists), minlength=n).astype(np.float64) \
+            if tri_lists else np.zeros(n)
+        tok_inter = np.bincount(np.concatenate(tok_lists), minlength=n).astype(np.float64) \
+            if tok_lists else np.zeros(n)
+
+        cand = np.flatnonzero((tri_inter > 0) | (tok_inter > 0))
+        ti, ki = tri_inter[cand], tok_inter[cand]
+        union = len(q_tris) + self._tri_sizes[cand] - ti
+        jaccard = np.divide(ti, union, out=np.zeros_like(ti), where=union > 0)
+        shorter = np.minimum(float(len(q_toks)), self._tok_sizes[cand])
+        overlap = np.divide(ki, shorter, out=np.zeros_like(ki), where=shorter > 0)
+        scores = TRIGRAM_WEIGHT * jaccard + TOKEN_WEIGHT * overlap
+
+        # lexsort: last key is primary -> score desc, length gap asc, id asc
+        order = np.lexsort((cand, np.abs(self._lengths[cand] - q_len), -scores))
+        top = order[0]
+        return int(cand[top]), float(scores[top])
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Form-type classification for uploaded insurance PDFs.
+
+Known templates are listed in form_types.json, each bound to a form type, and
+every form type to the data profile used to fill it:
+
+    {
+      "form_types": {"health_declaration": {"data_profile": "health_example_data.json"}, ...},
+      "templates": [{"fingerprint": "...", "form_type": "health_declaration",
+                     "source": "health-declaration-statement.pdf", "tokens": {"policy": 2, ...}}, ...]
+    }
+
+classify() tries, in order:
+
+1. fingerprint: the template fingerprint (template_registry) is looked up in a
+   dict, so a known template is an O(1) exact hit with confidence 1.0
+2. tfidf: otherwise the field names are tokenized and compared with every
+   registered template by TF-IDF cosine similarity, through an inverted index
+   (only templates sharing a token are scored). The best template's form type
+   wins if its similarity reaches MIN_CONFIDENCE; below that the form is
+   'unknown'.
+
+Usage:
+    python form_classifier.py classify "any_form.pdf"
+    python form_classifier.py register medical_claim "Medical Accident Living TPD.pdf" --profile example_data.json
+    python form_classifier.py list
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from field_matcher import tokens
+from json_dump2 import extract_field_objects
+from pdf_source import MappedPdf
+from template_registry import fingerprint_pdf
+
+DEFAULT_CONFIG = os.getenv(
+    "PDF_FORM_TYPES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "form_types.json"),
+)
+DEFAULT_PROFILE = "example_data.json"
+MIN_CONFIDENCE = 0.3
+UNKNOWN = "unknown"
+
+# Words that say nothing about which form this is (generic tool-generated names, grammar)
+STOPWORDS = {
+    "a", "an", "and", "any", "are", "as", "at", "be", "box", "by", "check", "for", "from", "has", "have",
+    "if", "in", "is", "it", "no", "not", "of", "on", "or", "other", "please", "row", "shown", "text",
+    "that", "the", "this", "to", "undefined", "was", "were", "with", "yes", "you", "your",
+}
+
+
+def field_tokens(field_names: Iterable[str]) -> Counter:
+    """Token counts over field names; each token counted once per field."""
+    counts: Counter = Counter()
+    for name in field_names:
+        counts.update(t for t in tokens(name) if len(t) > 1 and not t.isdigit() and t not in STOPWORDS)
+    return counts
+
+
+class FormClassifier:
+    def __init__(self, config_path: str = DEFAULT_CONFIG, min_confidence: float = MIN_CONFIDENCE):
+        self.config_path = config_path
+        self.min_confidence = min_confidence
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                self.config = json.load(f)
+        except (OSError, ValueError):
+            self.config = {}
+        self.config.setdefault("form_types", {})
+        self.config.setdefault("templates", [])
+        self._build()
+
+    def _build(self):
+        templates = self.config["templates"]
+        self._by_fingerprint = {t["fingerprint"]: t for t in templates if t.get("fingerprint")}
+
+        n = len(templates)
+        df: Counter = Counter()
+        for t in templates:
+            df.update(t.get("tokens", {}).keys())
+        # Smoothed IDF; tokens no template has get the maximum weight
+        self._idf = {tok: math.log((1 + n) / (1 + d)) + 1 for tok, d in df.items()}
+        self._unseen_idf = math.log(1 + n) + 1
+
+        self._postings: Dict[str, List[Tuple[int, float]]] = {}
+        self._norms: List[float] = []
+        for i, t in enumerate(templates):
+            weights = {tok: (1 + math.log(c)) * self._idf[tok] for tok, c in t.get("tokens", {}).items() if c > 0}
+            for tok, w in weights.items():
+                self._postings.setdefault(tok, []).append((i, w))
+            self._norms.append(math.sqrt(sum(w * w for w in weights.values())))
+
+    def data_profile(self, form_type: str) -> str:
+        return self.config["form_types"].get(form_type, {}).get("data_profile") or DEFAULT_PROFILE
+
+    def _similarities(self, field_names: Iterable[str]) -> Dict[int, float]:
+        query = field_tokens(field_names)
+        q_weights = {tok: (1 + math.log(c)) * self._idf.get(tok, self._unseen_idf) for tok, c in query.items()}
+        q_norm = math.sqrt(sum(w * w for w in q_weights.values()))
+        if not q_norm:
+            return {}
+        dots: Dict[int, float] = {}
+        for tok, qw in q_weights.items():
+            for i, w in self._postings.get(tok, ()):
+                dots[i] = dots.get(i, 0.0) + qw * w
+        return {i: dot / (q_norm * self._norms[i]) for i, dot in dots.items() if self._norms[i]}
+
+    def classify(self, fields: Dict[str, Any], fingerprint: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Classify a json_dump2 field dump. Returns {"form_type", "confidence",
+        "method" ('fingerprint', 'tfidf' or 'none'), "template" (source of the
+        matching template), "data_profile", "scores" (best similarity per form type)}.
+        """
+        hit = self._by_fingerprint.get(fingerprint) if fingerprint else None
+        if hit is not None:
+            return self._result(hit["form_type"], 1.0, "fingerprint", hit.get("source"), {hit["form_type"]: 1.0})
+
+        templates = self.config["templates"]
+        scores: Dict[str, float] = {}
+        best: Optional[Tuple[float, int]] = None
+        for i, sim in self._similarities(fields.keys()).items():
+            form_type = templates[i]["form_type"]
+            scores[form_type] = max(scores.get(form_type, 0.0), sim)
+            if best is None or sim > best[0]:
+                best = (sim, i)
+        scores = {k: round(v, 3) for k, v in sorted(scores.items(), key=lambda kv: -kv[1])}
+
+        if best is None or best[0] < self.min_confidence:
+            return self._result(UNKNOWN, round(best[0], 3) if best else 0.0, "none", None, scores)
+        template = templates[best[1]]
+        return self._result(template["form_type"], round(best[0], 3), "tfidf", template.get("source"), scores)
+
+    def _result(self, form_type, confidence, method, template, scores) -> Dict[str, Any]:
+        return {
+            "form_type": form_type,
+            "confidence": confidence,
+            "method": method,
+            "template": template,
+            "data_profile": self.data_profile(form_type),
+            "scores": scores,
+        }
+
+    def register(self, form_type: str, fingerprint: Optional[str], fields: Dict[str, Any], source: str,
+                 data_profile: Optional[str] = None) -> Dict[str, Any]:
+        """Add (or replace, by fingerprint) a template of this form type and save the config."""
+        entry = {
+            "fingerprint": fingerprint,
+            "form_type": form_type,
+            "source": os.path.basename(source),
+            "tokens": dict(sorted(field_tokens(fields.keys()).items())),
+        }
+        templates = [t for t in self.config["templates"] if not (fingerprint and t.get("fingerprint") == fingerprint)]
+        templates.append(entry)
+        self.config["templates"] = templates
+        form = self.config["form_types"].setdefault(form_type, {})
+        if data_profile:
+            form["data_profile"] = data_profile
+        form.setdefault("data_profile", DEFAULT_PROFILE)
+        self.save()
+        self._build()
+        return entry
+
+    def save(self):
+        tmp_path = f"{self.config_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.config, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        os.replace(tmp_path, self.config_path)
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+
+def _dump_and_fingerprint(pdf_path: str) -> Tuple[Dict[str, Any], Optional[str]]:
+    with MappedPdf(pdf_path) as source:
+        return extract_field_objects(source), fingerprint_pdf(source)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Classify insurance PDFs by form type")
+    ap.add_argument("--config", default=DEFAULT_CONFIG, help="Form types / registered templates JSON")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    cl = sub.add_parser("classify", help="Print the form type of a PDF")
+    cl.add_argument("pdf")
+    reg = sub.add_parser("register", help="Register a PDF as a template of a form type")
+    reg.add_argument("form_type")
+    reg.add_argument("pdf")
+    reg.add_argument("--profile", help="Data profile (example data JSON) used to fill this form type")
+    sub.add_parser("list", help="List form types and registered templates")
+    args = ap.parse_args()
+
+    classifier = FormClassifier(args.config)
+
+    if args.cmd == "classify":
+        fields, fingerprint = _dump_and_fingerprint(args.pdf)
+        print(json.dumps(classifier.classify(fields, fingerprint), indent=2, ensure_ascii=False))
+    elif args.cmd == "register":
+        if args.form_type == UNKNOWN:
+            print(f"ERROR: '{UNKNOWN}' is reserved", file=sys.stderr)
+            sys.exit(1)
+        fields, fingerprint = _dump_and_fingerprint(args.pdf)
+        if not fields:
+            print(f"ERROR: no form fields found in {args.pdf}", file=sys.stderr)
+            sys.exit(1)
+        entry = classifier.register(args.form_type, fingerprint, fields, args.pdf, args.profile)
+        print(f"Registered {entry['source']} as {args.form_type} "
+              f"({(fingerprint or 'no fingerprint')[:12]}, {len(entry['tokens'])} tokens)")
+    elif args.cmd == "list":
+        for name, form in sorted(classifier.config["form_types"].items()):
+            print(f"{name}  -> {form.get('data_profile', DEFAULT_PROFILE)}")
+            for t in classifier.config["templates"]:
+                if t["form_type"] == name:
+                    print(f"    {(t.get('fingerprint') or '-')[:12]}  {t.get('source', '')}")
+
+
+if __name__ == "__main__":
+    main()
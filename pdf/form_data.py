@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+FDF/XFDF form data: just the field values of a fill, without the PDF.
+
+A client that already holds the blank template needs only the values, a few
+hundred bytes instead of a re-serialized PDF per fill. Both formats name the
+template by its fingerprint (template_registry), as the file reference
+"<fingerprint>.pdf": the /F entry of the FDF dictionary, the <f href> of XFDF.
+
+    %FDF-1.2
+    1 0 obj
+    << /FDF << /F (4dbff0f71d04...pdf) /Fields [ << /T (Policy no) /V (P-000123) >> ... ] >> >>
+
+    <xfdf xmlns="http://ns.adobe.com/xfdf/" xml:space="preserve">
+      <f href="4dbff0f71d04...pdf"/>
+      <fields><field name="Policy no"><value>P-000123</value></field> ...</fields>
+    </xfdf>
+
+Field names are fully qualified and written as the field hierarchy (/Kids,
+nested <field>), checkbox and radio values as their state names. Writing the
+data keeps a copy of the template in the registry, so merge() can rebuild the
+filled PDF on the server for clients that need it.
+
+Usage:
+    python autofill.py --pdf-in form.pdf --pdf-out values.xfdf --values values.json --format xfdf
+    python form_data.py export filled.pdf --out values.fdf [--template blank.pdf]
+    python form_data.py merge values.xfdf --out filled.pdf [--template blank.pdf]
+"""
+
+import argparse
+import re
+import sys
+import xml.etree.ElementTree as ET
+from io import BytesIO
+from typing import Any, Dict, Optional, Tuple
+
+from PyPDF2.generic import (
+    ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject, TextStringObject, read_object,
+)
+
+from pdf_source import PdfSource
+from template_registry import DEFAULT_STORE, TemplateRegistry, fingerprint_pdf
+
+FORMATS = ("fdf", "xfdf")
+MIME_TYPES = {"fdf": "application/vnd.fdf", "xfdf": "application/vnd.adobe.xfdf"}
+XFDF_NS = "http://ns.adobe.com/xfdf/"
+
+_OBJ_RE = re.compile(rb"(\d+)\s+(\d+)\s+obj\b")
+_TRAILER_RE = re.compile(rb"trailer\s*(?=<<)")
+
+
+def _resolve(obj):
+    while isinstance(obj, IndirectObject):
+        obj = obj.get_object()
+    return obj
+
+
+def format_for(path: str) -> str:
+    """'fdf' or 'xfdf' from a file name."""
+    fmt = path.rsplit(".", 1)[-1].lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Not an FDF/XFDF file name: {path}")
+    return fmt
+
+
+def template_href(fingerprint: str) -> str:
+    return f"{fingerprint}.pdf"
+
+
+def _fingerprint_from_href(href: Optional[str]) -> Optional[str]:
+    if not href:
+        return None
+    name = re.split(r"[/\\]", str(href))[-1]
+    return name[:-4] if name.lower().endswith(".pdf") else name
+
+
+def _tree(values: Dict[str, Any]) -> Dict[str, Any]:
+    """{"a.b": v, "a.c": w} -> {"a": {"b": v, "c": w}}; a leaf is ("value", v)."""
+    root: Dict[str, Any] = {}
+    for name, value in values.items():
+        node = root
+        parts = name.split(".")
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            node = child
+        node[parts[-1]] = ("value", value)
+    return root
+
+
+def _text(value: Any) -> str:
+    value = str(value)
+    return value[1:] if value.startswith("/") else value
+
+
+# ----------------------------
+# Write
+# ----------------------------
+
+def fdf_bytes(values: Dict[str, Any], fingerprint: str) -> bytes:
+    """values: {qualified name: /V} (NameObject for button states, else text)."""
+    def fields(tree: Dict[str, Any]) -> ArrayObject:
+        out = ArrayObject()
+        for partial, node in tree.items():
+            field = DictionaryObject({NameObject("/T"): TextStringObject(partial)})
+            if isinstance(node, dict):
+                field[NameObject("/Kids")] = fields(node)
+            else:
+                value = node[1]
+                field[NameObject("/V")] = value if isinstance(value, NameObject) else TextStringObject(str(value))
+            out.append(field)
+        return out
+
+    root = DictionaryObject({NameObject("/FDF"): DictionaryObject({
+        NameObject("/F"): TextStringObject(template_href(fingerprint)),
+        NameObject("/Fields"): fields(_tree(values)),
+    })})
+    out = BytesIO()
+    out.write(b"%FDF-1.2\n%\xe2\xe3\xcf\xd3\n1 0 obj\n")
+    root.write_to_stream(out, None)
+    out.write(b"\nendobj\ntrailer\n<< /Root 1 0 R >>\n%%EOF\n")
+    return out.getvalue()
+
+
+def xfdf_bytes(values: Dict[str, Any], fingerprint: str) -> bytes:
+    ET.register_namespace("", XFDF_NS)
+    root = ET.Element(f"{{{XFDF_NS}}}xfdf", {"xml:space": "preserve"})
+    ET.SubElement(root, f"{{{XFDF_NS}}}f", {"href": template_href(fingerprint)})
+
+    def add(parent, tree: Dict[str, Any]) -> None:
+        for partial, node in tree.items():
+            field = ET.SubElement(parent, f"{{{XFDF_NS}}}field", {"name": partial})
+            if isinstance(node, dict):
+                add(field, node)
+            else:
+                ET.SubElement(field, f"{{{XFDF_NS}}}value").text = _text(node[1])
+
+    add(ET.SubElement(root, f"{{{XFDF_NS}}}fields"), _tree(values))
+    return ET.tostring(root, encoding="utf-8", xml_declaration=True) + b"\n"
+
+
+def form_data_bytes(values: Dict[str, Any], fingerprint: str, fmt: str) -> bytes:
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown form data format '{fmt}' (expected one of {', '.join(FORMATS)})")
+    return fdf_bytes(values, fingerprint) if fmt == "fdf" else xfdf_bytes(values, fingerprint)
+
+
+def filled_values(pdf_path: PdfSource) -> Dict[str, Any]:
+    """
+    {qualified name: /V} of every field holding a value in a filled PDF;
+    unchecked boxes and empty fields are left out.
+    """
+    from autofill import FormTemplate
+
+    return FormTemplate(pdf_path, incremental=True, appearances=False).field_values({})
+
+
+def export_pdf(pdf_path: PdfSource, fmt: str, template: Optional[PdfSource] = None,
+               registry: Optional[TemplateRegistry] = None) -> bytes:
+    """
+    FDF/XFDF of a filled PDF's values. The template (default: the filled PDF
+    itself) gives the fingerprint and is kept in the registry for merge().
+    """
+    template = template or pdf_path
+    fingerprint = fingerprint_pdf(template)
+    if not fingerprint:
+        raise ValueError("FDF/XFDF needs a PDF with AcroForm fields")
+    values = filled_values(pdf_path)
+    (registry or TemplateRegistry()).save_pdf(fingerprint, template)
+    return form_data_bytes(values, fingerprint, fmt)
+
+
+# ----------------------------
+# Read
+# ----------------------------
+
+class _FdfObjects:
+    """The numbered objects of an FDF file, resolved on demand (enough for read_object)."""
+
+    strict = False
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offsets = {int(m.group(1)): m.end() for m in _OBJ_RE.finditer(data)}
+        self._cache: Dict[int, Any] = {}
+
+    def get_object(self, ref: IndirectObject) -> Any:
+        if ref.idnum not in self._cache:
+            if ref.idnum not in self.offsets:
+                return None
+            stream = BytesIO(self.data)
+            stream.seek(self.offsets[ref.idnum])
+            _skip_whitespace(stream)
+            self._cache[ref.idnum] = read_object(stream, self)
+        return self._cache[ref.idnum]
+
+    def root(self) -> Any:
+        m = None
+        for m in _TRAILER_RE.finditer(self.data):
+            pass
+        if m is not None:
+            stream = BytesIO(self.data)
+            stream.seek(m.end())
+            trailer = read_object(stream, self)
+            if isinstance(trailer, DictionaryObject) and "/Root" in trailer:
+                return _resolve(trailer["/Root"])
+        first = min(self.offsets) if self.offsets else None
+        return self.get_object(IndirectObject(first, 0, self)) if first is not None else None
+
+
+def _skip_whitespace(stream) -> None:
+    while True:
+        ch = stream.read(1)
+        if not ch or ch not in b" \t\r\n\f\x00":
+            stream.seek(-1 if ch else 0, 1)
+            return
+
+
+def read_fdf(data: bytes) -> Tuple[Optional[str], Dict[str, Any]]:
+    root = _FdfObjects(data).root()
+    fdf = _resolve(root.get("/FDF")) if isinstance(root, DictionaryObject) else None
+    if not isinstance(fdf, DictionaryObject):
+        raise ValueError("Not an FDF file: no /FDF dictionary")
+    spec = _resolve(fdf.get("/F"))
+    if isinstance(spec, DictionaryObject):
+        spec = spec.get("/UF") or spec.get("/F")
+    values: Dict[str, Any] = {}
+
+    def walk(fields, prefix: str) -> None:
+        for item in _resolve(fields) or []:
+            field = _resolve(item)
+            if not isinstance(field, DictionaryObject):
+                continue
+            partial = field.get("/T")
+            name = f"{prefix}.{partial}" if prefix and partial is not None else str(partial or prefix)
+            if "/Kids" in field:
+                walk(field["/Kids"], name)
+            if "/V" in field and name:
+                value = _resolve(field["/V"])
+                if isinstance(value, ArrayObject):
+                    value = [str(v) for v in value]
+                elif isinstance(value, (NumberObject, int, float)):
+                    value = str(value)
+                values[name] = value if isinstance(value, (NameObject, list)) else str(value)
+
+    walk(fdf.get("/Fields"), "")
+    return _fingerprint_from_href(spec), values
+
+
+def read_xfdf(data: bytes) -> Tuple[Optional[str], Dict[str, Any]]:
+    root = ET.fromstring(data)
+    ns = root.tag[:root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+    f = root.find(f"{ns}f")
+    values: Dict[str, Any] = {}
+
+    def walk(parent, prefix: str) -> None:
+        for field in parent.findall(f"{ns}field"):
+            name = f"{prefix}.{field.get('name')}" if prefix else field.get("name", "")
+            found = [v.text or "" for v in field.findall(f"{ns}value")]
+            if found and name:
+                values[name] = found[0] if len(found) == 1 else found
+            walk(field, name)
+
+    fields = root.find(f"{ns}fields")
+    if fields is not None:
+        walk(fields, "")
+    return _fingerprint_from_href(f.get("href") if f is not None else None), values
+
+
+def read_form_data(data: bytes) -> Tuple[Optional[str], Dict[str, Any]]:
+    """(template fingerprint, {qualified name: value}) from FDF or XFDF bytes."""
+    head = data.lstrip()[:64]
+    if head.startswith(b"%FDF") or head.startswith(b"%PDF"):
+        return read_fdf(data)
+    if head.startswith(b"<"):
+        return read_xfdf(data)
+    raise ValueError("Not FDF or XFDF data")
+
+
+# ----------------------------
+# Merge
+# ----------------------------
+
+def merge(data: bytes, pdf_out: str, template: Optional[PdfSource] = None,
+          registry: Optional[TemplateRegistry] = None) -> Dict[str, Any]:
+    """
+    Fill the template named by FDF/XFDF data (looked up in the registry by
+    fingerprint, unless given) with its values and write the PDF.
+    Returns {"fingerprint", "template", "fields"}.
+    """
+    from autofill import FormTemplate
+
+    fingerprint, values = read_form_data(data)
+    if template is None:
+        if not fingerprint:
+            raise ValueError("Form data names no template")
+        template = (registry or TemplateRegistry()).pdf_path(fingerprint)
+        if template is None:
+            raise LookupError(f"Template {fingerprint[:12]} is not in the registry")
+
+    form = FormTemplate(template)
+    fill: Dict[str, Any] = {}
+    for name, value in values.items():
+        widgets = form.lookup(name)
+        if isinstance(value, list):
+            value = value[0] if value else ""
+        # XFDF carries button states without the leading slash
+        if widgets and widgets[0][1] == "/Btn" and not str(value).startswith("/"):
+            value = f"/{value}"
+        fill[name] = value
+    form.fill(fill, pdf_out)
+    return {"fingerprint": fingerprint, "template": template, "fields": len(fill)}
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Export and merge FDF/XFDF form data")
+    ap.add_argument("--registry", default=DEFAULT_STORE, help="Template registry directory")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    exp = sub.add_parser("export", help="Write the values of a filled PDF as FDF/XFDF")
+    exp.add_argument("pdf")
+    exp.add_argument("--out", required=True, help="Output .fdf or .xfdf file")
+    exp.add_argument("--format", choices=FORMATS, help="Default: from the --out extension")
+    exp.add_argument("--template", help="Blank template to keep for merges (default: the filled PDF)")
+    mrg = sub.add_parser("merge", help="Fill the template an FDF/XFDF file refers to")
+    mrg.add_argument("data")
+    mrg.add_argument("--out", required=True, help="Output PDF")
+    mrg.add_argument("--template", help="Template PDF (default: looked up by fingerprint)")
+    args = ap.parse_args()
+
+    registry = TemplateRegistry(args.registry)
+    try:
+        if args.cmd == "export":
+            data = export_pdf(args.pdf, args.format or format_for(args.out), args.template, registry)
+            with open(args.out, "wb") as f:
+                f.write(data)
+            print(f"Wrote {len(data)} bytes of form data to {args.out}")
+        else:
+            with open(args.data, "rb") as f:
+                result = merge(f.read(), args.out, args.template, registry)
+            print(f"Merged {result['fields']} values into template {(result['fingerprint'] or '-')[:12]} "
+                  f"-> {args.out}")
+    except (ValueError, LookupError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    from cli_trace import run_main
+    run_main("pdf.form_data", main)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Incremental-update PDF output.
+
+Instead of re-serializing every page, an incremental update copies the
+original bytes unchanged and appends only the objects that were modified or
+added, followed by a new cross-reference section whose trailer points back to
+the original one with /Prev (PDF 32000-1:2008, 7.5.6). Output cost scales
+with the number of changed objects, not the size of the document.
+
+The appended section matches the original's last cross-reference section: a
+classic xref table after a table, an xref stream after an xref stream, so
+readers that handle the original also handle the update.
+
+Modified objects are the PdfReader's own cached objects, edited in place,
+and are marked with mark(ref). New objects get fresh numbers from add_object().
+The original may be bytes or any read-only buffer, e.g. the memory map the
+reader parses (pdf_source.py); it is written out without being copied.
+"""
+
+import re
+import struct
+import zlib
+from io import BytesIO
+from typing import Dict, Iterable, List, Tuple
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (
+    ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject, PdfObject,
+)
+
+_STARTXREF_RE = re.compile(rb"startxref\s+(\d+)")
+
+
+def last_startxref(data: bytes) -> int:
+    matches = _STARTXREF_RE.findall(data[-2048:]) or _STARTXREF_RE.findall(data)
+    if not matches:
+        raise ValueError("startxref not found")
+    return int(matches[-1])
+
+
+def next_object_number(reader: PdfReader) -> int:
+    """First object number not used by the original file."""
+    size = int(reader.trailer.get("/Size", 0))
+    for entries in reader.xref.values():
+        if entries:
+            size = max(size, max(entries) + 1)
+    if reader.xref_objStm:
+        size = max(size, max(reader.xref_objStm) + 1)
+    return size
+
+
+def _subsections(numbers: List[int]) -> List[Tuple[int, int]]:
+    """Sorted object numbers -> [(first, count)] runs of consecutive numbers."""
+    runs: List[Tuple[int, int]] = []
+    for n in numbers:
+        if runs and runs[-1][0] + runs[-1][1] == n:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((n, 1))
+    return runs
+
+
+class _OffsetBuffer(BytesIO):
+    """BytesIO whose tell() counts from a base offset in the final file."""
+
+    def __init__(self, base: int):
+        super().__init__()
+        self.base = base
+
+    def tell(self) -> int:
+        return self.base + super().tell()
+
+
+class IncrementalUpdate:
+    def __init__(self, reader: PdfReader, original, first_new_number: int = None):
+        if reader.is_encrypted:
+            raise ValueError("Incremental updates of encrypted PDFs are not supported")
+        self.reader = reader
+        self.original = original
+        self.prev = last_startxref(original)
+        self.xref_is_stream = not original[self.prev:self.prev + 4].startswith(b"xref")
+        self._next = first_new_number if first_new_number is not None else next_object_number(reader)
+        self._dirty: Dict[Tuple[int, int], None] = {}
+        self._new: Dict[int, PdfObject] = {}
+
+    def mark(self, ref: IndirectObject) -> None:
+        """Write the current state of this (in-place modified) object."""
+        self._dirty[(ref.idnum, ref.generation)] = None
+
+    def add_object(self, obj: PdfObject) -> IndirectObject:
+        ref = IndirectObject(self._next, 0, self.reader)
+        self._new[self._next] = obj
+        self._next += 1
+        return ref
+
+    @property
+    def changed_objects(self) -> int:
+        return len(self._dirty) + len(self._new)
+
+    def _trailer_entries(self, size: int) -> DictionaryObject:
+        trailer = DictionaryObject({
+            NameObject("/Size"): NumberObject(size),
+            NameObject("/Root"): self.reader.trailer.raw_get("/Root"),
+            NameObject("/Prev"): NumberObject(self.prev),
+        })
+        for key in ("/Info", "/ID"):
+            if key in self.reader.trailer:
+                trailer[NameObject(key)] = self.reader.trailer.raw_get(key)
+        return trailer
+
+    def write(self, stream) -> None:
+        """Original bytes, then the changed objects and the new xref section."""
+        stream.write(self.original)
+        size = len(self.original)
+        if self.original[-1:] not in (b"\n", b"\r"):
+            stream.write(b"\n")
+            size += 1
+
+        # Offsets are absolute; the appended part is built separately so the
+        # original bytes are written once and never copied
+        out = _OffsetBuffer(size)
+        offsets: Dict[int, Tuple[int, int]] = {}
+        objects: Iterable[Tuple[int, int, PdfObject]] = [
+            (idnum, gen, self.reader.get_object(IndirectObject(idnum, gen, self.reader)))
+            for idnum, gen in self._dirty
+        ] + [(idnum, 0, obj) for idnum, obj in self._new.items()]
+        for idnum, gen, obj in objects:
+            offsets[idnum] = (out.tell(), gen)
+            out.write(f"{idnum} {gen} obj\n".encode())
+            obj.write_to_stream(out, None)
+            out.write(b"\nendobj\n")
+
+        if self.xref_is_stream:
+            self._write_xref_stream(out, offsets)
+        else:
+            self._write_xref_table(out, offsets)
+        stream.write(out.getvalue())
+
+    def _write_xref_table(self, out: _OffsetBuffer, offsets: Dict[int, Tuple[int, int]]) -> None:
+        xref_offset = out.tell()
+        # Free-list head first, as readers expect a section that starts at object 0
+        out.write(b"xref\n0 1\n0000000000 65535 f \n")
+        for first, count in _subsections(sorted(offsets)):
+            out.write(f"{first} {count}\n".encode())
+            for n in range(first, first + count):
+                offset, gen = offsets[n]
+                out.write(f"{offset:010d} {gen:05d} n \n".encode())
+        out.write(b"trailer\n")
+        self._trailer_entries(self._next).write_to_stream(out, None)
+        out.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+    def _write_xref_stream(self, out: _OffsetBuffer, offsets: Dict[int, Tuple[int, int]]) -> None:
+        # The xref stream is itself an object and lists its own offset
+        xref_num = self._next
+        xref_offset = out.tell()
+        offsets = dict(offsets)
+        offsets[xref_num] = (xref_offset, 0)
+
+        numbers = sorted(offsets)
+        rows = b"".join(
+            struct.pack(">BIH", 1, offsets[n][0], offsets[n][1]) for n in numbers
+        )
+        data = zlib.compress(rows)
+        index = ArrayObject()
+        for first, count in _subsections(numbers):
+            index.extend([NumberObject(first), NumberObject(count)])
+
+        header = self._trailer_entries(xref_num + 1)
+        header.update({
+            NameObject("/Type"): NameObject("/XRef"),
+            NameObject("/W"): ArrayObject([NumberObject(1), NumberObject(4), NumberObject(2)]),
+            NameObject("/Index"): index,
+            NameObject("/Filter"): NameObject("/FlateDecode"),
+            NameObject("/Length"): NumberObject(len(data)),
+        })
+        out.write(f"{xref_num} 0 obj\n".encode())
+        header.write_to_stream(out, None)
+        out.write(b"\nstream\n")
+        out.write(data)
+        out.write(b"\nendstream\nendobj\n")
+        out.write(f"startxref\n{xref_offset}\n%%EOF\n".encode())
@@ -1,8 +1,16 @@
 import argparse, json
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from PyPDF2 import PdfReader
 from PyPDF2.generic import IndirectObject, ArrayObject, DictionaryObject
 
+from pdf_source import PdfSource, open_reader
+from template_registry import (
+    DEFAULT_STORE, TemplateRegistry, field_nodes, fingerprint_reader, live_values,
+)
+
+# Bump when the widget dump format changes; older registry dumps become misses.
+DUMP_VERSION = 1
+
 
 def _resolve(obj):
     """Resolve a PyPDF2 object to its underlying value (one hop)."""
@@ -65,103 +73,294 @@ def _is_noise(name: Optional[str]) -> bool:
     return False
 
 
-def extract_field_objects(pdf_path: str) -> Dict[str, Dict[str, Any]]:
+def extract_field_objects(pdf_path: PdfSource, walk_pages: bool = False) -> Dict[str, Dict[str, Any]]:
     """
     Extract fields keyed by /T (field name).
     Skip checkboxes and undefined names.
     """
+    return _extract_from_reader(open_reader(pdf_path), walk_pages)
+
+
+def _extract_from_reader(
+    reader: PdfReader, walk_pages: bool = False, nodes: Optional[List[Tuple]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Read the widgets from /AcroForm /Fields, falling back to walking every
+    page's /Annots when the field tree can't be trusted (or walk_pages=True).
+    Both produce the same dump (see _extract_from_acroform for the one exception).
+    """
+    if not walk_pages:
+        out = _extract_from_acroform(reader, nodes)
+        if out is not None:
+            return out
+    return _extract_from_pages(reader)
+
+
+def _widget_name(annot: DictionaryObject) -> Optional[str]:
+    """Widget /T, else its parent's /T."""
+    if annot.get("/T"):
+        return _str_or_none(annot.get("/T"))
+    parent = _resolve(annot.get("/Parent"))
+    if isinstance(parent, DictionaryObject) and parent.get("/T"):
+        return _str_or_none(parent.get("/T"))
+    return None
+
+
+def _widget_entry(annot: DictionaryObject, page_idx: int) -> Dict[str, Any]:
+    return {
+        "page": page_idx,
+        "rect": _float_list_or_none(annot.get("/Rect")),
+        "T": _str_or_none(annot.get("/T")),
+        "V": _str_or_none(annot.get("/V")),
+        "DV": _str_or_none(annot.get("/DV")),
+        "AS": _str_or_none(annot.get("/AS")),
+        "FT": _str_or_none(annot.get("/FT")),
+        "Ff": annot.get("/Ff"),
+    }
+
+
+def _add_page_widgets(out: Dict[str, Dict[str, Any]], page_idx: int, page: DictionaryObject) -> None:
+    for i, annot in enumerate(_iter_annots(page), start=1):
+        field_name = _widget_name(annot) or f"unnamed_{page_idx}_{i}"
+        if _is_noise(field_name):
+            continue
+        out[field_name] = _widget_entry(annot, page_idx)
+
+
+def _extract_from_pages(reader: PdfReader) -> Dict[str, Dict[str, Any]]:
     out: Dict[str, Dict[str, Any]] = {}
-    with open(pdf_path, "rb") as f:
-        reader = PdfReader(f)
-
-        for page_idx, page in enumerate(reader.pages):
-            for i, annot in enumerate(_iter_annots(page), start=1):
-                # field name
-                field_name = None
-                if annot.get("/T"):
-                    field_name = _str_or_none(annot.get("/T"))
+    for page_idx, page in enumerate(reader.pages):
+        _add_page_widgets(out, page_idx, page)
+
+    return out
+
+
+class _PageLocator:
+    """
+    Page of a widget from its /P reference, computed on demand: only the
+    page's ancestors in the /Pages tree (and their /Kids) are read, and each
+    /Pages node's kid offsets only once. Widgets without a usable /P (it is
+    optional) are looked up in an index of every page's /Annots references,
+    built once; the annotations themselves are not read.
+    """
+
+    def __init__(self, reader: PdfReader):
+        self.reader = reader
+        self._offsets: Dict[Tuple[int, int], Dict[Tuple[int, int], int]] = {}
+        self._pages: Dict[Tuple[int, int], Optional[int]] = {}
+        self._annots: Dict[Tuple[int, int], set] = {}
+        self._by_ref: Optional[Dict[Tuple[int, int], Tuple[int, DictionaryObject]]] = None
+
+    @staticmethod
+    def _key(ref) -> Optional[Tuple[int, int]]:
+        return (ref.idnum, ref.generation) if isinstance(ref, IndirectObject) else None
+
+    def _kid_offsets(self, node_ref) -> Dict[Tuple[int, int], int]:
+        key = self._key(node_ref)
+        if key is None:
+            return {}
+        if key not in self._offsets:
+            offsets, offset = {}, 0
+            node = _resolve(node_ref)
+            kids = _resolve(node.get("/Kids")) if isinstance(node, DictionaryObject) else None
+            for kid in kids if isinstance(kids, ArrayObject) else ():
+                kid_key = self._key(kid)
+                if kid_key is not None:
+                    offsets[kid_key] = offset
+                kid_obj = _resolve(kid)
+                if isinstance(kid_obj, DictionaryObject) and kid_obj.get("/Type") == "/Pages":
+                    offset += int(kid_obj.get("/Count", 0))
                 else:
-                    parent = _resolve(annot.get("/Parent"))
-                    if isinstance(parent, DictionaryObject) and parent.get("/T"):
-                        field_name = _str_or_none(parent.get("/T"))
-                if not field_name:
-                    field_name = f"unnamed_{page_idx}_{i}"
-
-                if _is_noise(field_name):
-                    continue
-
-                out[field_name] = {
-                    "page": page_idx,
-                    "rect": _float_list_or_none(annot.get("/Rect")),
-                    "T": _str_or_none(annot.get("/T")),
-                    "V": _str_or_none(annot.get("/V")),
-                    "DV": _str_or_none(annot.get("/DV")),
-                    "AS": _str_or_none(annot.get("/AS")),
-                    "FT": _str_or_none(annot.get("/FT")),
-                    "Ff": annot.get("/Ff"),
-                }
+                    offset += 1
+            self._offsets[key] = offsets
+        return self._offsets[key]
+
+    def _page_index(self, page_ref) -> Optional[int]:
+        key = self._key(page_ref)
+        if key is None:
+            return None
+        if key not in self._pages:
+            index, node_ref, seen = 0, page_ref, set()
+            while index is not None:
+                node = _resolve(node_ref)
+                if not isinstance(node, DictionaryObject) or "/Parent" not in node:
+                    break
+                if self._key(node_ref) in seen:
+                    index = None
+                    break
+                seen.add(self._key(node_ref))
+                parent_ref = node.raw_get("/Parent")
+                offset = self._kid_offsets(parent_ref).get(self._key(node_ref))
+                index = None if offset is None else index + offset
+                node_ref = parent_ref
+            self._pages[key] = index
+        return self._pages[key]
+
+    def _lists(self, page_ref, widget_ref) -> bool:
+        """Whether the page's /Annots holds the widget (page walking only sees those)."""
+        key = self._key(page_ref)
+        if key not in self._annots:
+            page = _resolve(page_ref)
+            annots = _resolve(page.raw_get("/Annots")) if "/Annots" in page else None
+            self._annots[key] = {
+                self._key(a) for a in (annots if isinstance(annots, ArrayObject) else ())
+            }
+        return self._key(widget_ref) in self._annots[key]
+
+    def locate(self, page_ref, widget_ref) -> Optional[Tuple[int, DictionaryObject]]:
+        """(index, page) of the page showing the widget, or None if no page does."""
+        page_idx = self._page_index(page_ref)
+        if page_idx is not None and self._lists(page_ref, widget_ref):
+            return page_idx, _resolve(page_ref)
+        if self._by_ref is None:
+            self._by_ref = {}
+            for page_idx, page in enumerate(self.reader.pages):
+                annots = _resolve(page.raw_get("/Annots")) if "/Annots" in page else None
+                for a in annots if isinstance(annots, ArrayObject) else ():
+                    if self._key(a) is not None:
+                        self._by_ref.setdefault(self._key(a), (page_idx, page))
+        return self._by_ref.get(self._key(widget_ref))
 
+
+def _extract_from_acroform(
+    reader: PdfReader, nodes: Optional[List[Tuple]] = None,
+) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Dump of only the pages that show a field: the field tree tells which pages
+    those are (through each widget's /P), and just their annotations are read.
+    The result is what page walking gives, except that widgets missing from
+    /Fields are only found on pages that also show a listed field.
+    Returns None when the tree can't be trusted: no /Fields, entries that
+    aren't fields, unnamed widgets, or no widget shown on any page.
+    """
+    if nodes is None:
+        nodes = field_nodes(reader)
+    if not nodes:
+        return None
+
+    locator = _PageLocator(reader)
+    pages: Dict[int, DictionaryObject] = {}
+    for _name, _ft, node, _parent, ref, terminal in nodes:
+        if not terminal:
+            continue
+        if node.get("/Subtype") != "/Widget":
+            if "/T" in node or "/FT" in node:
+                continue  # a field without widgets: not on any page
+            return None  # fonts, streams, ... listed as fields
+        if not _widget_name(node) or ref is None or _resolve(ref) is not node:
+            return None
+        located = locator.locate(node.raw_get("/P") if "/P" in node else None, ref)
+        if located is not None:
+            pages.setdefault(*located)
+
+    if not pages:
+        return None
+
+    out: Dict[str, Dict[str, Any]] = {}
+    for page_idx in sorted(pages):
+        _add_page_widgets(out, page_idx, pages[page_idx])
     return out
 
 
-def extract_acroform_hierarchy(pdf_path: str) -> List[Dict[str, Any]]:
-    """Dump /AcroForm /Fields hierarchy (parents + kids)."""
-    rows: List[Dict[str, Any]] = []
-    with open(pdf_path, "rb") as f:
-        reader = PdfReader(f)
-        root = reader.trailer.get("/Root")
-        acro = _resolve(root.get("/AcroForm")) if root else None
-        fields = _resolve(acro.get("/Fields")) if isinstance(acro, DictionaryObject) else None
-        if not isinstance(fields, ArrayObject):
-            return rows
-
-        def walk(field_obj, path=""):
-            fld = _resolve(field_obj)
-            if not isinstance(fld, DictionaryObject):
-                return
-            name = _str_or_none(fld.get("/T"))
-            full_path = f"{path}.{name}" if path and name else (name or path or "<no-name>")
-
-            if not _is_noise(name):
-                rows.append({
-                    "path": full_path,
-                    "T": name,
-                    "FT": _str_or_none(fld.get("/FT")),
-                    "V": _str_or_none(fld.get("/V")),
-                    "DV": _str_or_none(fld.get("/DV")),
-                    "Ff": fld.get("/Ff"),
-                    "Kids": len(_resolve(fld.get("/Kids"))) if _resolve(fld.get("/Kids")) else 0,
-                })
-
-            kids = _resolve(fld.get("/Kids"))
-            if isinstance(kids, ArrayObject):
-                for k in kids:
-                    walk(k, full_path)
-
-        for fref in fields:
-            walk(fref, "")
+def extract_dump(
+    pdf_path: PdfSource,
+    registry: Optional[TemplateRegistry] = None,
+    walk_pages: bool = False,
+    hierarchy: bool = False,
+) -> Tuple[Dict[str, Dict[str, Any]], Optional[List[Dict[str, Any]]], Optional[str], bool]:
+    """
+    Widget dump and (if hierarchy=True) hierarchy rows from one parse of the
+    PDF, with the field tree walked once for the fingerprint, the widgets and
+    the hierarchy. Returns (fields, hierarchy rows or None, fingerprint,
+    cache_hit); the registry is skipped when None.
+    """
+    reader = open_reader(pdf_path)
+    nodes = field_nodes(reader)
+    rows = _hierarchy_rows(nodes) if hierarchy else None
+    if registry is None:
+        return _extract_from_reader(reader, walk_pages, nodes), rows, None, False
 
+    fingerprint = fingerprint_reader(reader, nodes)
+    if fingerprint is None:
+        return _extract_from_reader(reader, walk_pages, nodes), rows, None, False
+
+    cached = registry.lookup(fingerprint, DUMP_VERSION)
+    if cached is not None:
+        for name, values in live_values(reader, nodes).items():
+            if name in cached:
+                cached[name].update(values)
+        return cached, rows, fingerprint, True
+
+    fields = _extract_from_reader(reader, walk_pages, nodes)
+
+    registry.register(fingerprint, DUMP_VERSION, fields, pdf_path)
+    return fields, rows, fingerprint, False
+
+
+def extract_field_objects_cached(
+    pdf_path: PdfSource, registry: TemplateRegistry, walk_pages: bool = False
+) -> Tuple[Dict[str, Dict[str, Any]], Optional[str], bool]:
+    """
+    Like extract_field_objects, but reuse the registry's dump for known templates.
+    Returns (fields, fingerprint, cache_hit). Cached dumps get this PDF's current
+    /V, /DV and /AS so partially filled uploads are reported correctly.
+    """
+    fields, _rows, fingerprint, hit = extract_dump(pdf_path, registry, walk_pages)
+    return fields, fingerprint, hit
+
+
+def _hierarchy_rows(nodes: List[Tuple]) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    for full_path, _ft, fld, _parent, _ref, terminal in nodes:
+        name = _str_or_none(fld.get("/T"))
+        if _is_noise(name):
+            continue
+        # walk_fields already resolved /Kids; only parents need the count
+        kids = None if terminal else _resolve(fld.get("/Kids"))
+        rows.append({
+            "path": full_path,
+            "T": name,
+            "FT": _str_or_none(fld.get("/FT")),
+            "V": _str_or_none(fld.get("/V")),
+            "DV": _str_or_none(fld.get("/DV")),
+            "Ff": fld.get("/Ff"),
+            "Kids": len(kids) if kids else 0,
+        })
     return rows
 
 
+def extract_acroform_hierarchy(pdf_path: PdfSource) -> List[Dict[str, Any]]:
+    """Dump /AcroForm /Fields hierarchy (parents + kids)."""
+    return _hierarchy_rows(field_nodes(open_reader(pdf_path)))
+
+
 def main():
     ap = argparse.ArgumentParser(description="Dump AcroForm fields to JSON (cleaned)")
     ap.add_argument("--pdf", required=True, help="Input PDF with AcroForm fields")
     ap.add_argument("--out", required=True, help="Output JSON file for widget dump")
     ap.add_argument("--out-hierarchy", help="Optional JSON file for AcroForm hierarchy dump")
+    ap.add_argument("--registry", default=DEFAULT_STORE, help="Template registry directory")
+    ap.add_argument("--no-registry", action="store_true", help="Always re-extract; don't read or update the registry")
+    ap.add_argument("--walk-pages", action="store_true",
+                    help="Find widgets by walking every page's /Annots instead of /AcroForm /Fields")
     args = ap.parse_args()
 
-    widgets = extract_field_objects(args.pdf)
+    registry = None if args.no_registry else TemplateRegistry(args.registry)
+    widgets, hierarchy, fingerprint, hit = extract_dump(
+        args.pdf, registry, args.walk_pages, hierarchy=bool(args.out_hierarchy)
+    )
+    if fingerprint:
+        print(f"Template {fingerprint[:12]}: {'registry hit' if hit else 'registered'}")
     with open(args.out, "w", encoding="utf-8") as f:
         json.dump(widgets, f, indent=2, ensure_ascii=False)
     print(f"Wrote {len(widgets)} widget entries to {args.out}")
 
     if args.out_hierarchy:
-        hierarchy = extract_acroform_hierarchy(args.pdf)
         with open(args.out_hierarchy, "w", encoding="utf-8") as f:
             json.dump(hierarchy, f, indent=2, ensure_ascii=False)
         print(f"Wrote {len(hierarchy)} hierarchy rows to {args.out_hierarchy}")
 
 
 if __name__ == "__main__":
-    main()
+    from cli_trace import run_main
+    run_main("pdf.json_dump2", main)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Persisted field-to-data mappings for fetchdb.py.
+
+Matching every PDF field against every patient-data key is the slow part of
+the merge step. A mapping is compiled once per (template, data schema) and
+stored; later runs fill each field with one dict lookup.
+
+- template: SHA-256 over the dump's field keys, /T and /FT (values ignored)
+- schema:   SHA-256 over the sorted flattened data keys (values ignored)
+
+    mappings/<template>/<schema>.json   {"mapping": {field title: data key | null}, ...}
+
+Unmatched fields are stored as null so misses are not re-matched either.
+A mapping compiled by an older MATCHER_VERSION is recompiled on next use
+unless it is pinned; pinned mappings (and fields set by hand) are kept as-is.
+
+pin, unpin and remove change what later fills produce, so each one bumps the
+counter in mappings/generation. Caches of filled PDFs include it in their keys.
+
+Usage:
+    python mapping_store.py list
+    python mapping_store.py show <template>/<schema>
+    python mapping_store.py pin <template>/<schema> [--set "Field title=data.key" ...]
+    python mapping_store.py unpin <template>/<schema>
+    python mapping_store.py remove <template>/<schema>
+
+Ids may be shortened to any unique prefix, e.g. 40a448d76dc3/9b1f0c2e.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_STORE = os.getenv(
+    "PDF_MAPPING_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "mappings"),
+)
+GENERATION_FILE = "generation"
+
+
+def _sha256_json(data: Any) -> str:
+    payload = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def template_hash(dump: Dict[str, Dict[str, Any]]) -> str:
+    return _sha256_json(sorted(
+        (key, field.get("T") or "", field.get("FT") or "") for key, field in dump.items()
+    ))
+
+
+def schema_hash(flat_keys: Iterable[str]) -> str:
+    return _sha256_json(sorted(flat_keys))
+
+
+class MappingStore:
+    def __init__(self, store_dir: str = DEFAULT_STORE):
+        self.store_dir = store_dir
+        # (template, schema) -> entry, kept until another process pins, unpins or removes one
+        self._memo: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._memo_generation = read_generation(store_dir)
+
+    def _path(self, template: str, schema: str) -> str:
+        return os.path.join(self.store_dir, template, f"{schema}.json")
+
+    def load(self, template: str, schema: str) -> Optional[Dict[str, Any]]:
+        generation = self.generation()
+        if generation != self._memo_generation:
+            self._memo = {}
+            self._memo_generation = generation
+        entry = self._memo.get((template, schema))
+        if entry is None:
+            try:
+                with open(self._path(template, schema), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self._memo[(template, schema)] = entry
+        return entry
+
+    def preload(self) -> int:
+        """Read every stored mapping into memory (e.g. before forking workers)."""
+        return len(self.list())
+
+    def save(self, entry: Dict[str, Any]):
+        path = self._path(entry["template"], entry["schema"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._memo[(entry["template"], entry["schema"])] = entry
+
+    def get_or_compile(self, template: str, schema: str, matcher_version: int, compile_fn, source: str = ""):
+        """
+        Return (mapping, status) where status is 'hit', 'pinned' or 'compiled'.
+        compile_fn() builds {field title: data key | None} on a miss.
+        """
+        entry = self.load(template, schema)
+        if entry is not None:
+            if entry.get("pinned"):
+                return entry["mapping"], "pinned"
+            if entry.get("matcher_version") == matcher_version:
+                return entry["mapping"], "hit"
+
+        mapping = compile_fn()
+        # Hand-set fields survive recompiles
+        overrides = (entry or {}).get("overrides", {})
+        mapping.update(overrides)
+        self.save({
+            "template": template,
+            "schema": schema,
+            "matcher_version": matcher_version,
+            "compiled": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source": source,
+            "pinned": False,
+            "overrides": overrides,
+            "mapping": mapping,
+        })
+        return mapping, "compiled"
+
+    def list(self) -> List[Dict[str, Any]]:
+        rows = []
+        if not os.path.isdir(self.store_dir):
+            return rows
+        for template in sorted(os.listdir(self.store_dir)):
+            tdir = os.path.join(self.store_dir, template)
+            if not os.path.isdir(tdir):
+                continue
+            for fname in sorted(os.listdir(tdir)):
+                if fname.endswith(".json"):
+                    entry = self.load(template, fname[:-5])
+                    if entry:
+                        rows.append(entry)
+        return rows
+
+    def resolve(self, ident: str) -> Optional[Dict[str, Any]]:
+        """Entry for '<template prefix>/<schema prefix>' if exactly one matches."""
+        t_prefix, _, s_prefix = ident.partition("/")
+        matches = [
+            e for e in self.list()
+            if e["template"].startswith(t_prefix) and e["schema"].startswith(s_prefix)
+        ]
+        return matches[0] if len(matches) == 1 else None
+
+    def remove(self, template: str, schema: str):
+        self._memo.pop((template, schema), None)
+        os.remove(self._path(template, schema))
+        tdir = os.path.join(self.store_dir, template)
+        if not os.listdir(tdir):
+            shutil.rmtree(tdir)
+        self.mark_changed()
+
+    def generation(self) -> int:
+        return read_generation(self.store_dir)
+
+    def mark_changed(self) -> int:
+        """Bump the store generation after a change by hand (pin, unpin, remove)."""
+        generation = self.generation() + 1
+        os.makedirs(self.store_dir, exist_ok=True)
+        path = os.path.join(self.store_dir, GENERATION_FILE)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(generation))
+        os.replace(tmp_path, path)
+        self._memo_generation = generation
+        return generation
+
+
+def read_generation(store_dir: str = DEFAULT_STORE) -> int:
+    """Counter bumped by every pin, unpin and remove in the store (0 if never changed)."""
+    try:
+        with open(os.path.join(store_dir, GENERATION_FILE), "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+
+def _short_id(entry: Dict[str, Any]) -> str:
+    return f"{entry['template'][:12]}/{entry['schema'][:12]}"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect and pin compiled field-to-data mappings")
+    ap.add_argument("--store", default=DEFAULT_STORE, help="Mapping store directory")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="List compiled mappings")
+    for name, help_text in (("show", "Print a mapping"),
+                            ("pin", "Freeze a mapping so it is never recompiled"),
+                            ("unpin", "Allow recompiling on matcher changes again"),
+                            ("remove", "Delete a mapping")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("id", help="<template>/<schema>, prefixes allowed")
+        if name == "pin":
+            p.add_argument("--set", action="append", default=[], metavar="TITLE=KEY",
+                           help="Map a field title to a data key by hand (empty KEY = leave unfilled)")
+    args = ap.parse_args()
+
+    store = MappingStore(args.store)
+
+    if args.cmd == "list":
+        for e in store.list():
+            matched = sum(1 for v in e["mapping"].values() if v)
+            flags = " pinned" if e.get("pinned") else ""
+            print(f"{_short_id(e)}  matcher v{e['matcher_version']}  "
+                  f"{matched}/{len(e['mapping'])} matched  {e['compiled']}  {e.get('source', '')}{flags}")
+        return
+
+    entry = store.resolve(args.id)
+    if entry is None:
+        print(f"ERROR: no unique mapping matches '{args.id}'", file=sys.stderr)
+        sys.exit(1)
+
+    if args.cmd == "show":
+        print(json.dumps(entry, indent=2, ensure_ascii=False))
+    elif args.cmd in ("pin", "unpin"):
+        entry["pinned"] = args.cmd == "pin"
+        for spec in getattr(args, "set", []):
+            title, sep, key = spec.partition("=")
+            if not sep:
+                print(f"ERROR: expected TITLE=KEY, got '{spec}'", file=sys.stderr)
+                sys.exit(1)
+            entry["mapping"][title] = key or None
+            entry.setdefault("overrides", {})[title] = key or None
+        store.save(entry)
+        store.mark_changed()
+        print(f"{'Pinned' if entry['pinned'] else 'Unpinned'} {_short_id(entry)}")
+    elif args.cmd == "remove":
+        store.remove(entry["template"], entry["schema"])
+        print(f"Removed {_short_id(entry)}")
+
+
+if __name__ == "__main__":
+    main()
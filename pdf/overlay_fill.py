@@ -0,0 +1,620 @@
+#!/usr/bin/env python3
+"""
+Overlay filling for flat (non-AcroForm) PDFs.
+
+Many insurer forms are printed-style PDFs with no form fields: just labels
+and blank lines in the page content. For these, the field layout is detected
+from the text layer and values are drawn over the page:
+
+1. layout: the page content is walked once to find each text run's position,
+   size and glyph extents, and field boxes are derived from the labels:
+   - leaders: "Name of insured ________" or "Policy no. ..........", the box
+     is the leader itself
+   - colons: "Date of birth:" followed by blank space, the box runs from the
+     label to the next text on the line (or the page margin)
+   Each box becomes a json_dump2-style dump entry keyed by its label
+   ({"page", "rect", "T", "FT": "/Tx", "size", ...}), so fetchdb maps data
+   onto it like onto AcroForm fields.
+2. cache: layouts are stored by a fingerprint of the pages' raw content
+   streams and media boxes, in a TemplateRegistry directory of their own
+   (PDF_LAYOUT_STORE, default layouts/). A repeat upload of the same form is
+   fingerprinted without decoding any content and skips step 1 entirely.
+3. fill: every page with values gets one content stream drawing all of them
+   in Helvetica (shrunk to fit the box), appended after the original content
+   (wrapped in q/Q) as an incremental update: the original bytes are copied
+   unchanged, followed by the changed page objects and the new streams.
+
+Usage:
+    python overlay_fill.py layout "flat_form.pdf" --out fields.json
+    python overlay_fill.py fill --pdf-in "flat_form.pdf" --pdf-out "flat_form_filled.pdf" --values values.json
+    python template_registry.py --store layouts list
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+from PyPDF2 import PdfReader
+from PyPDF2._cmap import build_char_map
+from PyPDF2.generic import (
+    ArrayObject, ContentStream, DecodedStreamObject, DictionaryObject, FloatObject, IndirectObject,
+    NameObject, NumberObject, StreamObject,
+)
+
+from appearance import DESCENT, PADDING, _Font, _escape, _helvetica, _num
+from autofill import load_values
+from incremental_writer import IncrementalUpdate, next_object_number
+from pdf_source import PdfSource, open_map
+from template_registry import TemplateRegistry
+
+DEFAULT_LAYOUT_STORE = os.getenv(
+    "PDF_LAYOUT_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "layouts"),
+)
+
+# Bump when layout detection changes; older cached layouts become misses.
+LAYOUT_VERSION = 1
+
+# Runs closer than this (in font sizes) on one line are one phrase
+PHRASE_GAP = 1.0
+# Same line if baselines differ by less than this (in font sizes)
+LINE_TOLERANCE = 0.35
+# Colon boxes narrower than this (in font sizes) are not fields
+MIN_BOX = 3.0
+# Longer "labels" are prose ending in a colon ("... agree to the following:")
+MAX_LABEL_WORDS = 10
+MIN_TEXT_SIZE = 5.0
+MAX_TEXT_SIZE = 11.0
+# Distance kept from the page edge when a colon box runs to the margin
+PAGE_MARGIN = 36.0
+MAX_XOBJECT_DEPTH = 5
+
+_LEADER_RE = re.compile(r"_{3,}|\.{5,}|…{2,}")
+_NAME_TRIM = " \t:._…"
+
+
+def _resolve(obj):
+    while isinstance(obj, IndirectObject):
+        obj = obj.get_object()
+    return obj
+
+
+def _mult(m: List[float], n: List[float]) -> List[float]:
+    """Matrix product m x n of two PDF matrices [a b c d e f]."""
+    return [
+        m[0] * n[0] + m[1] * n[2], m[0] * n[1] + m[1] * n[3],
+        m[2] * n[0] + m[3] * n[2], m[2] * n[1] + m[3] * n[3],
+        m[4] * n[0] + m[5] * n[2] + n[4], m[4] * n[1] + m[5] * n[3] + n[5],
+    ]
+
+
+# ----------------------------
+# Text layer
+# ----------------------------
+
+class _TextFont:
+    """Decoding and glyph advances of a page font, for positioning text runs."""
+
+    def __init__(self, name: str, holder: Any):
+        resources = _resolve(holder.get("/Resources")) if isinstance(holder, DictionaryObject) else None
+        fonts = _resolve(resources.get("/Font")) if isinstance(resources, DictionaryObject) else None
+        font = _resolve(fonts.get(name)) if isinstance(fonts, DictionaryObject) else None
+        self.font = font if isinstance(font, DictionaryObject) else DictionaryObject()
+        self.two_byte = self.font.get("/Subtype") == "/Type0"
+        self.widths: Dict[int, float] = {}
+        self.default_width = 500.0
+        # Standard 14 fonts may come without /Widths; measure those as Helvetica
+        self.standard: Optional[_Font] = None
+        if self.two_byte:
+            descendants = _resolve(self.font.get("/DescendantFonts")) or []
+            cid_font = _resolve(descendants[0]) if descendants else DictionaryObject()
+            self.default_width = float(cid_font.get("/DW", 1000))
+            self._read_w(_resolve(cid_font.get("/W")) or [])
+        else:
+            first = int(self.font.get("/FirstChar", 0))
+            for i, w in enumerate(_resolve(self.font.get("/Widths")) or []):
+                self.widths[first + i] = float(_resolve(w))
+            if not self.widths:
+                self.standard = _Font(name, None, None)
+        try:
+            _subtype, _half_space, self.encoding, self.charmap, _font = build_char_map(name, 200.0, holder)
+        except Exception:
+            self.encoding, self.charmap = "charmap", {}
+
+    def _read_w(self, w: List[Any]) -> None:
+        # /W: c [w1 w2 ...] or c_first c_last w
+        i = 0
+        while i < len(w):
+            start = int(_resolve(w[i]))
+            nxt = _resolve(w[i + 1]) if i + 1 < len(w) else None
+            if isinstance(nxt, list):
+                for j, width in enumerate(nxt):
+                    self.widths[start + j] = float(_resolve(width))
+                i += 2
+            elif i + 2 < len(w):
+                for code in range(start, int(nxt) + 1):
+                    self.widths[code] = float(_resolve(w[i + 2]))
+                i += 3
+            else:
+                break
+
+    def codes(self, data: bytes) -> List[Tuple[int, bytes]]:
+        if self.two_byte:
+            return [((data[i] << 8) | (data[i + 1] if i + 1 < len(data) else 0), data[i:i + 2])
+                    for i in range(0, len(data), 2)]
+        return [(b, bytes((b,))) for b in data]
+
+    def width(self, code: int) -> float:
+        if code in self.widths:
+            return self.widths[code]
+        if self.standard is not None and code < 256:
+            return self.standard.width(bytes((code,)), 1000.0)
+        return self.default_width
+
+    def decode(self, raw: bytes) -> str:
+        """Unicode text of one code, as PyPDF2's text extraction decodes it."""
+        if isinstance(self.encoding, str):
+            try:
+                text = raw.decode(self.encoding, "surrogatepass")
+            except Exception:
+                text = raw.decode("latin-1")
+        else:
+            text = "".join(self.encoding.get(b, chr(b)) for b in raw)
+        return "".join(self.charmap.get(ch, ch) for ch in text)
+
+
+class _Run:
+    """A string shown by one text operator: baseline, size and per-character x positions."""
+
+    __slots__ = ("y", "size", "text", "xs")
+
+    def __init__(self, y: float, size: float):
+        self.y = y
+        self.size = size
+        self.text = ""
+        # xs[i] is where text[i] starts; xs[-1] where the run ends
+        self.xs: List[float] = []
+
+    def copy(self) -> "_Run":
+        run = _Run(self.y, self.size)
+        run.text, run.xs = self.text, list(self.xs)
+        return run
+
+    def add(self, x0: float, x1: float, text: str) -> None:
+        if not text:
+            return
+        step = (x1 - x0) / len(text)
+        if self.xs:
+            self.xs.pop()
+        self.xs.extend(x0 + step * i for i in range(len(text)))
+        self.xs.append(x1)
+        self.text += text
+
+    @property
+    def x0(self) -> float:
+        return self.xs[0]
+
+    @property
+    def x1(self) -> float:
+        return self.xs[-1]
+
+
+def _as_bytes(operand: Any) -> bytes:
+    if isinstance(operand, bytes):
+        return operand
+    try:
+        # Strings PyPDF2 decoded while parsing keep the bytes the font needs
+        return operand.original_bytes
+    except Exception:
+        return str(operand).encode("latin-1", errors="replace")
+
+
+def _text_runs(reader: PdfReader, holder: DictionaryObject, contents: Any, ctm: List[float],
+               runs: List[_Run], depth: int = 0) -> None:
+    """
+    Walk a content stream (page or form XObject) and append a _Run per
+    horizontal text operator. Tracks the graphics and text state needed to
+    place text: q/Q, cm, BT, Tf, Tm, Td/TD/T*, TL, Tc, Tw, Tz, Ts.
+    """
+    try:
+        operations = ContentStream(contents, reader).operations
+    except Exception:
+        return
+    fonts: Dict[str, _TextFont] = {}
+    stack: List[Tuple] = []
+    font: Optional[_TextFont] = None
+    size = leading = char_space = word_space = rise = 0.0
+    scale = 1.0
+    tm = tlm = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+
+    def show(data: bytes, run: Optional[_Run] = None) -> _Run:
+        nonlocal tm
+        m = _mult([size * scale, 0.0, 0.0, size, 0.0, rise], _mult(tm, ctm))
+        if run is None:
+            run = _Run(m[5], abs(m[3]) or abs(m[1]))
+        if font is None:
+            return run
+        for code, raw in font.codes(data):
+            advance = (font.width(code) / 1000.0 * size + char_space
+                       + (word_space if raw == b" " else 0.0)) * scale
+            start = _mult(tm, ctm)[4]
+            tm = _mult([1.0, 0.0, 0.0, 1.0, advance, 0.0], tm)
+            run.add(start, _mult(tm, ctm)[4], font.decode(raw))
+        return run
+
+    def keep(run: _Run) -> None:
+        # Rotated or vertical text is never a form label
+        m = _mult(tm, ctm)
+        if run.text.strip() and abs(m[1]) < 1e-3 and abs(m[2]) < 1e-3 and m[0] > 0:
+            runs.append(run)
+
+    for operands, operator in operations:
+        try:
+            if operator == b"q":
+                stack.append((ctm, font, size, leading, char_space, word_space, scale, rise))
+            elif operator == b"Q":
+                if stack:
+                    ctm, font, size, leading, char_space, word_space, scale, rise = stack.pop()
+            elif operator == b"cm":
+                ctm = _mult([float(x) for x in operands], ctm)
+            elif operator == b"BT":
+                tm = tlm = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+            elif operator == b"Tf":
+                name = str(operands[0])
+                if name not in fonts:
+                    fonts[name] = _TextFont(name, holder)
+                font, size = fonts[name], float(operands[1])
+            elif operator == b"Tm":
+                tm = tlm = [float(x) for x in operands]
+            elif operator in (b"Td", b"TD"):
+                tx, ty = float(operands[0]), float(operands[1])
+                if operator == b"TD":
+                    leading = -ty
+                tm = tlm = _mult([1.0, 0.0, 0.0, 1.0, tx, ty], tlm)
+            elif operator == b"T*":
+                tm = tlm = _mult([1.0, 0.0, 0.0, 1.0, 0.0, -leading], tlm)
+            elif operator == b"TL":
+                leading = float(operands[0])
+            elif operator == b"Tc":
+                char_space = float(operands[0])
+            elif operator == b"Tw":
+                word_space = float(operands[0])
+            elif operator == b"Tz":
+                scale = float(operands[0]) / 100.0
+            elif operator == b"Ts":
+                rise = float(operands[0])
+            elif operator in (b"Tj", b"'", b'"'):
+                if operator != b"Tj":
+                    if operator == b'"':
+                        word_space, char_space = float(operands[0]), float(operands[1])
+                    tm = tlm = _mult([1.0, 0.0, 0.0, 1.0, 0.0, -leading], tlm)
+                keep(show(_as_bytes(operands[-1])))
+            elif operator == b"TJ":
+                run = None
+                for item in operands[0]:
+                    if isinstance(item, (NumberObject, FloatObject, int, float)):
+                        shift = -float(item) / 1000.0 * size * scale
+                        tm = _mult([1.0, 0.0, 0.0, 1.0, shift, 0.0], tm)
+                        # A wide negative kern is how many generators write a space
+                        if run is not None and float(item) < -200 and not run.text.endswith(" "):
+                            x = _mult(tm, ctm)[4]
+                            run.add(run.x1, x, " ")
+                    else:
+                        run = show(_as_bytes(item), run)
+                if run is not None:
+                    keep(run)
+            elif operator == b"Do" and depth < MAX_XOBJECT_DEPTH:
+                resources = _resolve(holder.get("/Resources"))
+                xobjects = _resolve(resources.get("/XObject")) if isinstance(resources, DictionaryObject) else None
+                xobject = _resolve(xobjects.get(str(operands[0]))) if isinstance(xobjects, DictionaryObject) else None
+                if isinstance(xobject, StreamObject) and xobject.get("/Subtype") == "/Form":
+                    matrix = [float(x) for x in _resolve(xobject.get("/Matrix", [1, 0, 0, 1, 0, 0]))]
+                    sub_holder = xobject if "/Resources" in xobject else holder
+                    _text_runs(reader, sub_holder, xobject, _mult(matrix, ctm), runs, depth + 1)
+        except (IndexError, TypeError, ValueError, ZeroDivisionError):
+            continue
+
+
+def page_text_runs(reader: PdfReader, page: DictionaryObject) -> List[_Run]:
+    """Horizontal text runs of a page, in default user space."""
+    contents = _resolve(page.get("/Contents"))
+    if contents is None:
+        return []
+    if isinstance(contents, ArrayObject) and not len(contents):
+        return []
+    runs: List[_Run] = []
+    _text_runs(reader, page, contents, [1.0, 0.0, 0.0, 1.0, 0.0, 0.0], runs)
+    return runs
+
+
+# ----------------------------
+# Layout
+# ----------------------------
+
+def _lines(runs: List[_Run]) -> List[List[_Run]]:
+    """
+    Group runs into lines (by baseline) and merge neighbouring runs of a line
+    into phrases, so labels split across operators read as one.
+    """
+    lines: List[List[_Run]] = []
+    for run in sorted(runs, key=lambda r: (-r.y, r.x0)):
+        if lines and abs(lines[-1][0].y - run.y) <= LINE_TOLERANCE * max(run.size, lines[-1][0].size):
+            lines[-1].append(run)
+        else:
+            lines.append([run])
+
+    phrases: List[List[_Run]] = []
+    for line in lines:
+        merged: List[_Run] = []
+        for run in sorted(line, key=lambda r: r.x0):
+            prev = merged[-1] if merged else None
+            gap = run.x0 - prev.x1 if prev else None
+            if prev is None or gap > PHRASE_GAP * max(run.size, prev.size) or gap < -prev.size:
+                merged.append(run.copy())
+                continue
+            if gap > 0.15 * run.size and not prev.text.endswith(" ") and not run.text.startswith(" "):
+                prev.add(prev.x1, run.x0, " ")
+            prev.xs.pop()
+            prev.xs.extend(run.xs)
+            prev.text += run.text
+            prev.size = max(prev.size, run.size)
+        phrases.append(merged)
+    return phrases
+
+
+def _label(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip(_NAME_TRIM)
+
+
+def _box(page_idx: int, label: str, x0: float, x1: float, baseline: float, size: float) -> Dict[str, Any]:
+    size = round(min(max(size, MIN_TEXT_SIZE), MAX_TEXT_SIZE), 1)
+    rect = [round(x0, 1), round(baseline - DESCENT * size, 1), round(x1, 1), round(baseline + size, 1)]
+    return {"page": page_idx, "rect": rect, "T": label, "V": None, "DV": None, "AS": None,
+            "FT": "/Tx", "Ff": None, "size": size}
+
+
+def page_boxes(page_idx: int, runs: List[_Run], right_edge: float) -> List[Dict[str, Any]]:
+    """Field boxes of one page, from its text runs (see the module docstring)."""
+    boxes: List[Dict[str, Any]] = []
+    for line in _lines(runs):
+        for i, phrase in enumerate(line):
+            text = phrase.text
+            leaders = list(_LEADER_RE.finditer(text))
+            start = 0
+            for m in leaders:
+                label = _label(text[start:m.start()])
+                if not label and start == 0 and i > 0:
+                    label = _label(line[i - 1].text)
+                if label:
+                    boxes.append(_box(page_idx, label, phrase.xs[m.start()], phrase.xs[m.end()],
+                                      phrase.y, phrase.size))
+                start = m.end()
+            if leaders or not text.rstrip().endswith(":"):
+                continue
+            x0 = phrase.x1 + 0.5 * phrase.size
+            x1 = (line[i + 1].x0 if i + 1 < len(line) else right_edge) - 0.5 * phrase.size
+            label = _label(text)
+            if x1 - x0 >= MIN_BOX * phrase.size and label and len(label.split()) <= MAX_LABEL_WORDS:
+                boxes.append(_box(page_idx, label, x0, x1, phrase.y, phrase.size))
+    return boxes
+
+
+def analyze_layout(reader: PdfReader) -> Dict[str, Dict[str, Any]]:
+    """Detect the field boxes of every page; returns a json_dump2-style dump keyed by label."""
+    out: Dict[str, Dict[str, Any]] = {}
+    for page_idx, page in enumerate(reader.pages):
+        box = page.mediabox
+        right_edge = float(box.right) - PAGE_MARGIN
+        for entry in page_boxes(page_idx, page_text_runs(reader, page), right_edge):
+            name, n = entry["T"], 2
+            while name in out:
+                name, n = f"{entry['T']}_{n}", n + 1
+            entry["T"] = name
+            out[name] = entry
+    return out
+
+
+def _raw_stream_bytes(obj: Any) -> bytes:
+    obj = _resolve(obj)
+    if isinstance(obj, ArrayObject):
+        return b"".join(_raw_stream_bytes(part) for part in obj)
+    if isinstance(obj, StreamObject):
+        # The stored (still encoded) bytes: no decompression needed to compare
+        return obj._data or b""
+    return b""
+
+
+def fingerprint_flat(reader: PdfReader) -> Optional[str]:
+    """
+    SHA-256 over every page's media box and raw content stream bytes; None
+    for a PDF without pages. Identical copies of a flat form share it.
+    """
+    h = hashlib.sha256()
+    for page in reader.pages:
+        h.update(json.dumps([round(float(x), 1) for x in page.mediabox]).encode())
+        h.update(hashlib.sha256(_raw_stream_bytes(page.get("/Contents"))).digest())
+    return h.hexdigest() if len(reader.pages) else None
+
+
+def extract_layout(
+    pdf_path: PdfSource, registry: Optional[TemplateRegistry] = None,
+) -> Tuple[Dict[str, Dict[str, Any]], Optional[str], bool]:
+    """
+    Field layout of a flat PDF as (dump, fingerprint, cache hit). With a
+    registry (see DEFAULT_LAYOUT_STORE), a cached layout is returned without
+    analyzing the text layer; new layouts are cached.
+    """
+    reader = PdfReader(open_map(pdf_path))
+    fingerprint = fingerprint_flat(reader)
+    if registry is not None and fingerprint:
+        cached = registry.lookup(fingerprint, LAYOUT_VERSION)
+        if cached is not None:
+            return cached, fingerprint, True
+    layout = analyze_layout(reader)
+    if registry is not None and fingerprint:
+        registry.register(fingerprint, LAYOUT_VERSION, layout, os.fspath(pdf_path))
+    return layout, fingerprint, False
+
+
+# ----------------------------
+# Fill
+# ----------------------------
+
+def _display(value: Any) -> Optional[str]:
+    if isinstance(value, dict):
+        value = value.get("V", value.get("value"))
+    if value is None or value is False or str(value) in ("", "Off", "/Off"):
+        return None
+    if value is True:
+        return "X"
+    return str(value)
+
+
+def overlay_ops(entries: List[Tuple[Dict[str, Any], str]], font_name: str) -> bytes:
+    """One content stream's worth of text operators drawing each value in its box."""
+    font = _Font(font_name, None, None)
+    ops = ["BT 0 g"]
+    for entry, text in entries:
+        x0, y0, x1, _y1 = entry["rect"]
+        size = float(entry.get("size") or MAX_TEXT_SIZE)
+        data = font.encode(text)
+        avail = x1 - x0 - 2 * PADDING
+        width = font.width(data, size)
+        if width > avail > 0:
+            size = max(MIN_TEXT_SIZE, size * avail / width)
+        ops.append(f"{font_name} {_num(size)} Tf 1 0 0 1 {_num(x0 + PADDING)} {_num(y0 + DESCENT * size)} Tm "
+                   f"({_escape(data).decode('latin-1')}) Tj")
+    ops.append("ET")
+    return "\n".join(ops).encode("latin-1")
+
+
+class OverlayTemplate:
+    """
+    A flat PDF and its field layout, fillable many times. Each fill writes the
+    original bytes plus, per page with values, the page object (its contents
+    extended by one overlay stream, its resources by a Helvetica font) and the
+    new streams; the pages are restored afterwards.
+    """
+
+    def __init__(self, pdf_in: PdfSource, layout: Dict[str, Dict[str, Any]]):
+        self._original = open_map(pdf_in)
+        self.reader = PdfReader(self._original)
+        self._first_new = next_object_number(self.reader)
+        self.layout = layout
+
+    def fill(self, values: Dict[str, Any], pdf_out: str) -> int:
+        """Draw values (keyed by layout label) and write pdf_out; returns the number of values drawn."""
+        per_page: Dict[int, List[Tuple[Dict[str, Any], str]]] = {}
+        for name, value in values.items():
+            entry = self.layout.get(name)
+            text = _display(value)
+            if entry is not None and text is not None:
+                per_page.setdefault(int(entry["page"]), []).append((entry, text))
+
+        update = IncrementalUpdate(self.reader, self._original, self._first_new)
+        saved = []
+        try:
+            for page_idx, entries in sorted(per_page.items()):
+                page = self.reader.pages[page_idx]
+                ref = page.indirect_reference
+                target = self.reader.get_object(ref)
+                saved.append((target, {k: target.raw_get(k) for k in ("/Contents", "/Resources") if k in target}))
+
+                # Shallow copies, so a shared (or inherited) /Resources dict is left untouched
+                resources = DictionaryObject(_resolve(page.get("/Resources")) or {})
+                fonts = DictionaryObject(_resolve(resources.get("/Font")) or {})
+                font_name, n = "/OvHelv", 1
+                while font_name in fonts:
+                    font_name, n = f"/OvHelv{n}", n + 1
+                fonts[NameObject(font_name)] = _helvetica()
+                resources[NameObject("/Font")] = fonts
+
+                head, tail = DecodedStreamObject(), DecodedStreamObject()
+                head.set_data(b"q\n")
+                tail.set_data(b"\nQ\n" + overlay_ops(entries, font_name) + b"\n")
+                contents = _resolve(target.get("/Contents"))
+                if isinstance(contents, ArrayObject):
+                    parts = list(contents)
+                elif "/Contents" in target:
+                    parts = [target.raw_get("/Contents")]
+                else:
+                    parts = []
+                target[NameObject("/Contents")] = ArrayObject(
+                    [update.add_object(head)] + parts + [update.add_object(tail)]
+                )
+                target[NameObject("/Resources")] = resources
+                update.mark(ref)
+
+            with open(pdf_out, "wb") as f:
+                update.write(f)
+        finally:
+            for target, originals in saved:
+                for key in ("/Contents", "/Resources"):
+                    if key in originals:
+                        target[NameObject(key)] = originals[key]
+                    else:
+                        target.pop(NameObject(key), None)
+        return sum(len(entries) for entries in per_page.values())
+
+
+def fill_overlay(pdf_in: PdfSource, pdf_out: str, values: Dict[str, Any],
+                 layout: Optional[Dict[str, Dict[str, Any]]] = None,
+                 registry: Optional[TemplateRegistry] = None) -> int:
+    """Fill a flat PDF; the layout is looked up (or detected and cached) unless given."""
+    if layout is None:
+        layout, _fingerprint, _hit = extract_layout(pdf_in, registry)
+    return OverlayTemplate(pdf_in, layout).fill(values, pdf_out)
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Detect field layouts of flat PDFs and fill them with an overlay")
+    ap.add_argument("--store", default=DEFAULT_LAYOUT_STORE, help="Layout cache directory")
+    ap.add_argument("--no-cache", action="store_true", help="Always analyze the text layer; don't read or update the cache")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    lay = sub.add_parser("layout", help="Detect (or look up) a flat PDF's field layout")
+    lay.add_argument("pdf")
+    lay.add_argument("--out", help="Write the layout as a json_dump2-style field dump")
+    fill = sub.add_parser("fill", help="Draw values onto a flat PDF")
+    fill.add_argument("--pdf-in", required=True)
+    fill.add_argument("--pdf-out", required=True)
+    fill.add_argument("--values", required=True, help="JSON {label:value} or {label:{V:..}}")
+    fill.add_argument("--layout", help="Layout JSON from the layout command (default: cache lookup)")
+    args = ap.parse_args()
+
+    registry = None if args.no_cache else TemplateRegistry(args.store)
+
+    if args.cmd == "layout":
+        layout, fingerprint, hit = extract_layout(args.pdf, registry)
+        if fingerprint:
+            print(f"Layout {fingerprint[:12]}: {'cache hit' if hit else 'analyzed'}")
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(layout, f, indent=2, ensure_ascii=False)
+            print(f"Wrote {len(layout)} field boxes to {args.out}")
+        else:
+            for name, entry in layout.items():
+                print(f"  p{entry['page']}  {entry['rect']}  {name}")
+        return
+
+    layout = None
+    if args.layout:
+        with open(args.layout, "r", encoding="utf-8") as f:
+            layout = json.load(f)
+    values = load_values(args.values)
+    drawn = fill_overlay(args.pdf_in, args.pdf_out, values, layout, registry)
+    if not drawn:
+        print("⚠️ No values matched a field box of this layout", file=sys.stderr)
+    print(f"Overlay-filled PDF written to {args.pdf_out} ({drawn} values)")
+
+
+if __name__ == "__main__":
+    from cli_trace import run_main
+    run_main("pdf.overlay_fill", main)
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Size-optimized rewrite of a PDF.
+
+PdfWriter output carries everything it was given, uncompressed where it was
+built in memory: appearance streams, a classic xref table, one top-level
+object per dictionary, and whatever the template held but no longer uses.
+A filled form therefore comes out no smaller than the blank one. This stage
+rewrites a finished PDF with:
+
+  strip_orphans   keep only objects reachable from the trailer (/Root, /Info);
+                  drops superseded objects, e.g. earlier incremental revisions
+  dedupe          merge objects that serialize identically once their own
+                  references are merged (repeated fonts, /DR entries,
+                  appearance streams), repeated until nothing changes
+  recompress      Flate-compress unfiltered streams, and re-deflate plain
+                  /FlateDecode streams at level 9 where that is smaller
+  object_streams  pack every non-stream object into compressed object
+                  streams with an xref stream (PDF 1.5, 7.5.7 and 7.5.8)
+
+Objects are renumbered densely from 1, in reading order from the catalog.
+Pages, annotations, form fields and each widget's /AP dictionary keep their
+identity and are never merged, even if two of them look the same. Encrypted input is rejected.
+
+    report = optimize_pdf("filled.pdf", "filled.pdf")
+    report["saved_bytes"]   # input size minus output size
+
+Usage:
+    python pdf_optimizer.py filled.pdf --out small.pdf [--no-dedupe] [--no-object-streams]
+                                                       [--no-recompress] [--keep-orphans] [--json]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (
+    ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject, PdfObject, StreamObject,
+)
+
+from pdf_source import PdfSource, open_reader
+
+# Objects per object stream; small enough that reading one object stays cheap
+OBJECTS_PER_STREAM = 200
+# Dedupe passes; each pass can only merge objects whose children merged in the previous one
+MAX_DEDUPE_PASSES = 8
+# Dictionaries whose identity matters even when their content is identical
+_IDENTITY_TYPES = {"/Catalog", "/Pages", "/Page", "/XRef", "/ObjStm"}
+
+
+def _key(ref: IndirectObject) -> Tuple[int, int]:
+    return ref.idnum, ref.generation
+
+
+def _children(obj: Any):
+    """Indirect references held (directly or nested) in obj."""
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, IndirectObject):
+            yield item
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+
+
+def _keeps_identity(obj: Any) -> bool:
+    if not isinstance(obj, DictionaryObject):
+        return False
+    if obj.get("/Type") in _IDENTITY_TYPES:
+        return True
+    # Annotations (/Rect) and form fields (/T, /Kids with /FT) are referenced by identity
+    return "/Rect" in obj or "/T" in obj or "/FT" in obj
+
+
+class _Renumbered:
+    """Writes objects with their references mapped to new object numbers."""
+
+    def __init__(self, numbers: Dict[Tuple[int, int], int]):
+        self.numbers = numbers
+
+    def remap(self, obj: Any) -> Any:
+        if isinstance(obj, IndirectObject):
+            number = self.numbers.get(_key(obj))
+            # A reference to an object that was never defined reads as null (7.3.10)
+            return IndirectObject(number, 0, None) if number else NullRef
+        if isinstance(obj, DictionaryObject):
+            # Streams too: their dictionary is written here, their data by serialize()
+            return DictionaryObject({k: self.remap(v) for k, v in obj.items()})
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.remap(v) for v in obj)
+        return obj
+
+    def serialize(self, obj: PdfObject, data: Optional[bytes] = None, filter: Optional[str] = None) -> bytes:
+        """Object body (no "n 0 obj" wrapper); streams need their (final) data and /Filter."""
+        out = BytesIO()
+        head = self.remap(obj)
+        if isinstance(obj, StreamObject):
+            if filter:
+                head[NameObject("/Filter")] = NameObject(filter)
+            head[NameObject("/Length")] = NumberObject(len(data))
+            head.write_to_stream(out, None)
+            out.write(b"\nstream\n")
+            out.write(data)
+            out.write(b"\nendstream")
+        else:
+            head.write_to_stream(out, None)
+        return out.getvalue()
+
+
+class _NullRef(PdfObject):
+    def write_to_stream(self, stream, encryption_key) -> None:
+        stream.write(b"null")
+
+
+NullRef = _NullRef()
+
+
+def _all_objects(reader: PdfReader) -> List[Tuple[int, int]]:
+    keys = [(idnum, gen) for gen, entries in reader.xref.items() for idnum in entries if idnum]
+    keys += [(idnum, 0) for idnum in reader.xref_objStm]
+    return sorted(set(keys))
+
+
+def _collect(reader: PdfReader, roots: List[IndirectObject], strip_orphans: bool):
+    """{(idnum, gen): object} in reading order from roots (plus the rest unless strip_orphans)."""
+    objects: Dict[Tuple[int, int], Any] = {}
+    queue = list(roots)
+    if not strip_orphans:
+        queue += [IndirectObject(idnum, gen, reader) for idnum, gen in _all_objects(reader)]
+    while queue:
+        ref = queue.pop(0)
+        key = _key(ref)
+        if key in objects:
+            continue
+        try:
+            obj = reader.get_object(ref)
+        except Exception:
+            obj = None
+        if obj is None:
+            continue
+        if isinstance(obj, StreamObject) and obj.get("/Type") in ("/XRef", "/ObjStm"):
+            # Containers of the old file; their contents are repacked
+            continue
+        objects[key] = obj
+        if isinstance(obj, StreamObject):
+            # An indirect /Length is replaced by the written length
+            queue.extend(_children({k: v for k, v in obj.items() if k != "/Length"}))
+        else:
+            queue.extend(_children(obj))
+    return objects
+
+
+def _stream_data(obj: StreamObject, recompress: bool, stats: Dict[str, int]) -> Tuple[bytes, Optional[str]]:
+    """(data to write, new /Filter or None to keep the stream's own)."""
+    raw = obj._data
+    if not recompress:
+        return raw, None
+    filters = obj.get("/Filter")
+    if filters is None:
+        packed = zlib.compress(raw, 9)
+        if len(packed) < len(raw):
+            stats["recompressed_streams"] += 1
+            return packed, "/FlateDecode"
+    elif filters == "/FlateDecode":
+        # Predictors (/DecodeParms) apply inside the deflated data, so they survive re-deflating
+        try:
+            packed = zlib.compress(zlib.decompress(raw), 9)
+        except zlib.error:
+            return raw, None
+        if len(packed) < len(raw):
+            stats["recompressed_streams"] += 1
+            return packed, None
+    return raw, None
+
+
+def _dedupe(objects: Dict[Tuple[int, int], Any], datas: Dict[Tuple[int, int], Tuple[bytes, Optional[str]]],
+           ) -> Dict[Tuple[int, int], Tuple[int, int]]:
+    """{duplicate key: kept key}, merging objects that serialize identically."""
+    # Serialize with references written as their current representative
+    ids = {key: i for i, key in enumerate(objects, start=1)}
+    canon = dict(ids)
+    # Widgets keep their own /AP dictionary: viewers that redraw one widget (MuPDF among
+    # them) would otherwise redraw every widget sharing it. The streams inside are shared.
+    own_appearance = set()
+    for obj in objects.values():
+        ap = obj.raw_get("/AP") if isinstance(obj, DictionaryObject) and "/AP" in obj else None
+        if isinstance(ap, IndirectObject):
+            own_appearance.add(_key(ap))
+    candidates = [key for key, obj in objects.items() if not _keeps_identity(obj) and key not in own_appearance]
+    for _ in range(MAX_DEDUPE_PASSES):
+        writer = _Renumbered(canon)
+        seen: Dict[bytes, Tuple[int, int]] = {}
+        merged = 0
+        for key in candidates:
+            if canon[key] != ids[key]:
+                continue
+            data, filter = datas.get(key, (None, None))
+            digest = hashlib.sha256(writer.serialize(objects[key], data, filter)).digest()
+            first = seen.setdefault(digest, key)
+            if first != key:
+                canon[key] = ids[first]
+                merged += 1
+        if not merged:
+            break
+    by_id = {i: key for key, i in ids.items()}
+
+    def kept(i: int) -> Tuple[int, int]:
+        # A later pass may merge the kept object itself
+        while canon[by_id[i]] != i:
+            i = canon[by_id[i]]
+        return by_id[i]
+
+    return {key: kept(canon[key]) for key in objects if canon[key] != ids[key]}
+
+
+def _write_plain(out: BytesIO, bodies: List[bytes], trailer: DictionaryObject) -> None:
+    offsets = []
+    for number, body in enumerate(bodies, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n".encode())
+        out.write(body)
+        out.write(b"\nendobj\n")
+    xref_offset = out.tell()
+    out.write(f"xref\n0 {len(bodies) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(b"trailer\n")
+    trailer[NameObject("/Size")] = NumberObject(len(bodies) + 1)
+    trailer.write_to_stream(out, None)
+    out.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+
+def _write_packed(out: BytesIO, bodies: List[bytes], is_stream: List[bool], trailer: DictionaryObject) -> int:
+    """Non-stream objects go into object streams; returns the number of object streams."""
+    count = len(bodies)
+    # xref rows: (type, field 2, field 3) per object number, 0 = free head
+    rows: List[Tuple[int, int, int]] = [(0, 0, 65535)] + [(0, 0, 0)] * count
+    packed = [n for n in range(1, count + 1) if not is_stream[n - 1]]
+    for n in range(1, count + 1):
+        if is_stream[n - 1]:
+            rows[n] = (1, out.tell(), 0)
+            out.write(f"{n} 0 obj\n".encode())
+            out.write(bodies[n - 1])
+            out.write(b"\nendobj\n")
+
+    next_number = count + 1
+    stream_count = 0
+    for start in range(0, len(packed), OBJECTS_PER_STREAM):
+        chunk = packed[start:start + OBJECTS_PER_STREAM]
+        header, content = [], BytesIO()
+        for index, n in enumerate(chunk):
+            header.append(f"{n} {content.tell()}")
+            content.write(bodies[n - 1])
+            content.write(b"\n")
+            rows[n] = (2, next_number, index)
+        head = (" ".join(header) + "\n").encode()
+        data = zlib.compress(head + content.getvalue(), 9)
+        stream_dict = DictionaryObject({
+            NameObject("/Type"): NameObject("/ObjStm"),
+            NameObject("/N"): NumberObject(len(chunk)),
+            NameObject("/First"): NumberObject(len(head)),
+            NameObject("/Filter"): NameObject("/FlateDecode"),
+            NameObject("/Length"): NumberObject(len(data)),
+        })
+        rows.append((1, out.tell(), 0))
+        out.write(f"{next_number} 0 obj\n".encode())
+        stream_dict.write_to_stream(out, None)
+        out.write(b"\nstream\n")
+        out.write(data)
+        out.write(b"\nendstream\nendobj\n")
+        next_number += 1
+        stream_count += 1
+
+    # The xref stream lists itself
+    xref_number = next_number
+    xref_offset = out.tell()
+    rows.append((1, xref_offset, 0))
+    width = max(1, (max(row[1] for row in rows).bit_length() + 7) // 8)
+    data = zlib.compress(b"".join(
+        struct.pack(">B", kind) + field2.to_bytes(width, "big") + struct.pack(">H", field3)
+        for kind, field2, field3 in rows
+    ), 9)
+    trailer.update({
+        NameObject("/Type"): NameObject("/XRef"),
+        NameObject("/Size"): NumberObject(len(rows)),
+        NameObject("/W"): ArrayObject([NumberObject(1), NumberObject(width), NumberObject(2)]),
+        NameObject("/Filter"): NameObject("/FlateDecode"),
+        NameObject("/Length"): NumberObject(len(data)),
+    })
+    out.write(f"{xref_number} 0 obj\n".encode())
+    trailer.write_to_stream(out, None)
+    out.write(b"\nstream\n")
+    out.write(data)
+    out.write(b"\nendstream\nendobj\n")
+    out.write(f"startxref\n{xref_offset}\n%%EOF\n".encode())
+    return stream_count
+
+
+def optimize_reader(
+    reader: PdfReader,
+    dedupe: bool = True,
+    object_streams: bool = True,
+    recompress: bool = True,
+    strip_orphans: bool = True,
+) -> Tuple[bytes, Dict[str, Any]]:
+    """Rewrite the document held by reader; returns (pdf bytes, stats)."""
+    if reader.is_encrypted:
+        raise ValueError("Optimizing encrypted PDFs is not supported")
+    stats = {"objects_in": len(_all_objects(reader)), "orphans_removed": 0,
+             "duplicates_merged": 0, "recompressed_streams": 0, "object_streams": 0}
+
+    roots = [reader.trailer.raw_get(key) for key in ("/Root", "/Info") if key in reader.trailer]
+    objects = _collect(reader, [ref for ref in roots if isinstance(ref, IndirectObject)], strip_orphans)
+    if strip_orphans:
+        stats["orphans_removed"] = max(0, stats["objects_in"] - len(objects))
+
+    # Final data and (new) /Filter of every stream, shared by dedupe and output
+    datas = {key: _stream_data(obj, recompress, stats)
+             for key, obj in objects.items() if isinstance(obj, StreamObject)}
+
+    duplicates = _dedupe(objects, datas) if dedupe else {}
+    stats["duplicates_merged"] = len(duplicates)
+
+    kept = [key for key in objects if key not in duplicates]
+    numbers = {key: n for n, key in enumerate(kept, start=1)}
+    numbers.update({dup: numbers[original] for dup, original in duplicates.items()})
+    writer = _Renumbered(numbers)
+
+    bodies, is_stream = [], []
+    for key in kept:
+        data, filter = datas.get(key, (None, None))
+        bodies.append(writer.serialize(objects[key], data, filter))
+        is_stream.append(key in datas)
+
+    trailer = DictionaryObject({NameObject("/Root"): writer.remap(reader.trailer.raw_get("/Root"))})
+    if "/Info" in reader.trailer:
+        trailer[NameObject("/Info")] = writer.remap(reader.trailer.raw_get("/Info"))
+    if "/ID" in reader.trailer:
+        trailer[NameObject("/ID")] = writer.remap(reader.trailer["/ID"])
+
+    out = BytesIO()
+    version = reader.pdf_header[5:8] if reader.pdf_header.startswith("%PDF-") else "1.4"
+    if object_streams and version < "1.5":
+        version = "1.5"
+    out.write(f"%PDF-{version}\n%\xe2\xe3\xcf\xd3\n".encode("latin-1"))
+    if object_streams:
+        stats["object_streams"] = _write_packed(out, bodies, is_stream, trailer)
+    else:
+        _write_plain(out, bodies, trailer)
+    stats["objects_out"] = len(bodies)
+    return out.getvalue(), stats
+
+
+def optimize_pdf(pdf_in: PdfSource, pdf_out: str, **options: bool) -> Dict[str, Any]:
+    """
+    Write a size-optimized copy of pdf_in to pdf_out (which may be the same
+    file). options: dedupe, object_streams, recompress, strip_orphans (all on
+    by default). Returns the stats with input/output sizes and bytes saved.
+
+    If the rewrite is not smaller, pdf_out gets the original bytes instead
+    (pdf_in is left alone when they are the same file) and the stats report
+    kept_original with saved_bytes 0; optimized_bytes is the rejected size.
+    """
+    start = time.perf_counter()
+    in_path = os.fspath(pdf_in)
+    input_bytes = os.path.getsize(in_path)
+    data, stats = optimize_reader(open_reader(pdf_in), **options)
+    optimized_bytes = len(data)
+    kept_original = optimized_bytes >= input_bytes
+    if kept_original:
+        if os.path.abspath(in_path) == os.path.abspath(pdf_out):
+            data = None
+        else:
+            with open(in_path, "rb") as f:
+                data = f.read()
+    if data is not None:
+        tmp_path = f"{pdf_out}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, pdf_out)
+    output_bytes = input_bytes if kept_original else optimized_bytes
+    stats.update({
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "optimized_bytes": optimized_bytes,
+        "kept_original": kept_original,
+        "saved_bytes": input_bytes - output_bytes,
+        "saved_percent": round(100.0 * (input_bytes - output_bytes) / input_bytes, 1) if input_bytes else 0.0,
+        "seconds": round(time.perf_counter() - start, 3),
+    })
+    return stats
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Rewrite a PDF to be smaller")
+    ap.add_argument("pdf")
+    ap.add_argument("--out", help="Output PDF (default: overwrite the input)")
+    ap.add_argument("--no-dedupe", action="store_true", help="Keep identical objects separate")
+    ap.add_argument("--no-object-streams", action="store_true",
+                    help="Write every object at top level with a classic xref table")
+    ap.add_argument("--no-recompress", action="store_true", help="Copy stream data unchanged")
+    ap.add_argument("--keep-orphans", action="store_true", help="Keep objects nothing refers to")
+    ap.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = ap.parse_args()
+
+    try:
+        report = optimize_pdf(args.pdf, args.out or args.pdf, dedupe=not args.no_dedupe,
+                              object_streams=not args.no_object_streams, recompress=not args.no_recompress,
+                              strip_orphans=not args.keep_orphans)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(report))
+        return
+    if report["kept_original"]:
+        print(f"Kept the original {report['input_bytes']:,} bytes: the rewrite came out at "
+              f"{report['optimized_bytes']:,} bytes in {report['seconds']}s")
+    else:
+        print(f"{report['input_bytes']:,} -> {report['output_bytes']:,} bytes "
+              f"(saved {report['saved_bytes']:,}, {report['saved_percent']}%) in {report['seconds']}s")
+    print(f"  objects {report['objects_in']} -> {report['objects_out']}: "
+          f"{report['orphans_removed']} orphans removed, {report['duplicates_merged']} duplicates merged, "
+          f"{report['recompressed_streams']} streams recompressed, {report['object_streams']} object streams")
+
+
+if __name__ == "__main__":
+    from cli_trace import run_main
+    run_main("pdf.optimize", main)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped PDF input.
+
+PdfReader(path) reads the whole file into a BytesIO before parsing, so every
+stage that opens a multi-hundred-MB scanned claim bundle holds its own private
+copy of it. A MappedPdf maps the file read-only instead: PyPDF2 seeks and
+reads through the map, so only the pages of the file that are actually parsed
+(xref, field tree, form pages) are faulted in, and they live in the OS page
+cache, shared by every map of the file rather than copied into each process.
+
+Each reader gets its own map (its own read position) over the same file, so
+stages of the in-process pipeline can share one MappedPdf:
+
+    with MappedPdf("claim.pdf") as source:
+        fields = json_dump2.extract_field_objects(source)
+        autofill.fill_pdf_from_values(source, "claim_filled.pdf", values)
+
+A MappedPdf is os.PathLike, so code that only needs the file name (or opens
+the file itself) takes it like a path.
+"""
+
+import mmap
+import os
+from io import BytesIO
+from typing import Union
+
+from PyPDF2 import PdfReader
+
+
+class MappedPdf:
+    def __init__(self, path: Union[str, "os.PathLike[str]"]):
+        self.path = os.fspath(path)
+        self._file = open(self.path, "rb")
+
+    def __fspath__(self) -> str:
+        return self.path
+
+    def __enter__(self) -> "MappedPdf":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # Maps already handed out stay valid; they hold their own descriptor
+        self._file.close()
+
+    def map(self):
+        """
+        A new read-only map of the whole file: a zero-copy buffer (slicing,
+        len(), re and file.write() work on it) with its own read position.
+        Empty files, which can't be mapped, give an empty BytesIO.
+        """
+        try:
+            return mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return BytesIO(b"")
+
+    def reader(self, strict: bool = False) -> PdfReader:
+        return PdfReader(self.map(), strict=strict)
+
+
+PdfSource = Union[str, "os.PathLike[str]", MappedPdf]
+
+
+def open_map(source: PdfSource):
+    """A new map (see MappedPdf.map) of a path or MappedPdf."""
+    if isinstance(source, MappedPdf):
+        return source.map()
+    with MappedPdf(source) as pdf:
+        return pdf.map()
+
+
+def open_reader(source: PdfSource, strict: bool = False) -> PdfReader:
+    """PdfReader over a memory map of a path or MappedPdf."""
+    return PdfReader(open_map(source), strict=strict)
@@ -3,74 +3,88 @@
 Smart Insurance PDF Processing Workflow
 
 This script automatically detects the form type and uses appropriate example data:
-- Health Declaration forms use health_example_data.json
-- Medical/Accident claim forms use example_data.json
-- Falls back to manual example data if provided
+- Form types and their data profiles are registered in form_types.json
+  (see form_classifier.py): health declarations use health_example_data.json,
+  medical/accident claims use example_data.json
+- Unknown forms use example_data.json, or the manual example data if provided
+- Flat PDFs without form fields get their field boxes from the text layer and
+  the values drawn over the pages (see overlay_fill.py)
+
+Pass a directory instead of a PDF to process every PDF in it on a process
+pool (--jobs, default: one worker per core). Filled PDFs go to the output
+directory (default <input_dir>/filled) and a per-file timing/failure summary
+is printed at the end.
 
 Usage:
     python process_insurance_pdf_smart.py <input_pdf> [output_pdf] [--example-data <path>] [--keep-intermediate]
+    python process_insurance_pdf_smart.py <input_dir> [output_dir] [--jobs N] [--summary-json <path>]
 
 Examples:
     python process_insurance_pdf_smart.py "health-declaration-statement.pdf"
     python process_insurance_pdf_smart.py "Medical Accident Living TPD.pdf"
     python process_insurance_pdf_smart.py "any_form.pdf" --example-data "custom_data.json"
+    python process_insurance_pdf_smart.py claims/ claims_filled/ --jobs 8
 """
 
 import argparse
+import contextlib
+import io
 import json
+import multiprocessing
 import os
 import subprocess
 import sys
 import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+
+import autofill
+import fetchdb
+import json_dump2
+import overlay_fill
+from form_classifier import FormClassifier
+from mapping_store import MappingStore
+from pdf_source import MappedPdf
+from profile_store import JsonFileBackend, Profile, ProfileStore
+from template_registry import TemplateRegistry, fingerprint_pdf
+
+
+# Loaded on first use; batch mode loads it before forking workers
+_classifier: Optional[FormClassifier] = None
 
 
-def detect_form_type(fields_json: Dict[str, Any]) -> str:
+def _get_classifier() -> FormClassifier:
+    global _classifier
+    if _classifier is None:
+        _classifier = FormClassifier()
+    return _classifier
+
+
+def classify_form(fields_json: Dict[str, Any], fingerprint: Optional[str] = None) -> Dict[str, Any]:
     """
-    Detect the form type based on field names.
-    Returns: 'health_declaration', 'medical_claim', or 'unknown'
+    Classify a form against the registered templates (form_types.json).
+    See form_classifier.FormClassifier.classify for the result keys.
     """
-    field_names = list(fields_json.keys())
-    field_names_lower = [name.lower() for name in field_names]
-    
-    # Health declaration indicators
-    health_indicators = [
-        'policy no', 'nric', 'passport no', 'countryregion code',
-        'surrender penalty', 'reinstatement'
-    ]
-    
-    # Medical/Accident claim indicators
-    medical_indicators = [
-        'accident', 'medical', 'hospital', 'diagnosis', 'symptoms',
-        'disability', 'benefit', 'claim number', 'policy numbers'
-    ]
-    
-    health_score = sum(1 for indicator in health_indicators 
-                      if any(indicator in field for field in field_names_lower))
-    medical_score = sum(1 for indicator in medical_indicators 
-                       if any(indicator in field for field in field_names_lower))
-    
-    if health_score > medical_score and health_score > 0:
-        return 'health_declaration'
-    elif medical_score > 0:
-        return 'medical_claim'
-    else:
-        return 'unknown'
+    return _get_classifier().classify(fields_json, fingerprint)
+
+
+def detect_form_type(fields_json: Dict[str, Any], fingerprint: Optional[str] = None) -> str:
+    """
+    Detect the form type: an exact template fingerprint hit, else the most
+    similar registered template by field names.
+    Returns a form type from form_types.json (e.g. 'health_declaration',
+    'medical_claim') or 'unknown'.
+    """
+    return classify_form(fields_json, fingerprint)["form_type"]
 
 
 def get_example_data_path(form_type: str, custom_path: Optional[str] = None) -> str:
-    """Get the appropriate example data file path."""
+    """Get the appropriate example data file path (the form type's data profile)."""
     if custom_path and os.path.exists(custom_path):
         return custom_path
-    
-    if form_type == 'health_declaration':
-        return 'health_example_data.json'
-    elif form_type == 'medical_claim':
-        return 'example_data.json'
-    else:
-        # Fallback to default
-        return 'example_data.json'
+    return _get_classifier().data_profile(form_type)
 
 
 def run_command(cmd: list, description: str) -> bool:
@@ -97,7 +111,8 @@ def process_insurance_pdf_smart(
     input_pdf: str,
     output_pdf: Optional[str] = None,
     example_data: Optional[str] = None,
-    keep_intermediate: bool = False
+    keep_intermediate: bool = False,
+    flatten: bool = False
 ) -> bool:
     """
     Process an insurance PDF with smart form type detection.
@@ -107,6 +122,7 @@ def process_insurance_pdf_smart(
         output_pdf: Path to output PDF file (optional, defaults to input_pdf with _filled suffix)
         example_data: Path to custom example data JSON file (optional)
         keep_intermediate: Whether to keep intermediate files for debugging
+        flatten: Draw the values into the pages and drop the form fields
     
     Returns:
         True if successful, False otherwise
@@ -135,15 +151,26 @@ def process_insurance_pdf_smart(
         ], "Extracting form fields from PDF"):
             return False
         
+        # Flat PDFs have no form fields: detect field boxes from the text layer instead
+        with open(fields_json_path, "r", encoding="utf-8") as f:
+            overlay = not json.load(f)
+        if overlay and not run_command([
+            "python", "overlay_fill.py", "layout", input_pdf,
+            "--out", str(fields_json_path)
+        ], "No form fields found; detecting field layout from the text layer"):
+            return False
+        
         # Step 2: Detect form type and select appropriate example data
         try:
             with open(fields_json_path, "r", encoding="utf-8") as f:
                 fields_data = json.load(f)
             
-            form_type = detect_form_type(fields_data)
+            result = classify_form(fields_data, fingerprint_pdf(input_pdf))
+            form_type = result["form_type"]
             example_data_path = get_example_data_path(form_type, example_data)
             
-            print(f"\n🔍 Detected form type: {form_type}")
+            print(f"\n🔍 Detected form type: {form_type} "
+                  f"({result['method']}, confidence {result['confidence']})")
             print(f"📄 Using example data: {example_data_path}")
             
             if not os.path.exists(example_data_path):
@@ -164,13 +191,22 @@ def process_insurance_pdf_smart(
         ], "Merging with example data"):
             return False
         
-        # Step 4: Fill the PDF
-        if not run_command([
+        # Step 4: Fill the PDF (flat PDFs: draw the values over the pages)
+        if overlay:
+            if not run_command([
+                "python", "overlay_fill.py", "fill",
+                "--pdf-in", input_pdf,
+                "--pdf-out", output_pdf,
+                "--values", str(values_json),
+                "--layout", str(fields_json_path)
+            ], "Drawing merged data onto the flat PDF"):
+                return False
+        elif not run_command([
             "python", "autofill.py",
             "--pdf-in", input_pdf,
             "--pdf-out", output_pdf,
             "--values", str(values_json)
-        ], "Filling PDF with merged data"):
+        ] + (["--flatten"] if flatten else []), "Filling PDF with merged data"):
             return False
         
         # Copy intermediate files if requested
@@ -179,15 +215,190 @@ def process_insurance_pdf_smart(
             intermediate_dir.mkdir(exist_ok=True)
             
             import shutil
-            shutil.copy2(fields_json_path, intermediate_dir / f"{input_path.stem}_fields.json")
             shutil.copy2(values_json, intermediate_dir / f"{input_path.stem}_values.json")
             
             print(f"📁 Intermediate files saved to: {intermediate_dir}")
+            print("📁 Field dumps are kept in the template registry (python template_registry.py list)")
     
     print(f"\n🎉 Success! Filled PDF saved to: {output_pdf}")
     return True
 
 
+# ----------------------------------------------------------------------------
+# Batch mode: in-process pipeline on a process pool
+# ----------------------------------------------------------------------------
+
+# Set in the parent before the pool forks, so workers inherit the preloaded
+# registry dumps, compiled mappings and prepared example data instead of re-reading them.
+_registry: Optional[TemplateRegistry] = None
+_layouts: Optional[TemplateRegistry] = None
+_mappings: Optional[MappingStore] = None
+# Example data files by path, flattened once and re-read only when the file changes
+_profiles = ProfileStore(JsonFileBackend("."))
+
+
+def _load_example_data(path: str) -> Profile:
+    profile = _profiles.get(path)
+    if profile is None:
+        raise FileNotFoundError(f"Example data file not found: {path}")
+    return profile
+
+
+def process_pdf_in_process(
+    input_pdf: str,
+    output_pdf: str,
+    example_data: Optional[str] = None,
+    flatten: bool = False
+) -> Dict[str, Any]:
+    """
+    Same steps as process_insurance_pdf_smart, run as function calls instead of
+    subprocesses. The input is memory-mapped once and read by every step.
+    Returns a result row for the batch summary; never raises.
+    """
+    global _registry, _layouts, _mappings
+    if _registry is None:
+        _registry = TemplateRegistry()
+    if _layouts is None:
+        _layouts = TemplateRegistry(overlay_fill.DEFAULT_LAYOUT_STORE)
+    if _mappings is None:
+        _mappings = MappingStore()
+
+    start = time.perf_counter()
+    row: Dict[str, Any] = {"input": input_pdf, "output": output_pdf, "ok": False}
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log), MappedPdf(input_pdf) as source:
+            fields, fingerprint, registry_hit = json_dump2.extract_field_objects_cached(source, _registry)
+            overlay = not fields
+            if overlay:
+                fields, fingerprint, registry_hit = overlay_fill.extract_layout(source, _layouts)
+            form_type = detect_form_type(fields, fingerprint)
+            example_data_path = get_example_data_path(form_type, example_data)
+            profile = _load_example_data(example_data_path)
+            mapping = fetchdb.load_or_compile_mapping(
+                fields, None, _mappings, source=os.path.basename(example_data_path), profile=profile
+            )
+            values = fetchdb.build_values_from_s3(fields, None, mapping, flat=profile.flat)
+            if overlay:
+                overlay_fill.fill_overlay(source, output_pdf, values, fields)
+            else:
+                autofill.fill_pdf_from_values(source, output_pdf, values, flatten=flatten)
+        row.update({
+            "ok": True,
+            "form_type": form_type,
+            "fields": len(fields),
+            "filled": len(values),
+            "registry_hit": registry_hit,
+            "overlay": overlay,
+        })
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+        row["log_tail"] = log.getvalue()[-2000:]
+    row["seconds"] = round(time.perf_counter() - start, 3)
+    return row
+
+
+def _batch_inputs(input_dir: str) -> List[str]:
+    return sorted(
+        str(p) for p in Path(input_dir).iterdir()
+        if p.is_file() and p.suffix.lower() == ".pdf" and not p.stem.endswith("_filled")
+    )
+
+
+def process_directory(
+    input_dir: str,
+    output_dir: Optional[str] = None,
+    jobs: Optional[int] = None,
+    example_data: Optional[str] = None,
+    summary_json: Optional[str] = None,
+    flatten: bool = False
+) -> Dict[str, Any]:
+    """
+    Process every PDF in input_dir on a pool of `jobs` worker processes,
+    printing each result as it finishes, then a summary. Returns the summary.
+    """
+    global _registry, _layouts, _mappings
+    inputs = _batch_inputs(input_dir)
+    output_dir = output_dir or os.path.join(input_dir, "filled")
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(inputs) or 1))
+
+    # Warm the caches once in the parent; forked workers share them copy-on-write
+    _registry = TemplateRegistry()
+    _layouts = TemplateRegistry(overlay_fill.DEFAULT_LAYOUT_STORE)
+    _mappings = MappingStore()
+    templates = _registry.preload(json_dump2.DUMP_VERSION) + _layouts.preload(overlay_fill.LAYOUT_VERSION)
+    mappings = _mappings.preload()
+    classifier = _get_classifier()
+    profiles = {classifier.data_profile(t) for t in classifier.config["form_types"]}
+    _profiles.preload(path for path in profiles | {"example_data.json", example_data} if path)
+
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else None)
+    print(f"\n🗂️  {len(inputs)} PDFs, {jobs} workers ({ctx.get_start_method()}), "
+          f"{templates} cached templates, {mappings} cached mappings")
+
+    start = time.perf_counter()
+    results: List[Dict[str, Any]] = []
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx) as pool:
+        futures = {
+            pool.submit(
+                process_pdf_in_process, pdf,
+                os.path.join(output_dir, f"{Path(pdf).stem}_filled.pdf"), example_data, flatten
+            ): pdf
+            for pdf in inputs
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                row = future.result()
+            except Exception as e:  # worker died
+                row = {"input": futures[future], "ok": False, "seconds": None,
+                       "error": f"{type(e).__name__}: {e}"}
+            results.append(row)
+            name = os.path.basename(row["input"])
+            if row["ok"]:
+                print(f"✅ [{done}/{len(inputs)}] {name} ({row['seconds']}s, {row['form_type']}, "
+                      f"{row['filled']}/{row['fields']} fields)")
+            else:
+                print(f"❌ [{done}/{len(inputs)}] {name}: {row['error']}")
+    wall = time.perf_counter() - start
+
+    timed = sorted((r for r in results if r.get("seconds") is not None),
+                   key=lambda r: r["seconds"], reverse=True)
+    failures = [r for r in results if not r["ok"]]
+    cpu = sum(r["seconds"] for r in timed)
+    summary = {
+        "files": len(inputs),
+        "succeeded": len(inputs) - len(failures),
+        "failed": len(failures),
+        "jobs": jobs,
+        "wall_seconds": round(wall, 3),
+        "sum_file_seconds": round(cpu, 3),
+        "files_per_sec": round(len(inputs) / wall, 2) if wall else 0.0,
+        "results": sorted(results, key=lambda r: r["input"]),
+    }
+
+    print("\n📊 Batch summary")
+    print("=" * 50)
+    print(f"Files: {summary['files']}  succeeded: {summary['succeeded']}  failed: {summary['failed']}")
+    print(f"Wall time: {summary['wall_seconds']}s  ({summary['files_per_sec']} files/sec, "
+          f"{summary['sum_file_seconds']}s of per-file work on {jobs} workers)")
+    if timed:
+        print("Slowest files:")
+        for r in timed[:10]:
+            print(f"  {r['seconds']:>8.3f}s  {os.path.basename(r['input'])}")
+    if failures:
+        print("Failures:")
+        for r in failures:
+            print(f"  {os.path.basename(r['input'])}: {r['error']}")
+
+    if summary_json:
+        with open(summary_json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"📁 Summary written to: {summary_json}")
+    return summary
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Process insurance PDFs with smart form type detection",
@@ -197,13 +408,25 @@ def main():
     
     parser.add_argument(
         "input_pdf",
-        help="Path to input PDF file"
+        help="Path to input PDF file, or a directory of PDFs for batch mode"
     )
     
     parser.add_argument(
         "output_pdf",
         nargs="?",
-        help="Path to output PDF file (optional, defaults to input_pdf with _filled suffix)"
+        help="Path to output PDF file (optional, defaults to input_pdf with _filled suffix); "
+             "in batch mode the output directory (defaults to <input_dir>/filled)"
+    )
+    
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help="Batch mode: number of worker processes (default: number of cores)"
+    )
+    
+    parser.add_argument(
+        "--summary-json",
+        help="Batch mode: also write the per-file summary to this JSON file"
     )
     
     parser.add_argument(
@@ -217,6 +440,12 @@ def main():
         help="Keep intermediate JSON files for debugging"
     )
     
+    parser.add_argument(
+        "--flatten",
+        action="store_true",
+        help="Draw the values into the pages and drop the form fields (final, non-editable output)"
+    )
+    
     parser.add_argument(
         "--verbose",
         action="store_true",
@@ -225,10 +454,32 @@ def main():
     
     args = parser.parse_args()
     
+    # Batch paths are taken relative to where the command was run
+    batch = os.path.isdir(args.input_pdf)
+    if batch:
+        input_dir = os.path.abspath(args.input_pdf)
+        output_dir = os.path.abspath(args.output_pdf) if args.output_pdf else None
+        summary_json = os.path.abspath(args.summary_json) if args.summary_json else None
+        example_data = os.path.abspath(args.example_data) if args.example_data else None
+    
     # Change to the script directory to ensure relative paths work
     script_dir = Path(__file__).parent
     os.chdir(script_dir)
     
+    if batch:
+        print("🏥 Smart Insurance PDF Processing Workflow (batch)")
+        print("=" * 50)
+        print(f"Input directory: {input_dir}")
+        summary = process_directory(
+            input_dir,
+            output_dir=output_dir,
+            jobs=args.jobs,
+            example_data=example_data,
+            summary_json=summary_json,
+            flatten=args.flatten
+        )
+        sys.exit(0 if summary["failed"] == 0 else 1)
+    
     print("🏥 Smart Insurance PDF Processing Workflow")
     print("=" * 50)
     print(f"Input PDF: {args.input_pdf}")
@@ -240,7 +491,8 @@ def main():
         input_pdf=args.input_pdf,
         output_pdf=args.output_pdf,
         example_data=args.example_data,
-        keep_intermediate=args.keep_intermediate
+        keep_intermediate=args.keep_intermediate,
+        flatten=args.flatten
     )
     
     if success:
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Patient profile repository for fetchdb.py.
+
+Profiles (the patient data a form is filled from) live in a backend:
+
+- SQLite (default): one row per profile id with its JSON and a version that
+  put() increments
+- S3 or an S3-compatible stand-in (MinIO, localstack; optional, needs boto3):
+  s3://<bucket>/<prefix><id>.json, versioned by ETag
+- JSON files in a directory (the bundled example data): <dir>/<id>, versioned
+  by mtime and size
+
+ProfileStore keeps every profile it has served in memory, prepared for
+matching: the flattened data, its schema hash (mapping_store.schema_hash) and,
+built on first use, the FieldMatcher over the flattened keys, i.e. the
+normalized key index. A get() only asks the backend for the current version;
+the profile is re-read and re-prepared only when the version changed, so
+preparing data for a fill no longer depends on the profile's size.
+
+Backend selection (ProfileStore.from_env):
+    PDF_PROFILE_S3_BUCKET set -> S3 (PDF_PROFILE_S3_PREFIX, PDF_PROFILE_S3_ENDPOINT)
+    otherwise                 -> SQLite at PDF_PROFILE_DB (default profiles.sqlite3 here)
+
+Usage:
+    python profile_store.py put P000123 patient.json
+    python profile_store.py import example_data.json health_example_data.json
+    python profile_store.py list
+    python profile_store.py show P000123
+    python profile_store.py remove P000123
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from fetchdb import flatten_dict, normalize_key
+from field_matcher import FieldMatcher
+from mapping_store import schema_hash
+
+try:
+    import boto3
+except ImportError:  # only needed for the S3 backend
+    boto3 = None
+
+DEFAULT_DB = os.getenv(
+    "PDF_PROFILE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles.sqlite3"),
+)
+
+
+class Profile:
+    """A profile prepared for matching. Treat as read-only; it is shared by every fill."""
+
+    def __init__(self, profile_id: str, version: str, data: Dict[str, Any]):
+        self.id = profile_id
+        self.version = version
+        self.data = data
+        self.flat = flatten_dict(data)
+        self.flat_keys = list(self.flat)
+        self.schema = schema_hash(self.flat_keys)
+        self._matcher: Optional[FieldMatcher] = None
+
+    @property
+    def matcher(self) -> FieldMatcher:
+        # Only needed when a mapping has to be compiled, so built lazily
+        if self._matcher is None:
+            self._matcher = FieldMatcher(self.flat_keys, normalize=normalize_key)
+        return self._matcher
+
+
+# ----------------------------
+# Backends
+# ----------------------------
+
+class SQLiteBackend:
+    def __init__(self, db_path: str = DEFAULT_DB):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # One connection per process: batch workers are forked
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS profiles ("
+                " id TEXT PRIMARY KEY, version INTEGER NOT NULL, updated TEXT NOT NULL, data TEXT NOT NULL)"
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    def version(self, profile_id: str) -> Optional[str]:
+        row = self.conn.execute("SELECT version FROM profiles WHERE id = ?", (profile_id,)).fetchone()
+        return str(row[0]) if row else None
+
+    def load(self, profile_id: str):
+        row = self.conn.execute("SELECT version, data FROM profiles WHERE id = ?", (profile_id,)).fetchone()
+        return (str(row[0]), json.loads(row[1])) if row else None
+
+    def save(self, profile_id: str, data: Dict[str, Any]) -> str:
+        payload = json.dumps(data, ensure_ascii=False)
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            row = self.conn.execute("SELECT version, data FROM profiles WHERE id = ?", (profile_id,)).fetchone()
+            if row and row[1] == payload:
+                return str(row[0])
+            version = (row[0] if row else 0) + 1
+            self.conn.execute(
+                "INSERT OR REPLACE INTO profiles (id, version, updated, data) VALUES (?, ?, ?, ?)",
+                (profile_id, version, time.strftime("%Y-%m-%dT%H:%M:%S"), payload),
+            )
+        return str(version)
+
+    def remove(self, profile_id: str) -> bool:
+        with self.conn:
+            return self.conn.execute("DELETE FROM profiles WHERE id = ?", (profile_id,)).rowcount > 0
+
+    def list(self) -> List[Dict[str, Any]]:
+        rows = self.conn.execute("SELECT id, version, updated FROM profiles ORDER BY id").fetchall()
+        return [{"id": i, "version": str(v), "updated": u} for i, v, u in rows]
+
+
+class S3Backend:
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None, client=None):
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError("boto3 is not installed. `pip install boto3`.")
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.s3 = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, profile_id: str) -> str:
+        return f"{self.prefix}{profile_id}.json"
+
+    @staticmethod
+    def _missing(e: Exception) -> bool:
+        code = str(getattr(e, "response", {}).get("Error", {}).get("Code", ""))
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    def version(self, profile_id: str) -> Optional[str]:
+        try:
+            return self.s3.head_object(Bucket=self.bucket, Key=self._key(profile_id))["ETag"]
+        except Exception as e:
+            if self._missing(e):
+                return None
+            raise
+
+    def load(self, profile_id: str):
+        try:
+            obj = self.s3.get_object(Bucket=self.bucket, Key=self._key(profile_id))
+        except Exception as e:
+            if self._missing(e):
+                return None
+            raise
+        raw = obj["Body"].read()
+        # Try utf-8 then latin-1 fallback
+        try:
+            body = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            body = raw.decode("latin-1")
+        return obj["ETag"], json.loads(body)
+
+    def save(self, profile_id: str, data: Dict[str, Any]) -> str:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        resp = self.s3.put_object(Bucket=self.bucket, Key=self._key(profile_id), Body=body,
+                                  ContentType="application/json")
+        return resp["ETag"]
+
+    def remove(self, profile_id: str) -> bool:
+        if self.version(profile_id) is None:
+            return False
+        self.s3.delete_object(Bucket=self.bucket, Key=self._key(profile_id))
+        return True
+
+    def list(self) -> List[Dict[str, Any]]:
+        rows = []
+        for page in self.s3.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                key = obj["Key"]
+                if key.endswith(".json"):
+                    rows.append({
+                        "id": key[len(self.prefix):-5],
+                        "version": obj["ETag"],
+                        "updated": obj["LastModified"].strftime("%Y-%m-%dT%H:%M:%S"),
+                    })
+        return rows
+
+
+class JsonFileBackend:
+    """Profiles as JSON files; the id is the file name (or a path relative to the directory)."""
+
+    def __init__(self, directory: str = "."):
+        self.directory = directory
+
+    def _path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, profile_id)
+
+    def version(self, profile_id: str) -> Optional[str]:
+        try:
+            st = os.stat(self._path(profile_id))
+        except OSError:
+            return None
+        return f"{st.st_mtime_ns}:{st.st_size}"
+
+    def load(self, profile_id: str):
+        version = self.version(profile_id)
+        try:
+            with open(self._path(profile_id), "r", encoding="utf-8") as f:
+                return version, json.load(f)
+        except OSError:
+            return None
+
+    def save(self, profile_id: str, data: Dict[str, Any]) -> str:
+        path = self._path(profile_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return self.version(profile_id)
+
+    def remove(self, profile_id: str) -> bool:
+        try:
+            os.remove(self._path(profile_id))
+            return True
+        except OSError:
+            return False
+
+    def list(self) -> List[Dict[str, Any]]:
+        rows = []
+        for fname in sorted(os.listdir(self.directory)):
+            if fname.endswith(".json"):
+                mtime = os.path.getmtime(self._path(fname))
+                rows.append({"id": fname, "version": self.version(fname),
+                             "updated": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(mtime))})
+        return rows
+
+
+# ----------------------------
+# Store
+# ----------------------------
+
+class ProfileStore:
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else SQLiteBackend()
+        # id -> prepared profile, kept for the life of this object
+        self._memo: Dict[str, Profile] = {}
+
+    @classmethod
+    def from_env(cls, db_path: Optional[str] = None) -> "ProfileStore":
+        bucket = os.getenv("PDF_PROFILE_S3_BUCKET")
+        if bucket and not db_path:
+            return cls(S3Backend(bucket, os.getenv("PDF_PROFILE_S3_PREFIX", ""),
+                                 os.getenv("PDF_PROFILE_S3_ENDPOINT") or None))
+        return cls(SQLiteBackend(db_path or DEFAULT_DB))
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        """Prepared profile, re-read from the backend only if its version changed."""
+        cached = self._memo.get(profile_id)
+        if cached is not None and cached.version == self.backend.version(profile_id):
+            return cached
+        loaded = self.backend.load(profile_id)
+        if loaded is None:
+            self._memo.pop(profile_id, None)
+            return None
+        version, data = loaded
+        profile = Profile(profile_id, version, data)
+        self._memo[profile_id] = profile
+        return profile
+
+    def put(self, profile_id: str, data: Dict[str, Any]) -> str:
+        """Store a profile; returns its new version (unchanged if the data is)."""
+        self._memo.pop(profile_id, None)
+        return self.backend.save(profile_id, data)
+
+    def remove(self, profile_id: str) -> bool:
+        self._memo.pop(profile_id, None)
+        return self.backend.remove(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return self.backend.list()
+
+    def preload(self, profile_ids) -> int:
+        """Prepare these profiles (e.g. before forking workers that inherit them)."""
+        for profile_id in profile_ids:
+            profile = self.get(profile_id)
+            if profile is not None:
+                profile.matcher
+        return len(self._memo)
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+
+def _read_json(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Manage stored patient profiles")
+    ap.add_argument("--db", help="SQLite database (default: PDF_PROFILE_DB, or S3 if PDF_PROFILE_S3_BUCKET is set)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    put = sub.add_parser("put", help="Store a profile from a JSON file")
+    put.add_argument("id")
+    put.add_argument("json")
+    imp = sub.add_parser("import", help="Store JSON files as profiles named after the file")
+    imp.add_argument("json", nargs="+")
+    sub.add_parser("list", help="List stored profiles")
+    show = sub.add_parser("show", help="Print a profile and its flattened keys")
+    show.add_argument("id")
+    rm = sub.add_parser("remove", help="Delete a profile")
+    rm.add_argument("id")
+    args = ap.parse_args()
+
+    store = ProfileStore.from_env(args.db)
+
+    if args.cmd == "put":
+        version = store.put(args.id, _read_json(args.json))
+        print(f"Stored {args.id} (version {version})")
+    elif args.cmd == "import":
+        for path in args.json:
+            profile_id = os.path.basename(path)
+            print(f"Stored {profile_id} (version {store.put(profile_id, _read_json(path))})")
+    elif args.cmd == "list":
+        for row in store.list():
+            print(f"{row['id']}  v{row['version']}  {row['updated']}")
+    elif args.cmd == "show":
+        profile = store.get(args.id)
+        if profile is None:
+            print(f"ERROR: no profile '{args.id}'", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps({"id": profile.id, "version": profile.version, "schema": profile.schema,
+                          "flat": profile.flat}, indent=2, ensure_ascii=False))
+    elif args.cmd == "remove":
+        if not store.remove(args.id):
+            print(f"ERROR: no profile '{args.id}'", file=sys.stderr)
+            sys.exit(1)
+        print(f"Removed {args.id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Template fingerprint registry for AcroForm PDFs.
+
+The same insurer forms are uploaded again and again. A template is identified
+by a fingerprint of its AcroForm structure: the qualified name, field type and
+widget rectangle of every field, read from /AcroForm /Fields without walking
+pages or reading values. Filled and blank copies of a form share a fingerprint.
+
+The registry stores one field dump per (fingerprint, dump version):
+
+    templates/<fingerprint>/meta.json   name, source file, first seen
+    templates/<fingerprint>/v<N>.json   field dump written by json_dump2 version N
+    templates/<fingerprint>/template.pdf  copy of the form, kept once FDF/XFDF
+                                          data refers to it (see form_data.py)
+
+Each template has its own directory, so concurrent pipeline runs never race
+on a shared index. Bumping json_dump2.DUMP_VERSION makes old dumps misses
+without deleting them.
+
+Usage:
+    python template_registry.py fingerprint "health-declaration-statement.pdf"
+    python template_registry.py list
+    python template_registry.py show <fingerprint>
+    python template_registry.py remove <fingerprint>
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject
+
+from pdf_source import PdfSource, open_reader
+
+DEFAULT_STORE = os.getenv(
+    "PDF_TEMPLATE_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"),
+)
+
+# Rects are rounded so re-saved copies with float noise still match
+RECT_PRECISION = 1
+
+
+def _resolve(obj):
+    try:
+        return obj.get_object() if isinstance(obj, IndirectObject) else obj
+    except Exception:
+        return obj
+
+
+def _str_or_none(obj: Any) -> Optional[str]:
+    return None if obj is None else str(obj)
+
+
+def _rect(obj: Any) -> Optional[List[float]]:
+    obj = _resolve(obj)
+    if not obj:
+        return None
+    try:
+        return [round(float(x), RECT_PRECISION) for x in obj]
+    except Exception:
+        return None
+
+
+def acroform_fields(reader: PdfReader) -> Optional[ArrayObject]:
+    root = _resolve(reader.trailer.get("/Root"))
+    acro = _resolve(root.get("/AcroForm")) if isinstance(root, DictionaryObject) else None
+    fields = _resolve(acro.get("/Fields")) if isinstance(acro, DictionaryObject) else None
+    return fields if isinstance(fields, ArrayObject) else None
+
+
+def walk_fields(
+    fields: ArrayObject,
+) -> Iterator[Tuple[str, Optional[str], DictionaryObject, Optional[DictionaryObject], Optional[IndirectObject], bool]]:
+    """
+    Depth-first walk of a /Fields array. Yields, for every field node:
+    (qualified name, inherited /FT, node, parent, ref, is_terminal), where ref
+    is the nearest indirect reference holding the node (the node's own, else
+    its closest indirect ancestor's; None if every hop is direct). Nodes
+    reached twice are yielded once.
+    """
+    seen = set()
+
+    def walk(obj, prefix, ft, parent, holder):
+        node = _resolve(obj)
+        if not isinstance(node, DictionaryObject):
+            return
+        ident = (obj.idnum, obj.generation) if isinstance(obj, IndirectObject) else id(node)
+        if ident in seen:
+            return
+        seen.add(ident)
+        if isinstance(obj, IndirectObject):
+            holder = obj
+
+        partial = _str_or_none(node.get("/T"))
+        name = f"{prefix}.{partial}" if prefix and partial else (partial or prefix)
+        ft = _str_or_none(node.get("/FT")) or ft
+        kids = _resolve(node.get("/Kids"))
+        terminal = not (isinstance(kids, ArrayObject) and len(kids))
+        yield name or "", ft, node, parent, holder, terminal
+        if not terminal:
+            for kid in kids:
+                yield from walk(kid, name, ft, node, holder)
+
+    for obj in fields:
+        yield from walk(obj, "", None, None, None)
+
+
+def field_nodes(reader: PdfReader) -> List[Tuple]:
+    """
+    walk_fields over /AcroForm /Fields as a list (empty without an AcroForm),
+    for callers that need the field tree more than once from one reader.
+    """
+    fields = acroform_fields(reader)
+    return list(walk_fields(fields)) if fields is not None else []
+
+
+def iter_widgets(
+    reader: PdfReader, nodes: Optional[List[Tuple]] = None,
+) -> Iterator[Tuple[str, Optional[str], DictionaryObject, Optional[DictionaryObject]]]:
+    """
+    Yield (qualified name, inherited /FT, widget dict, parent dict) for every
+    terminal widget reachable from /AcroForm /Fields (or in nodes, from field_nodes).
+    """
+    if nodes is None:
+        fields = acroform_fields(reader)
+        if fields is None:
+            return
+        nodes = walk_fields(fields)
+    for name, ft, node, parent, _ref, terminal in nodes:
+        if terminal:
+            yield name, ft, node, parent
+
+
+def qualified_name(node: DictionaryObject) -> str:
+    """Fully qualified field name of a widget or field, following /Parent."""
+    parts: List[str] = []
+    seen = set()
+    while isinstance(node, DictionaryObject) and id(node) not in seen:
+        seen.add(id(node))
+        partial = node.get("/T")
+        if partial is not None:
+            parts.append(str(partial))
+        node = _resolve(node.get("/Parent"))
+    return ".".join(reversed(parts))
+
+
+def inherited(node: DictionaryObject, key: str) -> Any:
+    """Value of an inheritable field attribute (e.g. /FT, /Ff), following /Parent."""
+    seen = set()
+    while isinstance(node, DictionaryObject) and id(node) not in seen:
+        seen.add(id(node))
+        if key in node:
+            return _resolve(node[key])
+        node = _resolve(node.get("/Parent"))
+    return None
+
+
+def fingerprint_reader(reader: PdfReader, nodes: Optional[List[Tuple]] = None) -> Optional[str]:
+    """SHA-256 over sorted (qualified name, /FT, rect) of all widgets; None without an AcroForm."""
+    entries = sorted(
+        (name, ft or "", _rect(widget.get("/Rect")) or [])
+        for name, ft, widget, _parent in iter_widgets(reader, nodes)
+    )
+    if not entries:
+        return None
+    payload = json.dumps(entries, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def fingerprint_pdf(pdf_path: PdfSource) -> Optional[str]:
+    return fingerprint_reader(open_reader(pdf_path))
+
+
+def live_values(reader: PdfReader, nodes: Optional[List[Tuple]] = None) -> Dict[str, Dict[str, Optional[str]]]:
+    """
+    Current /V, /DV and /AS per dump key (widget /T, else parent /T), read the
+    same way json_dump2.extract_field_objects reads them. Used to refresh a
+    cached dump, which otherwise carries the values of the first upload.
+    """
+    out: Dict[str, Dict[str, Optional[str]]] = {}
+    for _name, _ft, widget, parent in iter_widgets(reader, nodes):
+        key = _str_or_none(widget.get("/T"))
+        if not key and isinstance(parent, DictionaryObject):
+            key = _str_or_none(parent.get("/T"))
+        if not key:
+            continue
+        out[key] = {
+            "V": _str_or_none(widget.get("/V")),
+            "DV": _str_or_none(widget.get("/DV")),
+            "AS": _str_or_none(widget.get("/AS")),
+        }
+    return out
+
+
+# ----------------------------
+# Store
+# ----------------------------
+
+class TemplateRegistry:
+    def __init__(self, store_dir: str = DEFAULT_STORE):
+        self.store_dir = store_dir
+        # (fingerprint, version) -> dump, kept for the life of this object
+        self._memo: Dict[Tuple[str, int], Dict[str, Dict[str, Any]]] = {}
+
+    def _dir(self, fingerprint: str) -> str:
+        return os.path.join(self.store_dir, fingerprint)
+
+    def _dump_path(self, fingerprint: str, version: int) -> str:
+        return os.path.join(self._dir(fingerprint), f"v{version}.json")
+
+    @staticmethod
+    def _write_json(path: str, data: Any):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def lookup(self, fingerprint: str, version: int) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Cached field dump for this template and dump version, or None."""
+        dump = self._memo.get((fingerprint, version))
+        if dump is None:
+            try:
+                with open(self._dump_path(fingerprint, version), "r", encoding="utf-8") as f:
+                    dump = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self._memo[(fingerprint, version)] = dump
+        # Callers refresh values in place; keep the memoized copy pristine.
+        # Fields only hold scalars and the rect list, so copying each field is enough.
+        return {name: dict(field) for name, field in dump.items()}
+
+    def preload(self, version: int) -> int:
+        """
+        Read every dump of this version into memory, e.g. before forking worker
+        processes so they inherit the registry instead of re-reading it.
+        """
+        for row in self.list():
+            self.lookup(row["fingerprint"], version)
+        return len(self._memo)
+
+    def _ensure_meta(self, fingerprint: str, source: str):
+        os.makedirs(self._dir(fingerprint), exist_ok=True)
+        meta_path = os.path.join(self._dir(fingerprint), "meta.json")
+        if not os.path.exists(meta_path):
+            self._write_json(meta_path, {
+                "fingerprint": fingerprint,
+                "name": os.path.splitext(os.path.basename(source))[0],
+                "source": os.path.basename(source),
+                "first_seen": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            })
+
+    def register(self, fingerprint: str, version: int, fields: Dict[str, Dict[str, Any]], source: str):
+        self._ensure_meta(fingerprint, source)
+        self._write_json(self._dump_path(fingerprint, version), fields)
+        self._memo[(fingerprint, version)] = copy.deepcopy(fields)
+
+    def pdf_path(self, fingerprint: str) -> Optional[str]:
+        """The stored copy of this template's PDF, or None."""
+        path = os.path.join(self._dir(fingerprint), "template.pdf")
+        return path if os.path.exists(path) else None
+
+    def save_pdf(self, fingerprint: str, pdf_path: PdfSource) -> str:
+        """Keep a copy of the template's PDF (the first one seen wins); returns its path."""
+        path = self.pdf_path(fingerprint)
+        if path is None:
+            source = os.fspath(pdf_path)
+            self._ensure_meta(fingerprint, source)
+            path = os.path.join(self._dir(fingerprint), "template.pdf")
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, path)
+        return path
+
+    def meta(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self._dir(fingerprint), "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        meta["versions"] = sorted(
+            int(fname[1:-5]) for fname in os.listdir(self._dir(fingerprint))
+            if fname.startswith("v") and fname.endswith(".json")
+        )
+        return meta
+
+    def list(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.store_dir):
+            return []
+        rows = [self.meta(fp) for fp in sorted(os.listdir(self.store_dir))]
+        return [row for row in rows if row]
+
+    def remove(self, fingerprint: str) -> bool:
+        if not os.path.isdir(self._dir(fingerprint)):
+            return False
+        self._memo = {k: v for k, v in self._memo.items() if k[0] != fingerprint}
+        shutil.rmtree(self._dir(fingerprint))
+        return True
+
+    def resolve_prefix(self, prefix: str) -> Optional[str]:
+        """Full fingerprint for a unique prefix (like short git hashes)."""
+        matches = [row["fingerprint"] for row in self.list() if row["fingerprint"].startswith(prefix)]
+        return matches[0] if len(matches) == 1 else None
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect the AcroForm template registry")
+    ap.add_argument("--store", default=DEFAULT_STORE, help="Registry directory")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    fp = sub.add_parser("fingerprint", help="Print a PDF's template fingerprint")
+    fp.add_argument("pdf")
+    sub.add_parser("list", help="List registered templates")
+    show = sub.add_parser("show", help="Print the newest field dump for a template")
+    show.add_argument("fingerprint")
+    rm = sub.add_parser("remove", help="Delete a template and all its dumps")
+    rm.add_argument("fingerprint")
+    args = ap.parse_args()
+
+    registry = TemplateRegistry(args.store)
+
+    if args.cmd == "fingerprint":
+        print(fingerprint_pdf(args.pdf) or "no AcroForm fields")
+        return
+
+    if args.cmd == "list":
+        for row in registry.list():
+            print(f"{row['fingerprint'][:12]}  v{','.join(map(str, row['versions']))}  "
+                  f"{row['first_seen']}  {row['name']}")
+        return
+
+    fingerprint = registry.resolve_prefix(args.fingerprint)
+    if not fingerprint:
+        print(f"ERROR: no unique template matches '{args.fingerprint}'", file=sys.stderr)
+        sys.exit(1)
+
+    if args.cmd == "show":
+        meta = registry.meta(fingerprint)
+        dump = registry.lookup(fingerprint, meta["versions"][-1]) if meta["versions"] else {}
+        print(json.dumps({"meta": meta, "fields": dump}, indent=2, ensure_ascii=False))
+    elif args.cmd == "remove":
+        registry.remove(fingerprint)
+        print(f"Removed {fingerprint}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Background jobs for the PDF pipeline.
+
+Filling a form runs three subprocesses (extract, merge, fill) and takes
+seconds, which is too long to hold an agent tool call or a chat turn open.
+The router agent's PDF tools submit the work here instead and return the job
+handle with an ETA straight away; the job runs on a small worker pool and its
+status is read back with pdf_job_status (agent) or GET /api/pdf/jobs/<id>
+(backend), which share this process-wide registry.
+
+A finished job (done or failed) is announced to every registered listener
+and, when PDF_JOB_WEBHOOK_URL is set, POSTed there as JSON:
+
+    {"event": "pdf_job.finished", "job": {"id": ..., "status": "done", "output": ..., ...}}
+
+ETAs come from a moving average of recent run times per form type, scaled by
+the number of jobs queued ahead.
+
+Environment:
+    PDF_JOB_WORKERS       concurrent pipeline runs (default 2)
+    PDF_JOB_WEBHOOK_URL   endpoint notified when a job finishes (optional)
+    PDF_JOB_KEEP          finished jobs kept for status queries (default 200)
+"""
+
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from tracing import span
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# First-run estimate, before any job of the form type has finished
+DEFAULT_ETA_SECONDS = 8.0
+# Weight of the latest run in the moving average
+ETA_ALPHA = 0.3
+
+
+class PdfJob:
+    __slots__ = ("id", "status", "input", "output", "form_type", "submitted", "started",
+                 "finished", "eta_seconds", "error")
+
+    def __init__(self, input_path: str, output_path: str, form_type: Optional[str], eta_seconds: float):
+        self.id = secrets.token_hex(6)
+        self.status = QUEUED
+        self.input = input_path
+        self.output = output_path
+        self.form_type = form_type
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.eta_seconds = eta_seconds
+        self.error = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def remaining_seconds(self) -> float:
+        """Seconds until the job is expected to finish (0 once it has)."""
+        if self.done:
+            return 0.0
+        return max(0.0, self.submitted + self.eta_seconds - time.time())
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished or time.time()
+        return {
+            "id": self.id,
+            "status": self.status,
+            "input": self.input,
+            "output": self.output,
+            "form_type": self.form_type,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "elapsed_seconds": round(end - self.submitted, 3),
+            "eta_seconds": round(self.eta_seconds, 1),
+            "remaining_seconds": round(self.remaining_seconds(), 1),
+            "error": self.error,
+        }
+
+
+class PdfJobQueue:
+    def __init__(self, max_workers: int = 2, webhook_url: Optional[str] = None, keep: int = 200):
+        self.max_workers = max_workers
+        self.webhook_url = webhook_url
+        self.keep = keep
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pdf-job")
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, PdfJob]" = OrderedDict()
+        self._avg_seconds: Dict[str, float] = {}
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        """Call listener(job_dict) whenever a job finishes."""
+        self._listeners.append(listener)
+
+    def _estimate(self, form_type: Optional[str]) -> float:
+        # Caller holds the lock
+        per_job = self._avg_seconds.get(form_type or "", self._avg_seconds.get("", DEFAULT_ETA_SECONDS))
+        pending = sum(1 for j in self._jobs.values() if not j.done)
+        return per_job * (1 + pending // self.max_workers)
+
+    def submit(self, fn: Callable[[], Any], input_path: str, output_path: str,
+               form_type: Optional[str] = None) -> PdfJob:
+        """Queue fn() (the pipeline run for input_path) and return its job at once."""
+        with self._lock:
+            job = PdfJob(input_path, output_path, form_type, self._estimate(form_type))
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: PdfJob, fn: Callable[[], Any]) -> None:
+        job.started = time.time()
+        job.status = RUNNING
+        try:
+            with span("pdf.job", job_id=job.id, form_type=job.form_type or ""):
+                fn()
+            job.status = DONE
+        except Exception as e:
+            job.error = (getattr(e, "stderr", None) or str(e)).strip()
+            job.status = FAILED
+        job.finished = time.time()
+        if job.status == DONE:
+            self._record_duration(job.form_type, job.finished - job.started)
+        self._notify(job)
+
+    def _record_duration(self, form_type: Optional[str], seconds: float) -> None:
+        with self._lock:
+            for key in {form_type or "", ""}:
+                prev = self._avg_seconds.get(key)
+                self._avg_seconds[key] = seconds if prev is None else prev + ETA_ALPHA * (seconds - prev)
+
+    def _notify(self, job: PdfJob) -> None:
+        record = job.to_dict()
+        for listener in self._listeners:
+            try:
+                listener(record)
+            except Exception:
+                pass
+        if self.webhook_url:
+            try:
+                post_json(self.webhook_url, {"event": "pdf_job.finished", "job": record})
+            except Exception as e:
+                print(f"⚠️ PDF job webhook failed: {e}", file=sys.stderr)
+
+    def _prune(self) -> None:
+        # Caller holds the lock; drop the oldest finished jobs beyond `keep`
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.keep)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[PdfJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, limit: int = 20) -> List[PdfJob]:
+        """Most recent jobs first."""
+        with self._lock:
+            return list(reversed(self._jobs.values()))[:limit]
+
+    def wait(self, job_id: str, timeout: Optional[float] = None, poll: float = 0.05) -> Optional[PdfJob]:
+        """Block until the job finishes or timeout passes; mainly for scripts and tests."""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job.done or (deadline is not None and time.time() >= deadline):
+                return job
+            time.sleep(poll)
+
+
+def post_json(url: str, payload: Dict[str, Any], timeout: float = 5) -> None:
+    import urllib.request
+
+    body = json.dumps(payload, default=str).encode("utf-8")
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    urllib.request.urlopen(req, timeout=timeout).read()
+
+
+jobs = PdfJobQueue(
+    max_workers=int(os.getenv("PDF_JOB_WORKERS", 2)),
+    webhook_url=os.getenv("PDF_JOB_WEBHOOK_URL") or None,
+    keep=int(os.getenv("PDF_JOB_KEEP", 200)),
+)
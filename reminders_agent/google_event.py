@@ -46,8 +46,11 @@ def create_event(summary, start_time, end_time, location=None, description=None,
     if recurrence:
         event['recurrence'] = [recurrence]
 
+    from tracing import span
+
     try:
-        event = service.events().insert(calendarId="primary", body=event).execute()
+        with span("gcal.create_event"):
+            event = service.events().insert(calendarId="primary", body=event).execute()
         print("✅ Event created:", event.get("htmlLink"))
     except Exception as e:
         print("❌ Failed to create event:", e)
\ No newline at end of file
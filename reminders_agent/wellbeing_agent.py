@@ -5,7 +5,7 @@ def create_wellbeing_agent():
     import os 
 
     from .google_event import create_event
-    from tracking_agent.todoist_task import add_task_to_todoist
+    from tracking_agent.todoist_task import add_task_to_todoist, add_tasks_to_todoist
 
     # Bedrock client (credentials already set)
     bedrock = boto3.client(
@@ -85,6 +85,23 @@ def create_wellbeing_agent():
         """
         return add_task_to_todoist(task_name, task_due, priority, labels)
 
+    @tool
+    def create_todoist_tasks(tasks: list) -> str:
+        """
+        Create several wellbeing-related Todoist tasks at once, in a single request.
+
+        Use this when the caregiver asks for more than one habit or self-care task in the same message,
+        e.g. "hydrate every 2 hours, journal at night, walk 3x a week".
+
+        Args:
+            tasks (list): Tasks as dicts with the same fields as `create_todoist_task`:
+                {"task_name": "Hydrate", "task_due": "every 2 hours", "priority": 3, "labels": ["hydration"]}
+
+        Returns:
+            str: One line per task with the Todoist result.
+        """
+        return add_tasks_to_todoist(tasks)
+
     wellbeing_agent = Agent(
         name="WellbeingAgent",
         model="us.anthropic.claude-sonnet-4-20250514-v1:0",
@@ -95,10 +112,11 @@ def create_wellbeing_agent():
         - If needed, suggest local or online resources, support groups, respite care, or hotlines.
         - If the caregiver mentions needing a block of rest time, personal time or self-care, 
         or clearly wants professional help (e.g. therapy session, support group), delegate to the Appointments Agent. 
-        - If they want to track tasks (e.g. "meditation", "exercise"), use the `create_todoist_task` tool. 
+        - If they want to track tasks (e.g. "meditation", "exercise"), use the `create_todoist_task` tool,
+        or `create_todoist_tasks` when there are several at once. 
         Always explain what you’re doing, and confirm before creating an appointment.
         """,
-        tools=[create_calendar_event, create_todoist_task] 
+        tools=[create_calendar_event, create_todoist_task, create_todoist_tasks] 
     )
 
     return wellbeing_agent
@@ -1,7 +1,14 @@
 from strands import Agent, tool
 import boto3
 import os
+import sys
 
+# pdf/ for the merge step of the PDF pipeline, which runs in-process
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdf"))
+import fetchdb
+
+from tracing import traced, span, subprocess_env
+from pdf_jobs import jobs as pdf_jobs
 from reminders_agent.medicine_agent import create_medicine_agent
 from reminders_agent.appointments_agent import create_appointments_agent
 from tracking_agent.todo_agent import create_todo_agent
@@ -17,6 +24,7 @@ bedrock = boto3.client(
 
 # Create sub-agents
 @tool
+@traced("tool.medicine_agent")
 def medicine_agent(query: str) -> str:
     """
     This tool handles queries related to medicine reminders. 
@@ -27,6 +35,7 @@ def medicine_agent(query: str) -> str:
     return agent(query)
 
 @tool
+@traced("tool.appointment_agent")
 def appointment_agent(query: str) -> str:
     """
     This tool handles queries related to appointments. 
@@ -37,6 +46,7 @@ def appointment_agent(query: str) -> str:
     return agent(query)
 
 @tool
+@traced("tool.todo_agent")
 def todo_agent(query: str) -> str:
     """
     This tool handles queries related to general to-do tasks.
@@ -48,6 +58,7 @@ def todo_agent(query: str) -> str:
 
 
 @tool
+@traced("tool.wellbeing_agent")
 def wellbeing_agent(query: str) -> str:
     """
     Handle caregiver wellbeing requests. 
@@ -58,6 +69,7 @@ def wellbeing_agent(query: str) -> str:
 
 # Medicine image analysis tool
 @tool
+@traced("tool.analyze_medicine_image")
 def analyze_medicine_image(image_path: str) -> str:
     """
     Analyze a medicine image at the given absolute path and create calendar events.
@@ -85,143 +97,185 @@ def analyze_medicine_image(image_path: str) -> str:
         return f"❌ Failed to analyze medicine image: {e}"
 
 # PDF Processing Tools
+def _find_pdf(pdf_path: str):
+    """
+    Resolve a PDF path or bare filename against the common PDF directories.
+    Returns (actual_path, None), or (None, message for the user) if not found.
+    """
+    # Get the project root directory (where superagent_test.py is located)
+    project_root = os.path.dirname(os.path.abspath(__file__))
+
+    # Try to find the PDF file in common locations
+    search_paths = [
+        pdf_path,  # Try the path as provided
+        os.path.join(project_root, "pdf", pdf_path),  # Try in pdf directory
+        os.path.join(project_root, "backend", "pdf_uploads", pdf_path),  # Try in backend uploads
+        os.path.join(project_root, "backend", "pdf_processed", pdf_path),  # Try in backend processed
+        os.path.join(project_root, "pdf", f"{pdf_path}.pdf") if not pdf_path.endswith('.pdf') else os.path.join(project_root, "pdf", pdf_path),  # Try with .pdf extension
+    ]
+
+    for search_path in search_paths:
+        if os.path.exists(search_path):
+            return search_path, None
+
+    # List available PDFs to help user
+    available_pdfs = []
+    search_dirs = [
+        os.path.join(project_root, "pdf"),
+        os.path.join(project_root, "backend", "pdf_uploads"),
+        os.path.join(project_root, "backend", "pdf_processed")
+    ]
+
+    for search_dir in search_dirs:
+        if os.path.exists(search_dir):
+            for file in os.listdir(search_dir):
+                if file.lower().endswith('.pdf'):
+                    # Make path relative to project root for display
+                    rel_path = os.path.relpath(os.path.join(search_dir, file), project_root)
+                    available_pdfs.append(rel_path)
+
+    if available_pdfs:
+        return None, f"❌ PDF file '{pdf_path}' not found.\n\n" \
+                     f"📁 Available PDF files:\n" + \
+                     "\n".join([f"  • {pdf}" for pdf in available_pdfs]) + \
+                     f"\n\n💡 Please use one of the available files above, or upload a new PDF through the frontend."
+    return None, f"❌ PDF file '{pdf_path}' not found and no PDF files are available.\n\n" \
+                 f"💡 Please upload a PDF file through the frontend first, or provide the full path to your PDF file."
+
+
+def _run_pdf_pipeline(actual_pdf_path: str, form_type: str, output_path: str) -> None:
+    """Extract → merge → fill; raises CalledProcessError if a step fails. Runs on a pdf_jobs worker."""
+    import subprocess
+    import tempfile
+
+    print(f"🔄 Processing PDF: {actual_pdf_path}")
+
+    # Step 1: Extract form fields
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fields_json = os.path.join(temp_dir, "fields.json")
+        with span("pdf.extract_fields"):
+            subprocess.run([
+                "python", "pdf/json_dump2.py",
+                "--pdf", actual_pdf_path,
+                "--out", fields_json
+            ], check=True, capture_output=True, text=True, env=subprocess_env())
+
+        # Step 2: Use appropriate example data based on form type
+        if form_type == "health_declaration":
+            example_data = "pdf/health_example_data.json"
+        else:
+            example_data = "pdf/example_data.json"
+
+        # Step 3: Merge data with fields
+        values_json = os.path.join(temp_dir, "values.json")
+        # In-process, so the prepared example data and stored mappings are reused across jobs
+        with span("pdf.merge_values"):
+            fetchdb.merge_example_data(fields_json, example_data, values_json)
+
+        # Step 4: Fill PDF
+        with span("pdf.fill"):
+            subprocess.run([
+                "python", "pdf/autofill.py",
+                "--pdf-in", actual_pdf_path,
+                "--pdf-out", output_path,
+                "--values", values_json
+            ], check=True, capture_output=True, text=True, env=subprocess_env())
+
+
+def _print_finished_job(job: dict) -> None:
+    if job["status"] == "done":
+        print(f"✅ PDF job {job['id']} done: {job['output']} ({job['elapsed_seconds']:.1f}s)")
+    else:
+        print(f"❌ PDF job {job['id']} failed: {job['error']}")
+
+
+pdf_jobs.add_listener(_print_finished_job)
+
+
+def _describe_job(job) -> str:
+    info = job.to_dict()
+    lines = [f"🆔 Job: {info['id']}",
+             f"📄 Input PDF: {info['input']}",
+             f"📄 Output PDF: {info['output']}",
+             f"🏷️ Form type: {info['form_type'] or 'auto-detected'}"]
+    if info["status"] == "done":
+        lines.insert(0, "✅ PDF processed successfully!\n")
+        lines.append(f"⏱️ Took {info['elapsed_seconds']:.1f}s")
+    elif info["status"] == "failed":
+        lines.insert(0, "❌ Error processing PDF\n")
+        lines.append(f"⚠️ {info['error']}")
+    else:
+        lines.insert(0, f"⏳ PDF job {info['status']}\n")
+        lines.append(f"⏱️ About {info['remaining_seconds']:.0f}s remaining")
+    return "\n".join(lines)
+
+
 @tool
+@traced("tool.process_insurance_pdf")
 def process_insurance_pdf(pdf_path: str, form_type: str = None, output_path: str = None) -> str:
     """
     Process an insurance PDF using the existing PDF processing workflow.
-    
+
     This tool extracts form fields from a PDF, generates appropriate data, and fills the PDF.
     It can handle health declaration forms, medical claim forms, and other insurance documents.
-    
+    Filling runs in the background: the tool returns a job ID and an ETA straight away;
+    check on it with pdf_job_status.
+
     Args:
         pdf_path: Path to the PDF file (local path or filename)
         form_type: Type of form for better data generation (optional)
                   - "health_declaration" for health declaration forms
                   - "medical_claim" for medical/accident claim forms
         output_path: Path for the filled PDF output (optional, auto-generated if not provided)
-    
+
     Returns:
-        String with processing results and file locations
-    
+        String with the job ID, file locations and estimated time to completion
+
     Examples:
         - "Process the PDF at /path/to/insurance_form.pdf"
         - "Fill up my health-declaration-form.pdf"
         - "Process the medical claim PDF with form type medical_claim"
     """
     try:
-        import subprocess
-        import json
-        import tempfile
         from pathlib import Path
-        
-        # Get the project root directory (where superagent_test.py is located)
-        project_root = os.path.dirname(os.path.abspath(__file__))
-        
-        # Try to find the PDF file in common locations
-        actual_pdf_path = None
-        search_paths = [
-            pdf_path,  # Try the path as provided
-            os.path.join(project_root, "pdf", pdf_path),  # Try in pdf directory
-            os.path.join(project_root, "backend", "pdf_uploads", pdf_path),  # Try in backend uploads
-            os.path.join(project_root, "backend", "pdf_processed", pdf_path),  # Try in backend processed
-            os.path.join(project_root, "pdf", f"{pdf_path}.pdf") if not pdf_path.endswith('.pdf') else os.path.join(project_root, "pdf", pdf_path),  # Try with .pdf extension
-        ]
-        
-        for search_path in search_paths:
-            if os.path.exists(search_path):
-                actual_pdf_path = search_path
-                break
-        
+
+        actual_pdf_path, not_found = _find_pdf(pdf_path)
         if not actual_pdf_path:
-            # List available PDFs to help user
-            available_pdfs = []
-            search_dirs = [
-                os.path.join(project_root, "pdf"),
-                os.path.join(project_root, "backend", "pdf_uploads"),
-                os.path.join(project_root, "backend", "pdf_processed")
-            ]
-            
-            for search_dir in search_dirs:
-                if os.path.exists(search_dir):
-                    for file in os.listdir(search_dir):
-                        if file.lower().endswith('.pdf'):
-                            # Make path relative to project root for display
-                            rel_path = os.path.relpath(os.path.join(search_dir, file), project_root)
-                            available_pdfs.append(rel_path)
-            
-            if available_pdfs:
-                return f"❌ PDF file '{pdf_path}' not found.\n\n" \
-                       f"📁 Available PDF files:\n" + \
-                       "\n".join([f"  • {pdf}" for pdf in available_pdfs]) + \
-                       f"\n\n💡 Please use one of the available files above, or upload a new PDF through the frontend."
-            else:
-                return f"❌ PDF file '{pdf_path}' not found and no PDF files are available.\n\n" \
-                       f"💡 Please upload a PDF file through the frontend first, or provide the full path to your PDF file."
-        
+            return not_found
+
         # Generate output path if not provided
         if not output_path:
             pdf_file = Path(actual_pdf_path)
             output_path = str(pdf_file.parent / f"{pdf_file.stem}_filled{pdf_file.suffix}")
-        
-        print(f"🔄 Processing PDF: {actual_pdf_path}")
-        
-        # Step 1: Extract form fields
-        with tempfile.TemporaryDirectory() as temp_dir:
-            fields_json = os.path.join(temp_dir, "fields.json")
-            result = subprocess.run([
-                "python", "pdf/json_dump2.py",
-                "--pdf", actual_pdf_path,
-                "--out", fields_json
-            ], check=True, capture_output=True, text=True)
-            
-            # Step 2: Use appropriate example data based on form type
-            if form_type == "health_declaration":
-                example_data = "pdf/health_example_data.json"
-            else:
-                example_data = "pdf/example_data.json"
-            
-            # Step 3: Merge data with fields
-            values_json = os.path.join(temp_dir, "values.json")
-            result = subprocess.run([
-                "python", "pdf/fetchdb.py",
-                "--dump", fields_json,
-                "--example-data", example_data,
-                "--out", values_json
-            ], check=True, capture_output=True, text=True)
-            
-            # Step 4: Fill PDF
-            result = subprocess.run([
-                "python", "pdf/autofill.py",
-                "--pdf-in", actual_pdf_path,
-                "--pdf-out", output_path,
-                "--values", values_json
-            ], check=True, capture_output=True, text=True)
-        
-        return f"✅ PDF processed successfully!\n\n" \
+
+        job = pdf_jobs.submit(lambda: _run_pdf_pipeline(actual_pdf_path, form_type, output_path),
+                              actual_pdf_path, output_path, form_type)
+        return f"⏳ PDF queued for filling (about {job.eta_seconds:.0f}s).\n\n" \
+               f"🆔 Job: {job.id}\n" \
                f"📄 Input PDF: {actual_pdf_path}\n" \
                f"📄 Output PDF: {output_path}\n" \
                f"🏷️ Form type: {form_type or 'auto-detected'}\n" \
-               f"📊 Processing completed successfully!"
-               
-    except subprocess.CalledProcessError as e:
-        return f"❌ Error processing PDF: {e.stderr}"
+               f"💡 Use pdf_job_status with job ID {job.id} to check when it is ready."
+
     except Exception as e:
         return f"❌ Unexpected error: {str(e)}"
 
 @tool
+@traced("tool.fill_health_declaration_form")
 def fill_health_declaration_form(pdf_path: str) -> str:
     """
     Fill out a health declaration form specifically.
-    
+
     This tool is optimized for health declaration forms and will use appropriate
     sample data for fields like policy number, NRIC, contact details, etc.
-    
+    Runs in the background like process_insurance_pdf.
+
     Args:
         pdf_path: Path to the health declaration PDF file (can be just filename)
-    
+
     Returns:
-        String with processing results
-    
+        String with the job ID and estimated time to completion
+
     Examples:
         - "Fill up my health-declaration-form.pdf"
         - "Process the health declaration at /path/to/health_form.pdf"
@@ -229,19 +283,21 @@ def fill_health_declaration_form(pdf_path: str) -> str:
     return process_insurance_pdf(pdf_path, form_type="health_declaration")
 
 @tool
+@traced("tool.fill_medical_claim_form")
 def fill_medical_claim_form(pdf_path: str) -> str:
     """
     Fill out a medical claim form specifically.
-    
+
     This tool is optimized for medical and accident claim forms and will use
     appropriate sample data for fields like diagnosis, hospital details, etc.
-    
+    Runs in the background like process_insurance_pdf.
+
     Args:
         pdf_path: Path to the medical claim PDF file (can be just filename)
-    
+
     Returns:
-        String with processing results
-    
+        String with the job ID and estimated time to completion
+
     Examples:
         - "Fill up my medical-claim-form.pdf"
         - "Process the accident claim at /path/to/claim_form.pdf"
@@ -249,6 +305,34 @@ def fill_medical_claim_form(pdf_path: str) -> str:
     return process_insurance_pdf(pdf_path, form_type="medical_claim")
 
 @tool
+@traced("tool.pdf_job_status")
+def pdf_job_status(job_id: str = "") -> str:
+    """
+    Check on a PDF filling job started by process_insurance_pdf or the fill_* tools.
+
+    Args:
+        job_id: Job ID returned when the PDF was queued (optional; empty lists recent jobs)
+
+    Returns:
+        String with the job status, output file once ready, or the error if it failed
+
+    Examples:
+        - "Is my form ready?"
+        - "Check PDF job 3f9c2a1b7e04"
+    """
+    if job_id:
+        job = pdf_jobs.get(job_id.strip())
+        if job is None:
+            return f"❌ No PDF job with ID '{job_id}'."
+        return _describe_job(job)
+
+    recent = pdf_jobs.list(limit=10)
+    if not recent:
+        return "📄 No PDF jobs have been submitted yet."
+    return "\n\n".join(_describe_job(job) for job in recent)
+
+@tool
+@traced("tool.list_pdf_files")
 def list_pdf_files(directory: str = "all") -> str:
     """
     List available PDF files in common directories.
@@ -326,12 +410,15 @@ router_agent = Agent(
         "- PDF processing, insurance forms, document filling (use PDF tools)\n"
         "  * Keywords: 'fill up', 'process PDF', 'health declaration', 'medical claim', 'insurance form', 'PDF form'\n"
         "  * Examples: 'Fill up my health-declaration-form.pdf', 'Process the insurance form', 'Fill out the medical claim'\n"
+        "  * Filling runs in the background: reply with the job ID and ETA right away, and use pdf_job_status\n"
+        "    when the user asks whether their form is ready\n"
         "- If unsure, confirm with the user on which function they would like to use.\n"
         "Forward the request to the correct agent and return their response."
     ),
     tools=[medicine_agent, appointment_agent, todo_agent, wellbeing_agent,
            analyze_medicine_image,
-           process_insurance_pdf, fill_health_declaration_form, fill_medical_claim_form, list_pdf_files]
+           process_insurance_pdf, fill_health_declaration_form, fill_medical_claim_form, pdf_job_status,
+           list_pdf_files]
 )
 
 # ---------- Example usage ----------
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark pdf/field_matcher.FieldMatcher against the previous fetchdb matcher
+(first substring hit, then difflib.get_close_matches) on synthetic inputs.
+
+Field titles are perturbed copies of data keys (dropped/reordered words,
+typos, extra words) plus unrelated titles that should not match. The legacy
+matcher is timed on a sample of fields and extrapolated, since a full 5k x 5k
+run takes minutes.
+
+Usage:
+    python tests/bench_field_matcher.py
+    python tests/bench_field_matcher.py --fields 5000 --keys 5000 --legacy-sample 200
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from difflib import get_close_matches
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pdf'))
+
+import field_matcher  # noqa: E402
+from field_matcher import FieldMatcher, default_normalize  # noqa: E402
+
+WORDS = (
+    "policy holder insured name date birth address postal code contact number email hospital "
+    "admission discharge diagnosis doctor clinic claim amount benefit accident injury illness "
+    "surgery treatment outpatient inpatient bank account branch payee relationship occupation "
+    "employer nric passport nationality gender marital status signature witness declaration "
+    "premium rider plan coverage cancer critical disability terminal maternity juvenile senior"
+).split()
+
+
+def legacy_best_match_key(field_name, norm_to_original):
+    """fetchdb.best_match_key before the indexed matcher."""
+    norm = default_normalize(field_name)
+    if norm in norm_to_original:
+        return norm_to_original[norm]
+    candidates = list(norm_to_original.keys())
+    for candidate in candidates:
+        if norm in candidate or candidate in norm:
+            return norm_to_original[candidate]
+    hit = get_close_matches(norm, candidates, n=1, cutoff=0.7)
+    if hit:
+        return norm_to_original[hit[0]]
+    return None
+
+
+def make_inputs(n_fields, n_keys, seed):
+    rng = random.Random(seed)
+    keys = set()
+    while len(keys) < n_keys:
+        section = rng.choice(["personal_info", "claim", "hospital", "payment", "policy", "medical"])
+        keys.add(f"{section}.{'_'.join(rng.sample(WORDS, rng.randint(2, 5)))}")
+    keys = sorted(keys)
+
+    fields, expected = [], []
+    for _ in range(n_fields):
+        key = rng.choice(keys)
+        words = key.split(".", 1)[1].split("_")
+        kind = rng.random()
+        if kind < 0.3:
+            title = " ".join(w.capitalize() for w in words)
+        elif kind < 0.5:
+            w = list(words)
+            i = rng.randrange(len(w))
+            if len(w[i]) > 3:
+                j = rng.randrange(1, len(w[i]) - 1)
+                w[i] = w[i][:j] + w[i][j + 1:]
+            title = " ".join(w)
+        elif kind < 0.7:
+            title = " ".join(words + [rng.choice(WORDS)])
+        elif kind < 0.85:
+            title = " ".join(words[1:] + words[:1]) if len(words) > 1 else words[0]
+        else:
+            title, key = f"Unrelated field {rng.randint(0, 10 ** 6)}", None
+        fields.append(title)
+        expected.append(key)
+    return fields, keys, expected
+
+
+def accuracy(results, expected):
+    right = sum(1 for got, want in zip(results, expected) if got == want)
+    return round(right / len(expected), 3)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the indexed field matcher")
+    ap.add_argument("--fields", type=int, default=5000)
+    ap.add_argument("--keys", type=int, default=5000)
+    ap.add_argument("--legacy-sample", type=int, default=200, help="Fields to time with the legacy matcher")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    fields, keys, expected = make_inputs(args.fields, args.keys, args.seed)
+    print(f"{len(fields)} fields x {len(keys)} keys (numpy: {'yes' if field_matcher.np is not None else 'no'})")
+
+    modes = [False] + ([True] if field_matcher.np is not None else [])
+    results = None
+    for use_numpy in modes:
+        t0 = time.perf_counter()
+        matcher = FieldMatcher(keys, use_numpy=use_numpy)
+        t1 = time.perf_counter()
+        got = [matcher.match(f) for f in fields]
+        t2 = time.perf_counter()
+        label = "indexed (numpy)" if use_numpy else "indexed (python)"
+        print(f"{label:18} build {1000 * (t1 - t0):8.1f} ms  match {1000 * (t2 - t1):9.1f} ms  "
+              f"{1e6 * (t2 - t1) / len(fields):7.1f} us/field  accuracy {accuracy(got, expected)}")
+        if results is not None and got != results:
+            print("❌ numpy and python paths disagree")
+            sys.exit(1)
+        results = got
+
+    sample = min(args.legacy_sample, len(fields))
+    norm_to_original = {default_normalize(k): k for k in keys}
+    t0 = time.perf_counter()
+    legacy = [legacy_best_match_key(f, norm_to_original) for f in fields[:sample]]
+    elapsed = time.perf_counter() - t0
+    print(f"{'legacy (difflib)':18} build {0.0:8.1f} ms  match {1000 * elapsed * len(fields) / sample:9.1f} ms  "
+          f"{1e6 * elapsed / sample:7.1f} us/field  accuracy {accuracy(legacy, expected[:sample])}"
+          f"  (extrapolated from {sample} fields)")
+
+
+if __name__ == "__main__":
+    main()
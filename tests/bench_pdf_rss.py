@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Peak memory of the PDF stages on a large scanned claim bundle.
+
+Builds a synthetic bundle: the health declaration form followed by --pages
+scanned pages (one incompressible --image-kb image each), then runs each stage
+in a fresh process and reports its peak RSS (VmHWM) and, at exit, the
+anonymous (private) and file-backed parts of its RSS. Memory-mapped input
+shows up as file-backed pages from the page cache, shared between processes;
+buffered input shows up as private memory.
+
+Usage:
+    python tests/bench_pdf_rss.py
+    python tests/bench_pdf_rss.py --pages 300 --image-kb 1024 --keep
+"""
+
+import argparse
+import ast
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PDF_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pdf')
+sys.path.insert(0, PDF_DIR)
+
+from PyPDF2 import PdfReader, PdfWriter  # noqa: E402
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject, NumberObject  # noqa: E402
+
+FORM = os.path.join(PDF_DIR, 'health-declaration-statement.pdf')
+
+# Runs in the child: the stage, then its memory figures as the last stderr line
+CHILD = r'''
+import os, resource, runpy, sys
+stage = sys.argv[1]
+if stage == "pipeline":
+    import process_insurance_pdf_smart as smart
+    row = smart.process_pdf_in_process(sys.argv[2], sys.argv[3])
+    if not row["ok"]:
+        sys.exit(row["error"])
+else:
+    sys.argv = sys.argv[1:]
+    runpy.run_path(stage, run_name="__main__")
+mem = {"VmHWM": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+if os.path.exists("/proc/self/status"):
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmHWM", "RssAnon", "RssFile"):
+                mem[key] = int(value.split()[0])
+print("MEM", mem, file=sys.stderr)
+'''
+
+
+def build_bundle(path, pages, image_kb):
+    writer = PdfWriter()
+    writer.append(PdfReader(FORM))
+    side = int((image_kb * 1024 / 3) ** 0.5)
+    for _ in range(pages):
+        writer.add_blank_page(612, 792)
+        image = DecodedStreamObject()
+        image.set_data(os.urandom(side * side * 3))
+        image.update({
+            NameObject('/Type'): NameObject('/XObject'),
+            NameObject('/Subtype'): NameObject('/Image'),
+            NameObject('/Width'): NumberObject(side),
+            NameObject('/Height'): NumberObject(side),
+            NameObject('/ColorSpace'): NameObject('/DeviceRGB'),
+            NameObject('/BitsPerComponent'): NumberObject(8),
+        })
+        content = DecodedStreamObject()
+        content.set_data(b'q 612 0 0 792 0 0 cm /Scan Do Q')
+        page = writer.pages[len(writer.pages) - 1]
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/XObject'): DictionaryObject({NameObject('/Scan'): writer._add_object(image)}),
+        })
+        page[NameObject('/Contents')] = writer._add_object(content)
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return len(writer.pages)
+
+
+def run_stage(name, args, env):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', CHILD] + args, cwd=PDF_DIR, env=env,
+                          capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    lines = [line for line in proc.stderr.splitlines() if line.startswith('MEM ')]
+    if proc.returncode or not lines:
+        print(f'{name:24s} FAILED\n{proc.stderr[-2000:]}')
+        return
+    mem = ast.literal_eval(lines[-1][4:])
+    cols = '  '.join(f'{k} {mem[k] / 1024:7.1f} MB' for k in ('VmHWM', 'RssAnon', 'RssFile') if k in mem)
+    print(f'{name:24s} {seconds:6.2f} s  {cols}')
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('--pages', type=int, default=200, help='Scanned pages after the form')
+    ap.add_argument('--image-kb', type=int, default=1024, help='Size of each page image')
+    ap.add_argument('--keep', action='store_true', help='Keep the generated bundle')
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench_pdf_rss_')
+    bundle = os.path.join(tmp, 'bundle.pdf')
+    pages = build_bundle(bundle, args.pages, args.image_kb)
+    print(f'Bundle: {os.path.getsize(bundle) / 1e6:.0f} MB, {pages} pages ({bundle})')
+
+    env = dict(os.environ,
+               PYTHONPATH=PDF_DIR,
+               PDF_TEMPLATE_STORE=os.path.join(tmp, 'templates'),
+               PDF_MAPPING_STORE=os.path.join(tmp, 'mappings'))
+    values = os.path.join(tmp, 'values.json')
+    with open(values, 'w', encoding='utf-8') as f:
+        json.dump({'Full Name of policyowner as shown in NRICPassport including alias': 'Tan Ah Kow',
+                   'Policy no': 'P-000123'}, f)
+
+    run_stage('json_dump2', ['json_dump2.py', '--pdf', bundle, '--out', os.path.join(tmp, 'fields.json'),
+                             '--no-registry'], env)
+    run_stage('autofill', ['autofill.py', '--pdf-in', bundle, '--pdf-out', os.path.join(tmp, 'out.pdf'),
+                           '--values', values], env)
+    run_stage('autofill --incremental', ['autofill.py', '--pdf-in', bundle, '--pdf-out',
+                                         os.path.join(tmp, 'out_inc.pdf'), '--values', values,
+                                         '--incremental'], env)
+    run_stage('in-process pipeline', ['pipeline', bundle, os.path.join(tmp, 'out_pipeline.pdf')], env)
+
+    if not args.keep:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the external services the backend talks to.
+
+One HTTP server answers for:
+- Bedrock Runtime  (POST /model/<id>/converse, /model/<id>/converse-stream)
+- Todoist REST/Sync (/rest/v2/tasks..., /sync/v9/sync)
+- Google Calendar  (/calendar/v3/calendars/primary/events)
+
+Each service has a configurable artificial latency so load tests can model
+slow upstreams. Point the backend at it with env_for_backend().
+"""
+
+import json
+import re
+import struct
+import threading
+import time
+import urllib.parse
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _eventstream_message(event_type, payload):
+    """Encode one AWS event-stream message (as used by ConverseStream)."""
+    headers = b''
+    for name, value in ((':event-type', event_type),
+                        (':content-type', 'application/json'),
+                        (':message-type', 'event')):
+        n, v = name.encode(), value.encode()
+        headers += struct.pack('B', len(n)) + n + b'\x07' + struct.pack('>H', len(v)) + v
+    body = json.dumps(payload).encode()
+    total = 12 + len(headers) + len(body) + 4
+    prelude = struct.pack('>II', total, len(headers))
+    message = prelude + struct.pack('>I', zlib.crc32(prelude)) + headers + body
+    return message + struct.pack('>I', zlib.crc32(message))
+
+
+class FakeUpstreams:
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=None, reply_text='Sure, I can help with that.'):
+        self.latency_ms = {'bedrock': 0, 'todoist': 0, 'calendar': 0}
+        self.latency_ms.update(latency_ms or {})
+        self.reply_text = reply_text
+        self.counts = {'bedrock': 0, 'todoist': 0, 'calendar': 0, 'unknown': 0}
+        self._lock = threading.Lock()
+        self.tasks = [
+            {'id': str(i), 'content': f'Task {i}', 'priority': 1 + i % 4, 'is_completed': False}
+            for i in range(1, 11)
+        ]
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env_for_backend(self):
+        """Environment variables that point the backend and agents at this server."""
+        return {
+            'AWS_ENDPOINT_URL_BEDROCK_RUNTIME': self.url,
+            'AWS_ACCESS_KEY_ID': 'fake',
+            'AWS_SECRET_ACCESS_KEY': 'fake',
+            'AWS_REGION': 'us-east-1',
+            'AWS_DEFAULT_REGION': 'us-east-1',
+            'TODOIST_API_TOKEN': 'fake-token',
+            'TODOIST_API_URL': f"{self.url}/rest/v2",
+            'TODOIST_SYNC_URL': f"{self.url}/sync/v9/sync",
+            'GOOGLE_CALENDAR_API_ENDPOINT': f"{self.url}/calendar/v3/",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-upstreams', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, service):
+        with self._lock:
+            self.counts[service] += 1
+
+    def _handler_class(self):
+        upstreams = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length) if length else b''
+
+            def _send(self, status, body=b'', content_type='application/json'):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _service(self):
+                path = self.path.split('?', 1)[0]
+                if path.startswith('/model/'):
+                    return 'bedrock'
+                if path.startswith('/rest/v2') or path.startswith('/sync/v9'):
+                    return 'todoist'
+                if path.startswith('/calendar/v3'):
+                    return 'calendar'
+                return 'unknown'
+
+            def _dispatch(self, method):
+                service = self._service()
+                upstreams._count(service)
+                delay = upstreams.latency_ms.get(service, 0)
+                if delay:
+                    time.sleep(delay / 1000.0)
+                body = self._body()
+                handler = getattr(self, f"_{service}", None)
+                if handler is None:
+                    return self._send(404, {'error': 'not found'})
+                return handler(method, self.path.split('?', 1)[0], body)
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+            # ---- Bedrock -------------------------------------------------
+
+            def _bedrock(self, method, path, body):
+                usage = {'inputTokens': 50, 'outputTokens': 10, 'totalTokens': 60}
+                if path.endswith('/converse-stream'):
+                    stream = b''.join([
+                        _eventstream_message('messageStart', {'role': 'assistant'}),
+                        _eventstream_message('contentBlockDelta', {
+                            'contentBlockIndex': 0, 'delta': {'text': upstreams.reply_text}}),
+                        _eventstream_message('contentBlockStop', {'contentBlockIndex': 0}),
+                        _eventstream_message('messageStop', {'stopReason': 'end_turn'}),
+                        _eventstream_message('metadata', {'usage': usage, 'metrics': {'latencyMs': 1}}),
+                    ])
+                    return self._send(200, stream, 'application/vnd.amazon.eventstream')
+                if path.endswith('/converse'):
+                    return self._send(200, {
+                        'output': {'message': {'role': 'assistant', 'content': [{'text': upstreams.reply_text}]}},
+                        'stopReason': 'end_turn',
+                        'usage': usage,
+                        'metrics': {'latencyMs': 1},
+                    })
+                return self._send(404, {'message': 'unknown operation'})
+
+            # ---- Todoist -------------------------------------------------
+
+            def _todoist(self, method, path, body):
+                if path == '/rest/v2/tasks' and method == 'GET':
+                    return self._send(200, upstreams.tasks)
+                if path == '/rest/v2/tasks' and method == 'POST':
+                    task = json.loads(body or b'{}')
+                    task.update({'id': uuid.uuid4().hex[:10], 'is_completed': False})
+                    return self._send(200, task)
+                if re.fullmatch(r'/rest/v2/tasks/[^/]+/close', path):
+                    self.send_response(204)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if path == '/sync/v9/sync':
+                    form = urllib.parse.parse_qs(body.decode())
+                    commands = json.loads(form.get('commands', ['[]'])[0])
+                    return self._send(200, {
+                        'sync_status': {c['uuid']: 'ok' for c in commands},
+                        'temp_id_mapping': {c['temp_id']: uuid.uuid4().hex[:10] for c in commands},
+                    })
+                return self._send(404, {'error': 'not found'})
+
+            # ---- Google Calendar -----------------------------------------
+
+            def _calendar(self, method, path, body):
+                if path.endswith('/events') and method == 'GET':
+                    return self._send(200, {'items': [{
+                        'id': f'evt{i}',
+                        'summary': f'Appointment {i}',
+                        'start': {'dateTime': f'2030-01-0{i}T10:00:00Z'},
+                        'end': {'dateTime': f'2030-01-0{i}T11:00:00Z'},
+                        'htmlLink': f'https://calendar.example/evt{i}',
+                    } for i in range(1, 6)]})
+                if path.endswith('/events') and method == 'POST':
+                    event = json.loads(body or b'{}')
+                    event.update({'id': uuid.uuid4().hex[:10], 'htmlLink': 'https://calendar.example/new'})
+                    return self._send(200, event)
+                return self._send(404, {'error': 'not found'})
+
+        return Handler
+
+
+if __name__ == '__main__':
+    import argparse
+
+    ap = argparse.ArgumentParser(description='Run fake Bedrock/Todoist/Google Calendar upstreams')
+    ap.add_argument('--port', type=int, default=8790)
+    ap.add_argument('--bedrock-latency-ms', type=float, default=0)
+    ap.add_argument('--todoist-latency-ms', type=float, default=0)
+    ap.add_argument('--calendar-latency-ms', type=float, default=0)
+    args = ap.parse_args()
+
+    fake = FakeUpstreams(port=args.port, latency_ms={
+        'bedrock': args.bedrock_latency_ms,
+        'todoist': args.todoist_latency_ms,
+        'calendar': args.calendar_latency_ms,
+    })
+    print(f"Fake upstreams on {fake.url}")
+    for k, v in fake.env_for_backend().items():
+        print(f"export {k}={v}")
+    fake.server.serve_forever()
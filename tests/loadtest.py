@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Reproducible load test for the AHMA backend.
+
+Boots fake Bedrock / Todoist / Google Calendar upstreams (fake_upstreams.py),
+starts backend/app.py against them in a subprocess with throwaway upload
+folders, then drives a seeded mix of chat, PDF upload, PDF process and
+dashboard requests at a target rate. Prints (and optionally writes) a JSON
+report with p50/p95/p99 latency, throughput and error rate per request type.
+
+Usage:
+    python tests/loadtest.py --rps 20 --duration 30
+    python tests/loadtest.py --mix chat=1,dashboard=3 --bedrock-latency-ms 300 --out report.json
+    python tests/loadtest.py --baseline last_release.json --max-regression 0.2
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from fake_upstreams import FakeUpstreams
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(PROJECT_ROOT, 'backend')
+SAMPLE_PDF = os.path.join(PROJECT_ROOT, 'pdf', 'health-declaration-statement.pdf')
+
+DEFAULT_MIX = 'chat=2,upload=1,pdf_process=1,pdf_process_cached=1,dashboard=4'
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return round((sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)) * 1000, 2)
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown request type '{name}'. Choose from: {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# ----------------------------------------------------------------------------
+# Backend process
+# ----------------------------------------------------------------------------
+
+class BackendServer:
+    def __init__(self, env, port, log_path):
+        self.port = port
+        self.env = env
+        self.log_path = log_path
+        self.proc = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout=60):
+        code = (
+            "import app; "
+            f"app.app.run(host='127.0.0.1', port={self.port}, threaded=True, debug=False, use_reloader=False)"
+        )
+        self._log = open(self.log_path, 'w')
+        self.proc = subprocess.Popen(
+            [sys.executable, '-c', code], cwd=BACKEND_DIR, env=self.env,
+            stdout=self._log, stderr=subprocess.STDOUT, text=True,
+        )
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                with open(self.log_path) as f:
+                    raise RuntimeError(f"Backend exited during startup:\n{f.read()}")
+            try:
+                if requests.get(f"{self.url}/health", timeout=1).status_code == 200:
+                    return self
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError("Backend did not become healthy in time")
+
+    def stop(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        if self.proc:
+            self._log.close()
+
+
+# ----------------------------------------------------------------------------
+# Request scenarios
+# ----------------------------------------------------------------------------
+
+CHAT_MESSAGES = [
+    "Remind me to take Amoxicillin at 9 AM tomorrow",
+    "Add water plants to my to-do list for tomorrow",
+    "I feel stressed after caring for my mum all day",
+    "Schedule a check-up with Dr Tan next Monday at 3 PM",
+]
+
+
+def scenario_chat(session, base_url, rng, i):
+    return session.post(f"{base_url}/api/ahma/chat",
+                        json={'message': rng.choice(CHAT_MESSAGES), 'userId': f'load-{i % 50}'},
+                        timeout=60)
+
+
+def scenario_upload(session, base_url, rng, i):
+    with open(SAMPLE_PDF, 'rb') as f:
+        files = {'file': (f'loadtest_{i % 10}.pdf', f, 'application/pdf')}
+        return session.post(f"{base_url}/api/pdf/upload", files=files, timeout=60)
+
+
+def _miss_filename(i):
+    return f'loadtest_miss_{i}.pdf'
+
+
+def _miss_pdf_bytes(sample, i):
+    # A trailing comment after %%EOF changes the content hash (and so the filled-PDF
+    # cache key) without changing the form
+    return sample + f"\n%loadtest {i}\n".encode('ascii')
+
+
+def scenario_pdf_process(session, base_url, rng, i):
+    # Full pipeline: each request fills its own copy, seeded by seed_pdfs(), so it misses the cache
+    return session.post(f"{base_url}/api/pdf/process",
+                        json={'filename': _miss_filename(i), 'form_type': 'health_declaration'},
+                        timeout=120)
+
+
+def scenario_pdf_process_cached(session, base_url, rng, i):
+    # Same PDF and data every time: a filled-PDF cache hit after the first request
+    return session.post(f"{base_url}/api/pdf/process",
+                        json={'filename': os.path.basename(SAMPLE_PDF), 'form_type': 'health_declaration'},
+                        timeout=120)
+
+
+def scenario_dashboard(session, base_url, rng, i):
+    return session.get(f"{base_url}/api/dashboard", timeout=30)
+
+
+SCENARIOS = {
+    'chat': scenario_chat,
+    'upload': scenario_upload,
+    'pdf_process': scenario_pdf_process,
+    'pdf_process_cached': scenario_pdf_process_cached,
+    'dashboard': scenario_dashboard,
+}
+
+
+# ----------------------------------------------------------------------------
+# Load generation
+# ----------------------------------------------------------------------------
+
+def build_plan(mix, rps, duration, seed):
+    """Request type of each request i, drawn from the weighted mix."""
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    return [rng.choices(names, weights)[0] for _ in range(int(rps * duration))]
+
+
+def seed_pdfs(base_url, plan):
+    """Upload the PDFs the plan's process requests refer to, before the clock starts."""
+    with open(SAMPLE_PDF, 'rb') as f:
+        sample = f.read()
+    uploads = [(os.path.basename(SAMPLE_PDF), sample)]
+    uploads += [(_miss_filename(i), _miss_pdf_bytes(sample, i))
+                for i, kind in enumerate(plan) if kind == 'pdf_process']
+    with requests.Session() as session:
+        for filename, data in uploads:
+            session.post(f"{base_url}/api/pdf/upload", files={'file': (filename, data, 'application/pdf')},
+                         timeout=30).raise_for_status()
+
+
+def run_load(base_url, plan, rps, seed, concurrency):
+    """Open-loop load: request i is sent at t0 + i / rps regardless of earlier responses."""
+    local = threading.local()
+    results = []
+    results_lock = threading.Lock()
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session
+
+    def fire(i, kind, scheduled):
+        start = time.perf_counter()
+        status, error = None, None
+        try:
+            resp = SCENARIOS[kind](session(), base_url, random.Random(seed + i), i)
+            status = resp.status_code
+        except Exception as e:
+            error = type(e).__name__
+        latency = time.perf_counter() - start
+        with results_lock:
+            results.append({'kind': kind, 'status': status, 'error': error, 'latency': latency,
+                            'lag': start - scheduled})
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i, kind in enumerate(plan):
+            scheduled = t0 + i / rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, i, kind, scheduled)
+    elapsed = time.perf_counter() - t0
+    return results, elapsed
+
+
+def summarize(results, elapsed):
+    def block(rows):
+        latencies = sorted(r['latency'] for r in rows)
+        errors = sum(1 for r in rows if r['error'] or (r['status'] or 500) >= 400)
+        statuses = {}
+        for r in rows:
+            key = str(r['status'] or r['error'])
+            statuses[key] = statuses.get(key, 0) + 1
+        return {
+            'requests': len(rows),
+            'errors': errors,
+            'error_rate': round(errors / len(rows), 4) if rows else 0.0,
+            'throughput_rps': round(len(rows) / elapsed, 2) if elapsed else 0.0,
+            'p50_ms': _percentile(latencies, 50),
+            'p95_ms': _percentile(latencies, 95),
+            'p99_ms': _percentile(latencies, 99),
+            'max_ms': round(latencies[-1] * 1000, 2) if latencies else None,
+            'statuses': statuses,
+        }
+
+    by_kind = {}
+    for r in results:
+        by_kind.setdefault(r['kind'], []).append(r)
+    lags = sorted(r['lag'] for r in results)
+    return {
+        'elapsed_s': round(elapsed, 2),
+        'overall': block(results),
+        'by_type': {kind: block(rows) for kind, rows in sorted(by_kind.items())},
+        'scheduler_lag_p99_ms': _percentile(lags, 99),
+    }
+
+
+def compare_to_baseline(report, baseline, max_regression):
+    """List of regressions where p95 or error rate got worse than allowed."""
+    problems = []
+    for kind, current in report['by_type'].items():
+        before = baseline.get('by_type', {}).get(kind)
+        if not before:
+            continue
+        if before.get('p95_ms') and current.get('p95_ms') and \
+                current['p95_ms'] > before['p95_ms'] * (1 + max_regression):
+            problems.append(f"{kind}: p95 {before['p95_ms']} ms -> {current['p95_ms']} ms")
+        if current['error_rate'] > before.get('error_rate', 0) + 0.01:
+            problems.append(f"{kind}: error rate {before.get('error_rate', 0)} -> {current['error_rate']}")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load-test the AHMA backend against local fake upstreams")
+    ap.add_argument('--rps', type=float, default=10, help='Target requests per second')
+    ap.add_argument('--duration', type=float, default=20, help='Seconds of load')
+    ap.add_argument('--mix', default=DEFAULT_MIX, help=f'Weighted request mix (default {DEFAULT_MIX})')
+    ap.add_argument('--concurrency', type=int, default=64, help='Max in-flight requests')
+    ap.add_argument('--seed', type=int, default=1234, help='Seed for the request plan')
+    ap.add_argument('--bedrock-latency-ms', type=float, default=200)
+    ap.add_argument('--todoist-latency-ms', type=float, default=50)
+    ap.add_argument('--calendar-latency-ms', type=float, default=80)
+    ap.add_argument('--backend-url', help='Use an already running backend instead of booting one')
+    ap.add_argument('--backend-log', help='Keep the booted backend\'s output in this file')
+    ap.add_argument('--out', help='Write the JSON report here')
+    ap.add_argument('--baseline', help='Previous JSON report to compare against')
+    ap.add_argument('--max-regression', type=float, default=0.2,
+                    help='Allowed relative p95 increase vs. baseline (default 0.2)')
+    args = ap.parse_args()
+
+    mix = parse_mix(args.mix)
+    fake = None
+    backend = None
+    workdir = tempfile.mkdtemp(prefix='ahma-load-')
+    try:
+        base_url = args.backend_url
+        if not base_url:
+            fake = FakeUpstreams(latency_ms={
+                'bedrock': args.bedrock_latency_ms,
+                'todoist': args.todoist_latency_ms,
+                'calendar': args.calendar_latency_ms,
+            }).start()
+            env = dict(os.environ)
+            env.update(fake.env_for_backend())
+            env.update({
+                'PDF_UPLOAD_FOLDER': os.path.join(workdir, 'pdf_uploads'),
+                'PDF_PROCESSED_FOLDER': os.path.join(workdir, 'pdf_processed'),
+                'MED_IMAGES_FOLDER': os.path.join(workdir, 'med_images'),
+                # Measure the service, not the per-caller budget
+                'RATE_LIMIT_CHAT': '1000000/1',
+                'RATE_LIMIT_MEDICINE_IMAGE': '1000000/1',
+                'RATE_LIMIT_TRANSCRIPT': '1000000/1',
+            })
+            log_path = args.backend_log or os.path.join(workdir, 'backend.log')
+            backend = BackendServer(env, _free_port(), log_path).start()
+            base_url = backend.url
+
+        plan = build_plan(mix, args.rps, args.duration, args.seed)
+        seed_pdfs(base_url, plan)
+
+        results, elapsed = run_load(base_url, plan, args.rps, args.seed, args.concurrency)
+        report = summarize(results, elapsed)
+        report['config'] = {
+            'rps': args.rps, 'duration': args.duration, 'mix': mix, 'seed': args.seed,
+            'concurrency': args.concurrency,
+            'upstream_latency_ms': {
+                'bedrock': args.bedrock_latency_ms,
+                'todoist': args.todoist_latency_ms,
+                'calendar': args.calendar_latency_ms,
+            },
+        }
+        if fake:
+            report['upstream_requests'] = dict(fake.counts)
+    finally:
+        if backend:
+            backend.stop()
+        if fake:
+            fake.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare_to_baseline(report, json.load(f), args.max_regression)
+        if problems:
+            print("\n❌ Regressions vs. baseline:", file=sys.stderr)
+            for p in problems:
+                print(f"  - {p}", file=sys.stderr)
+            sys.exit(2)
+        print("\n✅ No regressions vs. baseline", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Lightweight span tracing for AHMA.
+
+Spans follow a request from the Flask route through the router agent, the
+sub-agent tools and the leaf tools down to their HTTP calls and PDF pipeline
+subprocesses. The current span lives in a contextvar; thread pools and threads
+inherit it once install_thread_propagation() has run, and subprocesses receive
+it through the TRACEPARENT environment variable (W3C traceparent format).
+
+Export is configured with TRACE_EXPORT:
+    jsonl:<path>   append one JSON span per line (default path: traces.jsonl)
+    otlp:<url>     POST batches as OTLP/JSON to a collector or stand-in
+Unset, tracing is off and span() is a no-op unless a listener is registered.
+
+Waterfall view of recorded traces:
+    python tracing.py waterfall traces.jsonl --slowest 3
+    python tracing.py waterfall traces.jsonl --trace-id <id>
+"""
+
+import argparse
+import atexit
+import contextvars
+import json
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes",
+                 "start", "end", "status", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.end = None
+        self.status = "ok"
+        self.error = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        return round(((self.end or time.time()) - self.start) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+        }
+
+
+class _NoopSpan:
+    trace_id = span_id = parent_id = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+# (trace_id, span_id) of the active span
+_current: contextvars.ContextVar = contextvars.ContextVar("ahma_trace_context", default=None)
+
+
+# ----------------------------------------------------------------------------
+# Exporters
+# ----------------------------------------------------------------------------
+
+class JsonlExporter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        lines = "".join(json.dumps(s, default=str) + "\n" for s in spans)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+class OtlpJsonExporter:
+    """Minimal OTLP/HTTP JSON exporter; good enough for a local collector or stand-in."""
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        import urllib.request
+
+        otlp_spans = [{
+            "traceId": s["trace_id"],
+            "spanId": s["span_id"],
+            "parentSpanId": s["parent_id"] or "",
+            "name": s["name"],
+            "startTimeUnixNano": int(s["start"] * 1e9),
+            "endTimeUnixNano": int(s["end"] * 1e9),
+            "status": {"code": 2 if s["status"] == "error" else 1, "message": s["error"] or ""},
+            "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in s["attributes"].items()],
+        } for s in spans]
+        body = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "ahma"}}]},
+            "scopeSpans": [{"scope": {"name": "ahma.tracing"}, "spans": otlp_spans}],
+        }]}).encode("utf-8")
+        req = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        urllib.request.urlopen(req, timeout=5).read()
+
+
+class _BackgroundExport:
+    """Finished spans are queued and exported off the request path."""
+
+    def __init__(self, exporter, batch_size: int = 64, interval: float = 1.0):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=10000)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, span: Dict[str, Any]) -> None:
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self) -> None:
+        batch = self._drain()
+        while batch:
+            try:
+                self.exporter.export(batch)
+            except Exception as e:
+                print(f"⚠️ Trace export failed: {e}", file=sys.stderr)
+                return
+            batch = self._drain()
+
+
+_export: Optional[_BackgroundExport] = None
+_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+
+def configure(spec: Optional[str] = None) -> None:
+    """Set up export from a spec ("jsonl:<path>" / "otlp:<url>") or TRACE_EXPORT."""
+    global _export
+    spec = spec if spec is not None else os.getenv("TRACE_EXPORT", "")
+    if not spec:
+        _export = None
+        return
+    kind, _, target = spec.partition(":")
+    if kind == "jsonl":
+        exporter = JsonlExporter(target or "traces.jsonl")
+    elif kind == "otlp":
+        exporter = OtlpJsonExporter(target or "http://localhost:4318/v1/traces")
+    else:
+        raise ValueError(f"Unknown TRACE_EXPORT '{spec}'")
+    _export = _BackgroundExport(exporter)
+    install_thread_propagation()
+
+
+def add_span_listener(listener: Callable[[Dict[str, Any]], None]) -> None:
+    """Call listener(span_dict) for every finished span (e.g. to feed metrics)."""
+    _listeners.append(listener)
+    install_thread_propagation()
+
+
+def enabled() -> bool:
+    return _export is not None or bool(_listeners)
+
+
+def flush() -> None:
+    if _export is not None:
+        _export.flush()
+
+
+def _finish(span: Span) -> None:
+    span.end = time.time()
+    record = span.to_dict()
+    if _export is not None:
+        _export.submit(record)
+    for listener in _listeners:
+        try:
+            listener(record)
+        except Exception:
+            pass
+
+
+# ----------------------------------------------------------------------------
+# Span API
+# ----------------------------------------------------------------------------
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record a child span of the current one (or start a new trace)."""
+    if not enabled():
+        yield _NOOP
+        return
+
+    parent = _current.get()
+    trace_id = parent[0] if parent else secrets.token_hex(16)
+    s = Span(name, trace_id, parent[1] if parent else None, attributes)
+    token = _current.set((trace_id, s.span_id))
+    try:
+        yield s
+    except BaseException as e:
+        s.status = "error"
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        _finish(s)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator form of span(); the span is named after the function by default."""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_trace_id() -> Optional[str]:
+    ctx = _current.get()
+    return ctx[0] if ctx else None
+
+
+# ----------------------------------------------------------------------------
+# Propagation
+# ----------------------------------------------------------------------------
+
+def traceparent() -> Optional[str]:
+    ctx = _current.get()
+    if not ctx:
+        return None
+    return f"00-{ctx[0]}-{ctx[1]}-01"
+
+
+def subprocess_env(env: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Environment for a child process carrying the current span as TRACEPARENT."""
+    env = dict(os.environ if env is None else env)
+    tp = traceparent()
+    if tp:
+        env["TRACEPARENT"] = tp
+    return env
+
+
+def _adopt_traceparent() -> None:
+    """Continue the parent process' trace when started with TRACEPARENT."""
+    tp = os.getenv("TRACEPARENT", "")
+    parts = tp.split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        _current.set((parts[1], parts[2]))
+
+
+_propagation_installed = False
+
+
+def install_thread_propagation() -> None:
+    """
+    Make threads and ThreadPoolExecutor tasks inherit the submitting context.
+    Agent frameworks run tools on their own pools, so without this spans
+    created inside tools would start new traces.
+    """
+    global _propagation_installed
+    if _propagation_installed:
+        return
+    _propagation_installed = True
+
+    original_submit = ThreadPoolExecutor.submit
+
+    @wraps(original_submit)
+    def submit(self, fn, /, *args, **kwargs):
+        return original_submit(self, contextvars.copy_context().run, fn, *args, **kwargs)
+
+    ThreadPoolExecutor.submit = submit
+
+    original_start = threading.Thread.start
+    original_run = threading.Thread.run
+
+    @wraps(original_start)
+    def start(self):
+        self._ahma_trace_ctx = contextvars.copy_context()
+        return original_start(self)
+
+    @wraps(original_run)
+    def run(self):
+        ctx = getattr(self, "_ahma_trace_ctx", None)
+        if ctx is None:
+            return original_run(self)
+        return ctx.run(original_run, self)
+
+    threading.Thread.start = start
+    threading.Thread.run = run
+
+
+# ----------------------------------------------------------------------------
+# Flask
+# ----------------------------------------------------------------------------
+
+def instrument_flask(app) -> None:
+    """Open a root span per request, named after the matched route."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_span():
+        if not enabled():
+            return
+        cm = span(f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+                  **{"http.method": request.method, "http.target": request.path})
+        g._trace_cm = cm
+        g._trace_span = cm.__enter__()
+
+    @app.after_request
+    def _tag_response(response):
+        s = getattr(g, "_trace_span", None)
+        if s is not None and s is not _NOOP:
+            s.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                s.status = "error"
+            response.headers["X-Trace-Id"] = s.trace_id
+        return response
+
+    @app.teardown_request
+    def _end_request_span(exc):
+        cm = g.pop("_trace_cm", None)
+        g.pop("_trace_span", None)
+        if cm is not None:
+            if exc is not None:
+                cm.__exit__(type(exc), exc, exc.__traceback__)
+            else:
+                cm.__exit__(None, None, None)
+
+
+# ----------------------------------------------------------------------------
+# Waterfall view
+# ----------------------------------------------------------------------------
+
+def load_spans(path: str) -> List[Dict[str, Any]]:
+    spans = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+    return spans
+
+
+def render_waterfall(spans: List[Dict[str, Any]], width: int = 50) -> str:
+    """ASCII waterfall for the spans of a single trace."""
+    if not spans:
+        return "(no spans)"
+    t0 = min(s["start"] for s in spans)
+    total = max(s["end"] for s in spans) - t0 or 1e-9
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    ids = {s["span_id"] for s in spans}
+    for s in spans:
+        parent = s["parent_id"] if s["parent_id"] in ids else None
+        children.setdefault(parent, []).append(s)
+
+    lines = [f"trace {spans[0]['trace_id']}  total {total * 1000:.1f} ms"]
+
+    def walk(parent, depth):
+        for s in sorted(children.get(parent, []), key=lambda x: x["start"]):
+            offset = int((s["start"] - t0) / total * width)
+            length = max(1, int((s["end"] - s["start"]) / total * width))
+            bar = " " * offset + "█" * length
+            label = ("  " * depth + s["name"])[:45]
+            flag = " !" if s["status"] == "error" else ""
+            lines.append(f"{label:<45} {bar:<{width + 1}} {s['duration_ms']:>10.1f} ms{flag}")
+            walk(s["span_id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect AHMA traces")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    wf = sub.add_parser("waterfall", help="Print a waterfall of recorded traces")
+    wf.add_argument("path", help="JSONL file written by TRACE_EXPORT=jsonl:<path>")
+    wf.add_argument("--trace-id", help="Trace to show")
+    wf.add_argument("--slowest", type=int, default=1, help="Show the N slowest traces (default 1)")
+    args = ap.parse_args()
+
+    spans = load_spans(args.path)
+    by_trace: Dict[str, List[Dict[str, Any]]] = {}
+    for s in spans:
+        by_trace.setdefault(s["trace_id"], []).append(s)
+
+    if args.trace_id:
+        trace_ids = [args.trace_id]
+    else:
+        def trace_duration(tid):
+            group = by_trace[tid]
+            return max(s["end"] for s in group) - min(s["start"] for s in group)
+        trace_ids = sorted(by_trace, key=trace_duration, reverse=True)[:args.slowest]
+
+    for tid in trace_ids:
+        print(render_waterfall(by_trace.get(tid, [])))
+        print()
+
+
+_adopt_traceparent()
+configure()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 def create_todo_agent():
     from strands import Agent, tool
     import boto3
-    from .todoist_task import add_task_to_todoist
+    from .todoist_task import add_task_to_todoist, add_tasks_to_todoist
 
     # Bedrock client (credentials already set)
     bedrock = boto3.client(
@@ -27,10 +27,27 @@ def create_todo_agent():
         """
         return add_task_to_todoist(task_name, task_due, priority, labels)
 
+    @tool
+    def create_todoist_tasks(tasks: list) -> str:
+        """
+        Create several Todoist tasks at once, in a single request.
+
+        Args:
+            tasks: List of tasks, each a dict with the same fields as `create_todoist_task`:
+                {"task_name": "...", "task_due": "...", "priority": 1-4, "labels": [...]}
+
+        Returns:
+            One line per task saying whether it was created or why it failed.
+
+        Notes for the model:
+            - Prefer this over calling `create_todoist_task` repeatedly when the user lists several tasks.
+        """
+        return add_tasks_to_todoist(tasks)
+
     # Create the Strands agent
     agent = Agent(
         name="TodoistAgent",
-        tools=[create_todoist_task],
+        tools=[create_todoist_task, create_todoist_tasks],
         system_prompt=(""" You are a task management assistant.
     When the user talks about to-do items, chores, or tasks, create a Todoist task for them."""
         )
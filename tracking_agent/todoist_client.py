@@ -0,0 +1,264 @@
+"""
+Shared Todoist REST client.
+
+One pooled, keep-alive requests.Session per process, used by the Flask backend
+and by the Todoist tools of the agents. Configuration is read from the
+environment (and .env) once, when the client is first requested.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+
+from tracing import span
+
+
+DEFAULT_BASE_URL = "https://api.todoist.com/rest/v2"
+DEFAULT_SYNC_URL = "https://api.todoist.com/sync/v9/sync"
+DEFAULT_TIMEOUT = 20
+
+# The Sync API accepts at most 100 commands per request.
+SYNC_BATCH_SIZE = 100
+
+# Task fields accepted by add_task / add_tasks and passed straight through.
+TASK_FIELDS = ("due_string", "project_id", "priority", "description", "labels", "due_date", "due_datetime")
+
+# Status codes worth retrying. 429 honours the Retry-After header sent by Todoist.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TodoistConfig:
+    def __init__(self, token: Optional[str], base_url: str = DEFAULT_BASE_URL,
+                 sync_url: str = DEFAULT_SYNC_URL,
+                 timeout: float = DEFAULT_TIMEOUT, max_retries: int = 3,
+                 backoff_factor: float = 0.5, pool_size: int = 10):
+        self.token = token
+        self.base_url = base_url.rstrip("/")
+        self.sync_url = sync_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+
+    @classmethod
+    def from_env(cls) -> "TodoistConfig":
+        load_dotenv()
+        return cls(
+            token=os.getenv("TODOIST_API_TOKEN"),
+            base_url=os.getenv("TODOIST_API_URL", DEFAULT_BASE_URL),
+            sync_url=os.getenv("TODOIST_SYNC_URL", DEFAULT_SYNC_URL),
+            timeout=float(os.getenv("TODOIST_TIMEOUT", DEFAULT_TIMEOUT)),
+            max_retries=int(os.getenv("TODOIST_MAX_RETRIES", 3)),
+            backoff_factor=float(os.getenv("TODOIST_BACKOFF", 0.5)),
+            pool_size=int(os.getenv("TODOIST_POOL_SIZE", 10)),
+        )
+
+
+class TodoistClient:
+    """Thin wrapper around a pooled session for the Todoist REST API."""
+
+    def __init__(self, config: TodoistConfig):
+        self.config = config
+        self.session = requests.Session()
+        retry = Retry(
+            total=config.max_retries,
+            backoff_factor=config.backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            # POSTs are safe to retry because every call carries an X-Request-Id
+            allowed_methods=None,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=config.pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if config.token:
+            self.session.headers["Authorization"] = f"Bearer {config.token}"
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._rate_limited = 0
+        self._errors = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.config.token)
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send a request relative to the REST base URL and return the raw response."""
+        url = path if path.startswith("http") else f"{self.config.base_url}/{path.lstrip('/')}"
+        kwargs.setdefault("timeout", self.config.timeout)
+        headers = kwargs.pop("headers", None) or {}
+        headers.setdefault("X-Request-Id", uuid.uuid4().hex)
+
+        start = time.perf_counter()
+        try:
+            with span("todoist.http", **{"http.method": method, "http.url": url}) as http_span:
+                resp = self.session.request(method, url, headers=headers, **kwargs)
+                http_span.set_attribute("http.status_code", resp.status_code)
+        except requests.RequestException:
+            with self._lock:
+                self._requests += 1
+                self._errors += 1
+            _notify(time.perf_counter() - start, "error")
+            raise
+        _notify(time.perf_counter() - start, resp.status_code)
+
+        with self._lock:
+            self._requests += 1
+            if resp.status_code == 429:
+                self._rate_limited += 1
+            elif resp.status_code >= 400:
+                self._errors += 1
+        return resp
+
+    # ------------------------------------------------------------------
+    # Tasks
+    # ------------------------------------------------------------------
+
+    def get_tasks(self, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        resp = self.request("GET", "tasks", params=params)
+        resp.raise_for_status()
+        return resp.json()
+
+    def add_task(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        resp = self.request("POST", "tasks", json=payload)
+        resp.raise_for_status()
+        return resp.json()
+
+    def close_task(self, task_id: str) -> requests.Response:
+        return self.request("POST", f"tasks/{task_id}/close")
+
+    def add_tasks(self, tasks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Create many tasks with Sync API `item_add` commands, up to 100 per request.
+
+        Each task is a REST-style dict ({"content": ..., "due_string": ..., ...}).
+        Returns one result per input, in order:
+            {"temp_id", "content", "success", "id"} or {..., "success": False, "error"}
+        Never raises for a failed Sync request: every task in that chunk gets
+        success False with the request's error, tasks created by earlier chunks
+        keep their results, and the remaining chunks are still sent.
+        """
+        results: List[Dict[str, Any]] = []
+        for start in range(0, len(tasks), SYNC_BATCH_SIZE):
+            chunk = tasks[start:start + SYNC_BATCH_SIZE]
+            commands = [_item_add_command(task) for task in chunk]
+
+            try:
+                resp = self.request("POST", self.config.sync_url,
+                                    data={"commands": json.dumps(commands)})
+                resp.raise_for_status()
+                body = resp.json()
+            except (requests.RequestException, ValueError) as e:
+                error = f"Sync request failed: {e}"
+                results.extend(
+                    {"temp_id": command["temp_id"], "content": task.get("content"),
+                     "success": False, "error": error}
+                    for task, command in zip(chunk, commands)
+                )
+                continue
+            sync_status = body.get("sync_status", {})
+            temp_id_mapping = body.get("temp_id_mapping", {})
+
+            for task, command in zip(chunk, commands):
+                status = sync_status.get(command["uuid"])
+                result = {"temp_id": command["temp_id"], "content": task.get("content")}
+                if status == "ok":
+                    result["success"] = True
+                    result["id"] = temp_id_mapping.get(command["temp_id"])
+                else:
+                    result["success"] = False
+                    result["error"] = status or "No status returned for command"
+                results.append(result)
+        return results
+
+    # ------------------------------------------------------------------
+    # Stats
+    # ------------------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        """Request counters plus connection-pool usage, to verify keep-alive reuse."""
+        connections = 0
+        pooled_requests = 0
+        for adapter in {id(a): a for a in self.session.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                connections += pool.num_connections
+                pooled_requests += pool.num_requests
+
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "rate_limited": self._rate_limited,
+                "errors": self._errors,
+                "connections_opened": connections,
+                "pooled_requests": pooled_requests,
+                "connection_reuse_ratio": (
+                    round(1 - connections / pooled_requests, 3) if pooled_requests else 0.0
+                ),
+            }
+
+
+def _item_add_command(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Translate a REST-style task dict into a Sync API item_add command."""
+    args: Dict[str, Any] = {"content": task["content"]}
+    for key in ("project_id", "priority", "description", "labels"):
+        if task.get(key) is not None:
+            args[key] = task[key]
+
+    due: Dict[str, Any] = {}
+    if task.get("due_string"):
+        due["string"] = task["due_string"]
+    if task.get("due_date"):
+        due["date"] = task["due_date"]
+    if task.get("due_datetime"):
+        due["date"] = task["due_datetime"]
+    if due:
+        args["due"] = due
+
+    return {
+        "type": "item_add",
+        "temp_id": uuid.uuid4().hex,
+        "uuid": uuid.uuid4().hex,
+        "args": args,
+    }
+
+
+_client: Optional[TodoistClient] = None
+_client_lock = threading.Lock()
+_request_listeners: List[Callable[[float, Any], None]] = []
+
+
+def add_request_listener(listener: Callable[[float, Any], None]) -> None:
+    """Call listener(seconds, status_code or "error") after every Todoist HTTP call (e.g. for metrics)."""
+    _request_listeners.append(listener)
+
+
+def _notify(seconds: float, code: Any) -> None:
+    for listener in _request_listeners:
+        try:
+            listener(seconds, code)
+        except Exception:
+            pass
+
+
+def get_todoist_client() -> TodoistClient:
+    """Return the process-wide client, creating it (and reading config) on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TodoistClient(TodoistConfig.from_env())
+    return _client
@@ -1,21 +1,11 @@
 # Function to add a task to Todoist
 def add_task_to_todoist(task_name, task_due=None, priority=None, labels=None):
     import requests
-    import os
-    from dotenv import load_dotenv
-    
-    # Load environment variables
-    load_dotenv()
-    
-    TODOIST_API_TOKEN = os.getenv("TODOIST_API_TOKEN")
-    TODOIST_API_URL = 'https://api.todoist.com/rest/v2/tasks'
-    
-    if not TODOIST_API_TOKEN:
-        return "Error: TODOIST_API_TOKEN not found in environment variables"
+    from .todoist_client import get_todoist_client
 
-    headers = {
-        'Authorization': f'Bearer {TODOIST_API_TOKEN}',
-    }
+    client = get_todoist_client()
+    if not client.configured:
+        return "Error: TODOIST_API_TOKEN not found in environment variables"
 
     data = {
         'content': task_name,
@@ -23,21 +13,67 @@ def add_task_to_todoist(task_name, task_due=None, priority=None, labels=None):
 
     # Include due date if provided
     if task_due:
-        data['due_string'] = task_due  
+        data['due_string'] = task_due
 
     # Include priority if provided
     if priority:
-        data['priority'] = priority 
+        data['priority'] = priority
 
     # Include labels if provided
     if labels:
         data['labels'] = labels
 
-    # Make the API request to Todoist
-    response = requests.post(TODOIST_API_URL, json=data, headers=headers)
+    # Make the API request to Todoist (pooled session, retries on 429/5xx)
+    try:
+        response = client.request("POST", "tasks", json=data)
+    except requests.RequestException as e:
+        return f"Error: {e}"
 
     if response.status_code == 200:
         return f"Task '{task_name}' added successfully!"
     else:
         return f"Error: {response.status_code}, {response.text}"
-    
\ No newline at end of file
+
+
+# Function to add several tasks to Todoist in one Sync API round-trip
+def add_tasks_to_todoist(tasks):
+    from .todoist_client import get_todoist_client
+
+    client = get_todoist_client()
+    if not client.configured:
+        return "Error: TODOIST_API_TOKEN not found in environment variables"
+    if not tasks:
+        return "Error: no tasks provided"
+
+    # Accept the same argument names as add_task_to_todoist
+    payloads = []
+    skipped = []
+    for index, task in enumerate(tasks, start=1):
+        if isinstance(task, str):
+            task = {'task_name': task}
+        content = task.get('task_name') or task.get('content') if isinstance(task, dict) else None
+        if not content:
+            skipped.append(f"Skipped task {index}: no task_name or content ({task!r})")
+            continue
+        data = {'content': content}
+        if task.get('task_due') or task.get('due_string'):
+            data['due_string'] = task.get('task_due') or task.get('due_string')
+        if task.get('priority'):
+            data['priority'] = task['priority']
+        if task.get('labels'):
+            data['labels'] = task['labels']
+        payloads.append(data)
+
+    if not payloads:
+        return "Error: no valid tasks to add\n" + "\n".join(skipped)
+
+    # Failed Sync requests come back as per-task errors, so tasks already created are still reported
+    results = client.add_tasks(payloads)
+
+    lines = list(skipped)
+    for result in results:
+        if result['success']:
+            lines.append(f"Task '{result['content']}' added successfully!")
+        else:
+            lines.append(f"Error adding '{result['content']}': {result['error']}")
+    return "\n".join(lines)